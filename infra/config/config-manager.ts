@@ -53,6 +53,19 @@ const envSchema = z.object({
     NOTIFICATIONS: z.object({
         EMAILS: z.array(z.string().email()),
     }),
+    OBSERVABILITY: z.object({
+        LANGFUSE_SAMPLE_RATE: z.number().min(0).max(1),
+    }).optional(),
+    KB_SYNC: z.object({
+        COALESCE_WINDOW_SECONDS: z.number().int().min(1).max(300),
+    }).optional(),
+    LEADS: z.object({
+        WRITE_MODE: z.enum(['sync', 'queue']),
+    }).optional(),
+    ANSWER_CACHE: z.object({
+        ENABLED: z.boolean(),
+        TTL_SECONDS: z.number().int().positive(),
+    }).optional(),
 });
 
 export type EnvConfig = z.infer<typeof envSchema>;
@@ -86,6 +99,11 @@ export interface AppSettings {
     readonly groundingThreshold: number;
     readonly relevanceThreshold: number;
     readonly allowedIps: string[];
+    readonly langfuseSampleRate: number;
+    readonly kbSyncCoalesceWindow?: number;
+    readonly leadWriteMode: 'sync' | 'queue';
+    readonly answerCacheEnabled: boolean;
+    readonly answerCacheTtl: number;
 }
 
 /**
@@ -163,6 +181,11 @@ export function createConfig(contextEnv?: string): AppSettings {
         groundingThreshold: env.AGENT.GUARDRAILS.GROUNDING_THRESHOLD,
         relevanceThreshold: env.AGENT.GUARDRAILS.RELEVANCE_THRESHOLD,
         allowedIps: env.SECURITY.ALLOWED_IPS,
+        langfuseSampleRate: env.OBSERVABILITY?.LANGFUSE_SAMPLE_RATE ?? 1,
+        kbSyncCoalesceWindow: env.KB_SYNC?.COALESCE_WINDOW_SECONDS,
+        leadWriteMode: env.LEADS?.WRITE_MODE ?? 'sync',
+        answerCacheEnabled: env.ANSWER_CACHE?.ENABLED ?? false,
+        answerCacheTtl: env.ANSWER_CACHE?.TTL_SECONDS ?? 3600,
     };
 
     Object.freeze(settings);
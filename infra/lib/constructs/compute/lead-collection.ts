@@ -3,7 +3,9 @@ import { bedrock } from '@cdklabs/generative-ai-cdk-constructs';
 import * as cdk from 'aws-cdk-lib';
 import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
 import * as lambda from 'aws-cdk-lib/aws-lambda';
+import { SqsEventSource } from 'aws-cdk-lib/aws-lambda-event-sources';
 import * as s3_assets from 'aws-cdk-lib/aws-s3-assets';
+import * as sqs from 'aws-cdk-lib/aws-sqs';
 import { Construct } from 'constructs';
 import * as path from 'path';
 import { AppSettings } from '../../../config/config-manager';
@@ -73,6 +75,56 @@ export class LeadCollectionConstruct extends Construct {
 
         // Grants the Lambda alias permission to write data to the leads table
         leadsTable.grantReadWriteData(leadFunction);
+
+        if (config.leadWriteMode === 'queue') {
+            this.configureLeadQueue(leadFunction, leadsTable, props);
+        }
+    }
+
+    /**
+     * Queue mode: the action group enqueues leads and returns to the agent immediately,
+     * a second handler in the same package drains the queue with batch writes.
+     */
+    private configureLeadQueue(leadFunction: PythonFunction, leadsTable: dynamodb.ITable, props: LeadCollectionConstructProps): void {
+        const { config } = props;
+
+        const deadLetterQueue = new sqs.Queue(this, 'LeadDeadLetterQueue', {
+            retentionPeriod: cdk.Duration.days(14),
+            encryption: sqs.QueueEncryption.SQS_MANAGED,
+        });
+
+        const queue = new sqs.Queue(this, 'LeadWriteQueue', {
+            visibilityTimeout: cdk.Duration.seconds(180),
+            encryption: sqs.QueueEncryption.SQS_MANAGED,
+            deadLetterQueue: { queue: deadLetterQueue, maxReceiveCount: 5 },
+        });
+
+        const flushFunction = new PythonFunction(this, 'LeadFlushFunction', {
+            entry: path.join(__dirname, '../../../../src/lambda/lead-collector'),
+            runtime: config.lambdaRuntime,
+            architecture: lambda.Architecture.X86_64,
+            index: 'index.py',
+            handler: 'flush_handler',
+            timeout: cdk.Duration.seconds(60),
+            tracing: lambda.Tracing.ACTIVE,
+            environment: {
+                LEADS_TABLE_NAME: props.leadTableName,
+                STAGE: config.stage,
+                LOG_LEVEL: config.stage === 'prod' ? 'INFO' : 'DEBUG',
+            },
+        });
+
+        // Up to 25 leads (one BatchWriteItem call) per invocation; only failed messages are redelivered
+        flushFunction.addEventSource(new SqsEventSource(queue, {
+            batchSize: 25,
+            maxBatchingWindow: cdk.Duration.seconds(10),
+            reportBatchItemFailures: true,
+        }));
+
+        leadFunction.addEnvironment('LEAD_WRITE_MODE', 'queue');
+        leadFunction.addEnvironment('LEAD_QUEUE_URL', queue.queueUrl);
+        queue.grantSendMessages(leadFunction);
+        leadsTable.grantReadWriteData(flushFunction);
     }
 
 }
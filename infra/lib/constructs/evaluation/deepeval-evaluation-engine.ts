@@ -45,8 +45,11 @@ export class DeepEvalEvaluationEngine extends Construct {
         });
 
         // Adds the evaluation container using logic from the deepeval_evaluator directory
+        // (built from src/ so the code shared with the Lambdas in src/shared is included)
         this.taskDefinition.addContainer('DeepEvalContainer', {
-            image: ecs.ContainerImage.fromAsset(path.join(__dirname, '../../../../src/jobs/evaluation/deepeval_evaluator'), {
+            image: ecs.ContainerImage.fromAsset(path.join(__dirname, '../../../../src'), {
+                file: 'jobs/evaluation/deepeval_evaluator/Dockerfile',
+                exclude: ['**/__pycache__', '**/.deepeval'],
                 platform: ecr_assets.Platform.LINUX_AMD64,
             }),
             logging: ecs.LogDrivers.awsLogs({
@@ -101,5 +104,15 @@ export class DeepEvalEvaluationEngine extends Construct {
         props.agentAlias.grantInvoke(role);
         props.resultsBucket.grantReadWrite(role);
 
+        // Read-only lookups used to fingerprint the agent response cache (alias version + KB ingestion)
+        role.addToPrincipalPolicy(new iam.PolicyStatement({
+            actions: ['bedrock:GetAgentAlias', 'bedrock:ListAgentKnowledgeBases'],
+            resources: [props.agent.agentArn, props.agentAlias.aliasArn],
+        }));
+        role.addToPrincipalPolicy(new iam.PolicyStatement({
+            actions: ['bedrock:ListDataSources', 'bedrock:ListIngestionJobs'],
+            resources: [`arn:aws:bedrock:${config.region}:${stack.account}:knowledge-base/*`],
+        }));
+
     }
 }
\ No newline at end of file
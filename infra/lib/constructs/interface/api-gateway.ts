@@ -1,4 +1,4 @@
-import { PythonFunction } from '@aws-cdk/aws-lambda-python-alpha';
+import { PythonFunction, PythonLayerVersion } from '@aws-cdk/aws-lambda-python-alpha';
 import { bedrock } from '@cdklabs/generative-ai-cdk-constructs';
 import * as cdk from 'aws-cdk-lib';
 import * as apigateway from 'aws-cdk-lib/aws-apigateway';
@@ -9,6 +9,7 @@ import * as logs from 'aws-cdk-lib/aws-logs';
 import * as s3 from 'aws-cdk-lib/aws-s3';
 import * as secretsmanager from 'aws-cdk-lib/aws-secretsmanager';
 import { Construct } from 'constructs';
+import * as fs from 'fs';
 import * as path from 'path';
 import { AppSettings } from '../../../config/config-manager';
 
@@ -40,6 +41,27 @@ export class ApiGatewayConstruct extends Construct {
         this.apiKey = this.configureApiKeyAndUsagePlan(props.config);
     }
 
+    /**
+     * Extracts the local pre-filter rules from the guardrail definition so the Lambda can
+     * reject obvious off-topic or adversarial prompts without invoking the agent.
+     * Only the fields PreFilter.from_guardrail reads are passed: Lambda caps all environment
+     * variables at 4 KB combined, so the prose description stays in the guardrail file.
+     */
+    private loadPreFilterConfig(): string {
+        const guardrailPath = path.join(__dirname, '../../../../assets/guardrails/default-guardrail.json');
+        const guardrailConfig = JSON.parse(fs.readFileSync(guardrailPath, 'utf8'));
+        const preFilterConfig = guardrailConfig.preFilterConfig ?? {};
+        return JSON.stringify({
+            blockedInputMessaging: guardrailConfig.blockedInputMessaging,
+            preFilterConfig: {
+                deniedTopics: (preFilterConfig.deniedTopics ?? []).map(
+                    (topic: { name: string; patterns?: string[] }) => ({ name: topic.name, patterns: topic.patterns ?? [] }),
+                ),
+                blockedWords: preFilterConfig.blockedWords ?? [],
+            },
+        });
+    }
+
     /**
      * Creates the Lambda function that interacts with Bedrock Agent.
      * Uses IAM least privilege for execution.
@@ -47,8 +69,16 @@ export class ApiGatewayConstruct extends Construct {
     private createAgentInvokerFunction(props: ApiGatewayConstructProps): lambda.IAlias {
         const { config } = props;
 
+        // Code shared with the evaluation job (agent/KB fingerprint used by the answer cache)
+        const sharedLayer = new PythonLayerVersion(this, 'SharedCodeLayer', {
+            entry: path.join(__dirname, '../../../../src/shared'),
+            compatibleRuntimes: [config.lambdaRuntime],
+            description: 'Helpers shared by the agent-invoker and the evaluation job',
+        });
+
         const fn = new PythonFunction(this, 'ApiHandler', {
             entry: path.join(__dirname, '../../../../src/lambda/agent-invoker'),
+            layers: [sharedLayer],
             runtime: config.lambdaRuntime,
             architecture: lambda.Architecture.X86_64,
             index: 'index.py',
@@ -59,11 +89,14 @@ export class ApiGatewayConstruct extends Construct {
                 AGENT_ID: props.agent.agentId,
                 AGENT_ALIAS_ID: props.agentAlias.aliasId,
                 LANGFUSE_SECRET_NAME: 'langfuse-api-key',
+                TRACE_SAMPLE_RATE: config.langfuseSampleRate.toString(),
+                LANGFUSE_FLUSH_MODE: 'background',
                 AGENT_MODEL_ID: config.agentModel,
                 PROMPT_MIN_LENGTH: config.promptMinLength.toString(),
                 PROMPT_MAX_LENGTH: config.promptMaxLength.toString(),
                 STAGE: config.stage,
                 LOG_LEVEL: config.stage === 'prod' ? 'INFO' : 'DEBUG',
+                PRE_FILTER_CONFIG: this.loadPreFilterConfig(),
             },
         });
 
@@ -83,9 +116,46 @@ export class ApiGatewayConstruct extends Construct {
             resources: [props.agentAlias.aliasArn],
         }));
 
+        if (config.answerCacheEnabled) {
+            this.configureAnswerCache(fn, alias, props);
+        }
+
         return alias;
     }
 
+    /**
+     * Opt-in answer cache for repeated FAQ prompts: a shared DynamoDB tier with item TTL,
+     * plus read-only lookups of the alias version and KB ingestion jobs used to invalidate it.
+     */
+    private configureAnswerCache(fn: PythonFunction, alias: lambda.Alias, props: ApiGatewayConstructProps): void {
+        const { config } = props;
+
+        // Cached answers are disposable, so the table is always destroyed with the stack
+        const table = new dynamodb.Table(this, 'AnswerCacheTable', {
+            partitionKey: { name: 'cache_key', type: dynamodb.AttributeType.STRING },
+            billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+            timeToLiveAttribute: 'expires_at',
+            removalPolicy: cdk.RemovalPolicy.DESTROY,
+            encryption: dynamodb.TableEncryption.AWS_MANAGED,
+        });
+        table.grantReadWriteData(fn);
+
+        fn.addEnvironment('ANSWER_CACHE_ENABLED', 'true');
+        fn.addEnvironment('ANSWER_CACHE_TABLE', table.tableName);
+        fn.addEnvironment('ANSWER_CACHE_TTL', config.answerCacheTtl.toString());
+
+        alias.addToRolePolicy(new iam.PolicyStatement({
+            sid: 'AllowAnswerCacheVersionLookup',
+            actions: ['bedrock:GetAgentAlias', 'bedrock:ListAgentKnowledgeBases'],
+            resources: [props.agent.agentArn, props.agentAlias.aliasArn],
+        }));
+        alias.addToRolePolicy(new iam.PolicyStatement({
+            sid: 'AllowAnswerCacheIngestionLookup',
+            actions: ['bedrock:ListDataSources', 'bedrock:ListIngestionJobs'],
+            resources: [`arn:aws:bedrock:${config.region}:${config.account}:knowledge-base/*`],
+        }));
+    }
+
     /**
      * Provisions a REST API. 
      */
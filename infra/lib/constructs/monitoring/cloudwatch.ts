@@ -146,6 +146,38 @@ export class CloudWatchMonitoring extends Construct {
                 fullPrecision: true
             })
         );
+
+        // Row 4: Agent invocation latency breakdown (EMF metrics from the agent invoker)
+        const invokerMetric = (metricName: string, statistic: string, label: string) => new cloudwatch.Metric({
+            namespace: 'LeadGenBot',
+            metricName,
+            dimensionsMap: { service: 'AgentPerformance' },
+            statistic,
+            label,
+            period: cdk.Duration.minutes(5),
+        });
+
+        this.dashboard.addWidgets(
+            new cloudwatch.GraphWidget({
+                title: 'Agent Time to First Chunk / Stream Duration',
+                left: [
+                    invokerMetric('TimeToFirstChunk', 'p50', 'TTFC (P50)'),
+                    invokerMetric('TimeToFirstChunk', 'p99', 'TTFC (P99)'),
+                    invokerMetric('StreamDuration', 'p50', 'Stream (P50)'),
+                    invokerMetric('StreamDuration', 'p99', 'Stream (P99)'),
+                ],
+                width: 12,
+            }),
+            new cloudwatch.GraphWidget({
+                title: 'Agent Retries and Langfuse Flush Time',
+                left: [invokerMetric('InvocationAttempts', 'Average', 'Attempts (Avg)')],
+                right: [
+                    invokerMetric('LangfuseFlushTime', 'p99', 'Flush on response path (P99)'),
+                    invokerMetric('LangfuseBackgroundFlushTime', 'p99', 'Background flush (P99)'),
+                ],
+                width: 12,
+            })
+        );
     }
 
     private createSessionMetrics(agentInvokerFunction: lambda.IFunction) {
@@ -4,8 +4,10 @@ import * as cdk from 'aws-cdk-lib';
 import { FoundationModelIdentifier } from 'aws-cdk-lib/aws-bedrock';
 import * as iam from 'aws-cdk-lib/aws-iam';
 import * as lambda from 'aws-cdk-lib/aws-lambda';
+import { SqsEventSource } from 'aws-cdk-lib/aws-lambda-event-sources';
 import * as s3 from 'aws-cdk-lib/aws-s3';
 import * as s3n from 'aws-cdk-lib/aws-s3-notifications';
+import * as sqs from 'aws-cdk-lib/aws-sqs';
 import * as ssm from 'aws-cdk-lib/aws-ssm';
 import { Construct } from 'constructs';
 import * as path from 'path';
@@ -79,6 +81,8 @@ export class KnowledgeBaseConstruct extends Construct {
     /**
      * Sets up the automatic synchronization mechanism by creating a Lambda function 
      * triggered by S3 events (upload/delete) to start Knowledge Base ingestion jobs.
+     * With KB_SYNC.COALESCE_WINDOW_SECONDS set, events are buffered in SQS so a bulk
+     * upload costs one ingestion instead of one per object.
      * 
      * @param bucket The S3 bucket acting as the data source
      * @param dataSourceId The ID of the Bedrock Knowledge Base data source
@@ -93,7 +97,7 @@ export class KnowledgeBaseConstruct extends Construct {
             architecture: lambda.Architecture.X86_64,
             index: 'index.py',
             handler: 'handler',
-            timeout: cdk.Duration.minutes(10),
+            timeout: cdk.Duration.minutes(config.kbSyncCoalesceWindow !== undefined ? 2 : 10),
             tracing: lambda.Tracing.ACTIVE,
             environment: {
                 KNOWLEDGE_BASE_ID: this.knowledgeBase.knowledgeBaseId,
@@ -112,7 +116,12 @@ export class KnowledgeBaseConstruct extends Construct {
         });
 
         // Grants permission to start ingestion jobs on the Knowledge Base
-        this.knowledgeBase.grant(syncFunction, 'bedrock:StartIngestionJob', 'bedrock:AssociateThirdPartyKnowledgeBase');
+        this.knowledgeBase.grant(syncFunction, 'bedrock:StartIngestionJob', 'bedrock:ListIngestionJobs', 'bedrock:AssociateThirdPartyKnowledgeBase');
+
+        if (config.kbSyncCoalesceWindow !== undefined) {
+            this.setupCoalescedSync(bucket, syncFunction, syncAlias, config.kbSyncCoalesceWindow);
+            return;
+        }
 
         // Configures S3 event notifications to trigger the Sync Lambda alias
         bucket.addEventNotification(
@@ -124,5 +133,39 @@ export class KnowledgeBaseConstruct extends Construct {
             new s3n.LambdaDestination(syncAlias)
         );
     }
-}
 
+    /**
+     * Routes S3 events through a queue: the sync Lambda receives them in windowed batches,
+     * starts at most one ingestion per batch and, while a job is running, re-queues the batch
+     * as one delayed summary message.
+     */
+    private setupCoalescedSync(bucket: s3.IBucket, syncFunction: PythonFunction, syncAlias: lambda.Alias, windowSeconds: number) {
+        const deadLetterQueue = new sqs.Queue(this, 'SyncDeadLetterQueue', {
+            retentionPeriod: cdk.Duration.days(14),
+            encryption: sqs.QueueEncryption.SQS_MANAGED,
+        });
+
+        // Deferrals are re-sent rather than redelivered, so receives only count real failures;
+        // messages that land in the DLQ can be moved back with `aws sqs start-message-move-task`
+        const queue = new sqs.Queue(this, 'SyncQueue', {
+            visibilityTimeout: cdk.Duration.minutes(3),
+            encryption: sqs.QueueEncryption.SQS_MANAGED,
+            deadLetterQueue: { queue: deadLetterQueue, maxReceiveCount: 5 },
+        });
+        queue.grantSendMessages(syncFunction);
+        syncFunction.addEnvironment('SYNC_QUEUE_URL', queue.queueUrl);
+        syncFunction.addEnvironment('SYNC_DEFER_SECONDS', '180');
+
+        bucket.addEventNotification(s3.EventType.OBJECT_CREATED, new s3n.SqsDestination(queue));
+        bucket.addEventNotification(s3.EventType.OBJECT_REMOVED, new s3n.SqsDestination(queue));
+
+        // maxConcurrency (minimum 2) caps pollers without the throttling a reserved concurrency of 1
+        // causes; a second batch racing a start gets ConflictException and is deferred
+        syncAlias.addEventSource(new SqsEventSource(queue, {
+            batchSize: 1000,
+            maxBatchingWindow: cdk.Duration.seconds(windowSeconds),
+            maxConcurrency: 2,
+            reportBatchItemFailures: true,
+        }));
+    }
+}
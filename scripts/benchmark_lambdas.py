@@ -0,0 +1,437 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import gc
+import base64
+import struct
+import zlib
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+LAMBDA_DIR = BASE_DIR / "src" / "lambda"
+# Deployed as a Lambda layer; on the import path alongside every handler
+SHARED_DIR = BASE_DIR / "src" / "shared"
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "lambda_benchmark_baseline.json"
+IMPORT_MARKER = "--- benchmark: handler import ---"
+
+# Metrics compared against the baseline
+TRACKED_METRICS = ("import_ms", "first_invoke_ms", "cold_start_ms", "full_gc_ms", "warm_p50_ms", "warm_p95_ms")
+
+# Per-handler environment and a representative event
+HANDLERS = {
+    "agent-invoker": {
+        "env": {
+            "AGENT_ID": "BENCHAGENT",
+            "AGENT_ALIAS_ID": "BENCHALIAS",
+            "ALLOWED_ORIGINS": "https://example.com",
+            "LANGFUSE_SECRET_NAME": "bench/langfuse",
+        },
+        "event": {
+            "body": json.dumps({"prompt": "What courses do you offer?"}),
+            "headers": {"origin": "https://example.com"},
+            "requestContext": {"requestId": "benchmark"},
+        },
+    },
+    "health-check": {
+        "env": {
+            "LEADS_TABLE_NAME": "bench-leads",
+            "KB_BUCKET_NAME": "bench-kb",
+            "AGENT_ID": "BENCHAGENT",
+        },
+        "event": {"httpMethod": "GET", "path": "/health"},
+    },
+    "kb-sync": {
+        "env": {
+            "KNOWLEDGE_BASE_ID": "BENCHKB",
+            "DATA_SOURCE_ID": "BENCHDS",
+        },
+        "event": {"Records": [{"eventSource": "aws:s3", "s3": {"object": {"key": "data/faq.md"}}}]},
+    },
+    "lead-collector": {
+        "env": {"LEADS_TABLE_NAME": "bench-leads"},
+        "event": {
+            "actionGroup": "LeadCollector",
+            "apiPath": "/leads",
+            "httpMethod": "POST",
+            "sessionId": "benchmark-session",
+            "requestBody": {"content": {"application/json": {"properties": [
+                {"name": "email", "value": "bench@example.com"},
+                {"name": "reason", "value": "Course information"},
+            ]}}},
+        },
+    },
+}
+
+
+# Offline AWS endpoint stub
+
+def encode_event(event_type: str, payload: dict, message_type: str = "event") -> bytes:
+    """
+    Encode a single AWS event stream message (used for invoke_agent completions).
+
+    Args:
+        event_type (str): The ":event-type" header value, e.g. "chunk", or the exception type for exceptions.
+        payload (dict): The JSON payload of the event.
+        message_type (str): "event", or "exception" for an in-stream error botocore raises as EventStreamError.
+
+    Returns:
+        bytes: The binary message including prelude and CRCs.
+    """
+    type_header = ":exception-type" if message_type == "exception" else ":event-type"
+    headers = b""
+    for name, value in ((type_header, event_type), (":message-type", message_type), (":content-type", "application/json")):
+        headers += bytes([len(name)]) + name.encode() + b"\x07" + struct.pack(">H", len(value)) + value.encode()
+    body = json.dumps(payload).encode()
+    total = 12 + len(headers) + len(body) + 4
+    prelude = struct.pack(">II", total, len(headers))
+    prelude += struct.pack(">I", zlib.crc32(prelude))
+    message = prelude + headers + body
+    return message + struct.pack(">I", zlib.crc32(message))
+
+
+class StubAWSHandler(BaseHTTPRequestHandler):
+    """
+    Minimal local stand-in for the AWS APIs the handlers call.
+    Answers instantly so the benchmark measures handler overhead, not network latency.
+    """
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without this, delayed ACKs add ~40ms per call
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status=200, body=b"{}", content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_HEAD(self):
+        # s3.head_bucket
+        self._reply(body=b"")
+
+    def do_GET(self):
+        if re.match(r"^/agents/[^/]+/?$", self.path):
+            body = {"agent": {"agentId": "BENCHAGENT", "agentName": "bench", "agentStatus": "PREPARED"}}
+            return self._reply(body=json.dumps(body).encode())
+        self._reply()
+
+    def do_PUT(self):
+        self._read_body()
+        if "/ingestionjobs" in self.path:
+            body = {"ingestionJob": {"ingestionJobId": uuid.uuid4().hex[:10].upper(), "status": "STARTING"}}
+            return self._reply(body=json.dumps(body).encode())
+        self._reply()
+
+    def do_POST(self):
+        self._read_body()
+        target = self.headers.get("X-Amz-Target", "")
+        if target.endswith("GetSecretValue"):
+            secret = {
+                "LANGFUSE_SECRET_KEY": "sk-bench",
+                "LANGFUSE_PUBLIC_KEY": "pk-bench",
+                "LANGFUSE_BASE_URL": f"http://{self.headers.get('Host')}",
+            }
+            body = {"Name": "bench/langfuse", "SecretString": json.dumps(secret)}
+            return self._reply(body=json.dumps(body).encode(), content_type="application/x-amz-json-1.1")
+        if target.startswith("DynamoDB_"):
+            return self._reply(body=b"{}", content_type="application/x-amz-json-1.0")
+        if self.path.endswith("/text"):
+            text = "We offer data engineering, cloud and machine learning courses."
+            stream = encode_event("chunk", {"bytes": base64.b64encode(text.encode()).decode()})
+            return self._reply(body=stream, content_type="application/vnd.amazon.eventstream")
+        # Anything else (e.g. Langfuse OTLP export) is accepted and discarded
+        self._reply()
+
+
+def start_stub_server(handler_class=StubAWSHandler) -> ThreadingHTTPServer:
+    """
+    Start the AWS stub on a free localhost port in a background thread.
+
+    Args:
+        handler_class: Request handler to serve (StubAWSHandler or a subclass).
+
+    Returns:
+        ThreadingHTTPServer: The running server; its URL is http://127.0.0.1:<port>.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+    threading.Thread(target=server.serve_forever, name="aws-stub", daemon=True).start()
+    return server
+
+
+# Child process: one cold start per process
+
+def run_child(name: str, warm: int, result_file: str):
+    """
+    Import a handler in a fresh interpreter and time import, first invocation, the first full
+    garbage collection and warm invocations.
+
+    Args:
+        name (str): Handler directory name under src/lambda.
+        warm (int): Number of warm invocations after the first one.
+        result_file (str): Path the JSON timings are written to.
+    """
+    spec = HANDLERS[name]
+    sys.path[:0] = [str(LAMBDA_DIR / name), str(SHARED_DIR)]
+    context = SimpleNamespace(
+        function_name=f"bench-{name}",
+        function_version="$LATEST",
+        memory_limit_in_mb=512,
+        invoked_function_arn=f"arn:aws:lambda:us-east-1:000000000000:function:bench-{name}",
+        aws_request_id="benchmark",
+        log_group_name=f"/aws/lambda/bench-{name}",
+        log_stream_name="benchmark",
+    )
+
+    # Everything -X importtime reports after this marker belongs to the handler import
+    sys.stderr.write(IMPORT_MARKER + "\n")
+    sys.stderr.flush()
+    start = time.perf_counter()
+    import index
+    import_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    index.handler(dict(spec["event"]), context)
+    first_ms = (time.perf_counter() - start) * 1000
+
+    # One-off start-up work would otherwise show up as a single warm outlier per process, right at the p95
+    # index: the agent-invoker builds its Langfuse client on a background thread that holds the GIL for
+    # ~250ms, and the first full collection walks the whole import-time heap. Finish both first.
+    init_thread = getattr(index, "_langfuse_thread", None)
+    if init_thread:
+        init_thread.join()
+    start = time.perf_counter()
+    gc.collect()
+    full_gc_ms = (time.perf_counter() - start) * 1000
+
+    warm_ms = []
+    for _ in range(warm):
+        start = time.perf_counter()
+        index.handler(dict(spec["event"]), context)
+        warm_ms.append((time.perf_counter() - start) * 1000)
+
+    with open(result_file, "w") as f:
+        json.dump({"import_ms": import_ms, "first_invoke_ms": first_ms, "full_gc_ms": full_gc_ms, "warm_ms": warm_ms}, f)
+
+
+def parse_import_times(stderr: str) -> dict:
+    """
+    Aggregate -X importtime output into cumulative milliseconds per top-level package
+    imported directly by the handler module.
+
+    Args:
+        stderr (str): The child's stderr.
+
+    Returns:
+        dict: {package: cumulative_ms}.
+    """
+    if IMPORT_MARKER not in stderr:
+        return {}
+    entries = []
+    for line in stderr.split(IMPORT_MARKER, 1)[1].splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, module = line.split("|", 2)
+        indent = len(module) - len(module.lstrip())
+        entries.append((indent, module.strip(), int(cumulative)))
+
+    # The handler module ("index") is printed last at the shallowest level; its direct imports sit one level deeper
+    handler_indent = next((indent for indent, module, _ in reversed(entries) if module == "index"), None)
+    if handler_indent is None:
+        return {}
+    packages = {}
+    for indent, module, cumulative in entries:
+        if indent == handler_indent + 2:
+            root = module.split(".")[0]
+            packages[root] = packages.get(root, 0) + cumulative / 1000
+    return packages
+
+
+def benchmark_handler(name: str, runs: int, warm: int, endpoint: str) -> dict:
+    """
+    Run several cold starts of one handler and summarize the timings.
+
+    Args:
+        name (str): Handler directory name under src/lambda.
+        runs (int): Number of fresh processes (cold starts).
+        warm (int): Warm invocations per process.
+        endpoint (str): URL of the AWS stub.
+
+    Returns:
+        dict: Median import/first-invocation/full-GC times, warm percentiles and per-package import cost.
+    """
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("AWS_", "LANGFUSE_", "POWERTOOLS_"))}
+    env.update({
+        "AWS_ENDPOINT_URL": endpoint,
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "AWS_EC2_METADATA_DISABLED": "true",
+        "POWERTOOLS_TRACE_DISABLED": "true",
+        "STAGE": "benchmark",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    env.update(HANDLERS[name]["env"])
+
+    imports, firsts, gcs, warms, packages = [], [], [], [], {}
+    for _ in range(runs):
+        with tempfile.NamedTemporaryFile(suffix=".json") as result:
+            proc = subprocess.run(
+                [sys.executable, "-X", "importtime", __file__, "--child", name, "--warm", str(warm), "--result-file", result.name],
+                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=300
+            )
+            if proc.returncode != 0:
+                tail = "\n".join(line for line in proc.stderr.splitlines() if not line.startswith("import time:"))[-2000:]
+                raise RuntimeError(f"{name} benchmark process failed:\n{tail}")
+            timings = json.load(open(result.name))
+        imports.append(timings["import_ms"])
+        firsts.append(timings["first_invoke_ms"])
+        gcs.append(timings["full_gc_ms"])
+        warms.extend(timings["warm_ms"])
+        for package, ms in parse_import_times(proc.stderr).items():
+            packages.setdefault(package, []).append(ms)
+
+    warm_sorted = sorted(warms) or [0.0]
+    summary = {
+        "import_ms": statistics.median(imports),
+        "first_invoke_ms": statistics.median(firsts),
+        "cold_start_ms": statistics.median(i + f for i, f in zip(imports, firsts)),
+        "full_gc_ms": statistics.median(gcs),
+        "warm_p50_ms": statistics.median(warm_sorted),
+        "warm_p95_ms": warm_sorted[min(len(warm_sorted) - 1, int(len(warm_sorted) * 0.95))],
+        "imports": {p: round(statistics.median(v), 2) for p, v in sorted(packages.items(), key=lambda kv: -statistics.median(kv[1]))},
+    }
+    return {k: round(v, 2) if isinstance(v, float) else v for k, v in summary.items()}
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> bool:
+    """
+    Compare results with a saved baseline and log every tracked metric.
+
+    Args:
+        results (dict): Current handler summaries.
+        baseline (dict): Baseline file contents.
+        tolerance (float): Allowed relative slowdown (0.2 = 20%).
+        min_delta_ms (float): Absolute slowdown ignored as noise.
+
+    Returns:
+        bool: True if any metric regressed.
+    """
+    regressed = False
+    for name, current in results.items():
+        reference = baseline.get("handlers", {}).get(name)
+        if not reference:
+            logger.warning(f"⚠️  No baseline for {name}; skipping comparison")
+            continue
+        for metric in TRACKED_METRICS:
+            old, new = reference.get(metric), current.get(metric)
+            if old is None or new is None:
+                continue
+            delta = new - old
+            worse = delta > min_delta_ms and new > old * (1 + tolerance)
+            status = "❌ REGRESSION" if worse else "✅ OK"
+            logger.info(f"{status} - {name} {metric}: {new:.2f}ms (baseline {old:.2f}ms, {delta:+.2f}ms)")
+            regressed |= worse
+    return regressed
+
+
+def main():
+    """
+    Main entry point for the Lambda cold-start benchmark.
+    """
+    parser = argparse.ArgumentParser(description="Offline cold-start and import-time benchmark for the Lambda handlers")
+    parser.add_argument("--handlers", nargs="+", choices=sorted(HANDLERS), default=sorted(HANDLERS), help="Handlers to benchmark (default: all)")
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts (fresh processes) per handler")
+    parser.add_argument("--warm", type=int, default=20, help="Warm invocations per cold start")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Baseline file to compare against or write")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown before failing (default: 0.2)")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Absolute slowdown treated as noise (default: 5ms)")
+    parser.add_argument("--output", help="Optional path for the full JSON results")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.warm, args.result_file)
+        return
+
+    server = start_stub_server()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    logger.info(f"🚀 Benchmarking {', '.join(args.handlers)} ({args.runs} cold starts x {args.warm} warm invocations) against {endpoint}")
+
+    results = {}
+    try:
+        for name in args.handlers:
+            results[name] = benchmark_handler(name, args.runs, args.warm, endpoint)
+            r = results[name]
+            top = ", ".join(f"{p} {ms:.0f}ms" for p, ms in list(r["imports"].items())[:5])
+            logger.info(f"⏱️  {name}: import {r['import_ms']:.1f}ms, first {r['first_invoke_ms']:.1f}ms, "
+                        f"full GC {r['full_gc_ms']:.1f}ms, "
+                        f"warm p50 {r['warm_p50_ms']:.2f}ms / p95 {r['warm_p95_ms']:.2f}ms | {top}")
+    finally:
+        server.shutdown()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": args.runs,
+        "warm": args.warm,
+        "handlers": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        logger.info(f"✅ Baseline written to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        logger.warning(f"⚠️  Baseline {args.baseline} not found; run with --save-baseline to create it")
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("python") != report["python"]:
+        logger.warning(f"⚠️  Baseline was recorded on Python {baseline.get('python')}, current is {report['python']}")
+
+    if compare(results, baseline, args.tolerance, args.min_delta_ms):
+        logger.error("❌ Cold-start benchmark FAILED: one or more handlers regressed against the baseline.")
+        sys.exit(1)
+    logger.info("✅ Cold-start benchmark passed: no regressions against the baseline.")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
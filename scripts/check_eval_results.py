@@ -4,6 +4,7 @@ import json
 import argparse
 import logging
 import os
+import statistics
 
 # Configure logging
 logging.basicConfig(
@@ -12,6 +13,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Performance stats of runs that passed the gate; the rolling baseline is built from these only
+BASELINE_PREFIX = "results/performance_baseline/"
+
 def load_thresholds():
     """Attempts to load thresholds from the central metrics_thresholds.json file."""
 
@@ -42,6 +46,113 @@ def fetch_report(s3_client, bucket, key):
         logger.error(f"Error fetching or parsing report: {e}")
         return None
 
+def percentile(values, pct):
+    """Nearest-rank percentile (same convention as the evaluator's trace_summary)."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def performance_stats(report):
+    """
+    Derives latency percentiles and token totals from the per-case agent traces in a report.
+    Traces replayed from the agent cache or restored from a checkpoint were not measured in
+    this run and are left out. Returns None when no freshly measured traces remain.
+    """
+    traces = [
+        d["trace"] for d in report.get("detailed_results", [])
+        if d.get("trace") and not d["trace"].get("cached") and not d["trace"].get("restored")
+    ]
+    if not traces:
+        return None
+    latencies = [t["total_ms"] for t in traces]
+    total_tokens = sum(t.get("input_tokens", 0) + t.get("output_tokens", 0) for t in traces)
+    return {
+        "cases": len(traces),
+        "p50_latency_ms": percentile(latencies, 50),
+        "p95_latency_ms": percentile(latencies, 95),
+        "total_tokens": total_tokens,
+        "tokens_per_case": total_tokens / len(traces)
+    }
+
+def fetch_baseline(s3_client, bucket, report, runs):
+    """
+    Builds a rolling baseline from the most recent runs that passed the gate (see record_baseline),
+    excluding the run being checked: the median of each statistic over up to `runs` runs.
+    """
+    keys = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=BASELINE_PREFIX):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
+
+    history = []
+    for key in sorted(keys, reverse=True):
+        if len(history) >= runs:
+            break
+        previous = fetch_report(s3_client, bucket, key)
+        if not previous:
+            continue
+        if previous.get("run_id") == report.get("run_id") and previous.get("timestamp") == report.get("timestamp"):
+            continue
+        history.append(previous["stats"])
+
+    if not history:
+        return None
+    return {
+        "reports": len(history),
+        **{name: statistics.median(h[name] for h in history) for name in ("p50_latency_ms", "p95_latency_ms", "tokens_per_case")}
+    }
+
+def record_baseline(s3_client, bucket, report, stats):
+    """
+    Adds a run that passed every gate to the performance baseline history.
+    Failed runs are never recorded, so a regression cannot drag the baseline along with it.
+    """
+    key = f"{BASELINE_PREFIX}{report.get('timestamp')}.json"
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps({"run_id": report.get("run_id"), "timestamp": report.get("timestamp"), "stats": stats}, indent=2)
+    )
+    logger.info(f"📈 Recorded run in the performance baseline: s3://{bucket}/{key}")
+
+def check_performance(stats, config, baseline):
+    """
+    Gates p50/p95 agent latency and total token spend against the configured budgets and the
+    rolling baseline. Token totals are compared per case so a growing golden set is not a regression.
+    Returns True if any check failed.
+    """
+    tolerance = config.get("regression_tolerance", 0.25)
+    min_latency_delta = config.get("min_latency_delta_ms", 0)
+    fail = False
+
+    budgets = {
+        "p50_latency_ms": config.get("max_p50_latency_ms"),
+        "p95_latency_ms": config.get("max_p95_latency_ms"),
+        "total_tokens": config.get("max_total_tokens")
+    }
+    for name, budget in budgets.items():
+        if budget is None:
+            continue
+        over = stats[name] > budget
+        logger.info(f"{'❌ FAIL' if over else '✅ PASS'} - {name}: {stats[name]:.0f} (Budget: {budget})")
+        fail |= over
+
+    if not baseline:
+        logger.warning("⚠️ No previous passing runs in the performance baseline; skipping baseline comparison.")
+        return fail
+
+    logger.info(f"Baseline: median of the last {baseline['reports']} passing runs")
+    for name in ("p50_latency_ms", "p95_latency_ms"):
+        current, reference = stats[name], baseline[name]
+        worse = current > reference * (1 + tolerance) and current - reference > min_latency_delta
+        logger.info(f"{'❌ REGRESSION' if worse else '✅ PASS'} - {name}: {current:.0f} (Baseline: {reference:.0f})")
+        fail |= worse
+
+    expected_tokens = baseline["tokens_per_case"] * stats["cases"]
+    worse = stats["total_tokens"] > expected_tokens * (1 + tolerance)
+    logger.info(f"{'❌ REGRESSION' if worse else '✅ PASS'} - total_tokens: {stats['total_tokens']:.0f} "
+                f"(Baseline: {expected_tokens:.0f} for {stats['cases']} cases)")
+    return fail | worse
+
 def main():
     """
     Main entry point for the evaluation results checker script.
@@ -49,6 +160,7 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--bucket", required=True, help="S3 bucket containing evaluation results")
     parser.add_argument("--report-key", default="results/latest_eval_report.json", help="Specific S3 key (default: results/latest_eval_report.json)")
+    parser.add_argument("--baseline-runs", type=int, help="Previous reports in the rolling performance baseline (default: from metrics_thresholds.json)")
     args = parser.parse_args()
 
     s3 = boto3.client('s3')
@@ -86,12 +198,27 @@ def main():
         logger.info(f"{pass_status} - {metric_name}: {value:.4f} (Threshold: {threshold})")
         if value < threshold:
             fail = True
+
+    # Latency and token spend are release gates too
+    perf_fail = False
+    perf_config = central_thresholds.get("performance", {})
+    stats = performance_stats(report)
+    if stats is None:
+        logger.warning("⚠️ Report has no freshly measured agent traces; skipping latency and token checks.")
+    else:
+        runs = args.baseline_runs or perf_config.get("baseline_runs", 5)
+        perf_fail = check_performance(stats, perf_config, fetch_baseline(s3, args.bucket, report, runs))
     
     if fail:
         logger.error("❌ CI/CD Pipeline FAILED: One or more metrics are below the threshold.")
         sys.exit(1)
+    if perf_fail:
+        logger.error("❌ CI/CD Pipeline FAILED: Agent latency or token usage exceeded its budget or regressed.")
+        sys.exit(1)
+    if stats is not None:
+        record_baseline(s3, args.bucket, report, stats)
         
-    logger.info("CI/CD Pipeline SUCCESS: All metrics are above threshold.")
+    logger.info("CI/CD Pipeline SUCCESS: All metrics are above threshold and performance is within budget.")
     sys.exit(0)
 
 if __name__ == "__main__":
@@ -0,0 +1,434 @@
+import os
+import re
+import sys
+import json
+import time
+import base64
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from types import SimpleNamespace
+from urllib.parse import unquote
+
+from benchmark_lambdas import HANDLERS, LAMBDA_DIR, SHARED_DIR, StubAWSHandler, encode_event, start_stub_server
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "load_test_baseline.json"
+FUNCTION_TIMEOUT_MS = 60000
+
+# Metrics compared against the baseline and whether a higher value is worse
+TRACKED_METRICS = {"throughput_rps": False, "p50_ms": True, "p95_ms": True, "p99_ms": True}
+
+# Injectable invoke_agent failures: HTTP status and the error code botocore surfaces. Faults without a
+# status arrive inside a 200 completion stream after the first-chunk delay, the way Bedrock reports
+# throttling and service errors once the call has been accepted (botocore raises EventStreamError)
+FAULTS = {
+    "throttle": (429, "ThrottlingException"),
+    "internal": (500, "InternalServerException"),
+    "unavailable": (503, "ServiceUnavailableException"),
+    "validation": (400, "ValidationException"),
+    "access_denied": (403, "AccessDeniedException"),
+    "stream_throttle": (None, "throttlingException"),
+    "stream_internal": (None, "internalServerException"),
+    "stream_dependency": (None, "dependencyFailedException"),
+}
+
+ANSWER = ("We offer data engineering, cloud and machine learning courses, "
+          "delivered online with live sessions and hands-on labs.")
+
+
+# Offline Bedrock stand-in with configurable timing and faults
+
+class LoadStubHandler(StubAWSHandler):
+    """
+    StubAWSHandler whose invoke_agent answers follow a load profile: a delay before the
+    first chunk, a number of chunks spaced by an interval, and a random mix of error responses.
+    Every invoke_agent request is counted per session so retries can be told apart from requests.
+    """
+    profile = {"first_chunk_ms": 0, "chunks": 1, "chunk_interval_ms": 0, "faults": {}}
+    counters = {"requests": 0, "sessions": set(), "faults": {}}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        if re.match(r"^/agents/[^/]+/agentaliases/[^/]+/?$", self.path):
+            # get_agent_alias, used by the answer cache to version its keys
+            body = {"agentAlias": {"agentAliasId": "BENCHALIAS", "routingConfiguration": [{"agentVersion": "1"}]}}
+            return self._reply(body=json.dumps(body).encode())
+        super().do_GET()
+
+    def do_POST(self):
+        if not self.path.endswith("/text"):
+            return super().do_POST()
+        self._read_body()
+        fault = self._pick_fault()
+        with self.lock:
+            self.counters["requests"] += 1
+            self.counters["sessions"].add(unquote(self.path).split("/sessions/")[-1])
+            if fault:
+                self.counters["faults"][fault] = self.counters["faults"].get(fault, 0) + 1
+        if fault and FAULTS[fault][0] is None:
+            return self._stream_answer(error=FAULTS[fault][1])
+        if fault:
+            status, code = FAULTS[fault]
+            body = json.dumps({"message": f"Injected {code}"}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("x-amzn-ErrorType", code)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            return self.wfile.write(body)
+        self._stream_answer()
+
+    def _pick_fault(self):
+        roll = random.random()
+        for fault, rate in self.profile["faults"].items():
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    def _stream_answer(self, error=None):
+        chunks = max(1, self.profile["chunks"])
+        size = -(-len(ANSWER) // chunks)
+        frames = [
+            encode_event("chunk", {"bytes": base64.b64encode(ANSWER[i:i + size].encode()).decode()})
+            for i in range(0, len(ANSWER), size)
+        ]
+        if error:
+            frames = [encode_event(error, {"message": f"Injected {error}"}, message_type="exception")]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("Content-Length", str(sum(len(f) for f in frames)))
+        self.end_headers()
+        time.sleep(self.profile["first_chunk_ms"] / 1000)
+        for i, frame in enumerate(frames):
+            if i:
+                time.sleep(self.profile["chunk_interval_ms"] / 1000)
+            self.wfile.write(frame)
+            self.wfile.flush()
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.counters = {"requests": 0, "sessions": set(), "faults": {}}
+
+
+def parse_faults(spec: str) -> dict:
+    """
+    Parse a fault mix such as "throttle=0.05,internal=0.01".
+
+    Args:
+        spec (str): Comma-separated fault=rate pairs (rates are per invoke_agent request).
+
+    Returns:
+        dict: Fault name to probability.
+    """
+    faults = {}
+    for item in filter(None, (s.strip() for s in (spec or "").split(","))):
+        name, _, rate = item.partition("=")
+        if name not in FAULTS:
+            raise argparse.ArgumentTypeError(f"Unknown fault '{name}' (choose from {', '.join(FAULTS)})")
+        faults[name] = float(rate)
+    if sum(faults.values()) > 1:
+        raise argparse.ArgumentTypeError("Fault rates must add up to at most 1")
+    return faults
+
+
+# Worker process: one warm Lambda container handling requests one at a time
+
+def run_worker(args):
+    """
+    Import the agent-invoker in this process, warm it up, wait for the start signal and
+    send this worker's share of requests, writing per-request timings to the result file.
+
+    Args:
+        args (argparse.Namespace): Parsed worker arguments.
+    """
+    sys.path[:0] = [str(LAMBDA_DIR / "agent-invoker"), str(SHARED_DIR)]
+    import index
+
+    entry = getattr(index, args.entry)
+    headers = {"origin": "https://example.com"}
+    if args.sse:
+        headers["accept"] = "text/event-stream"
+
+    def invoke(prompt: str) -> dict:
+        started = time.monotonic()
+        context = SimpleNamespace(
+            function_name="loadtest-agent-invoker",
+            function_version="$LATEST",
+            memory_limit_in_mb=512,
+            invoked_function_arn="arn:aws:lambda:us-east-1:000000000000:function:loadtest-agent-invoker",
+            aws_request_id="loadtest",
+            log_group_name="/aws/lambda/loadtest-agent-invoker",
+            log_stream_name="loadtest",
+            get_remaining_time_in_millis=lambda: int(FUNCTION_TIMEOUT_MS - (time.monotonic() - started) * 1000),
+        )
+        event = {"body": json.dumps({"prompt": prompt}), "headers": dict(headers), "requestContext": {"requestId": "loadtest"}}
+        if args.entry == "stream_handler":
+            first, status = None, 200
+            for frame in entry(event, context):
+                first = first or time.monotonic()
+                if frame.startswith("event: error"):
+                    status = 429 if "retryAfter" in frame else 500
+            return {"status": status, "ttfb_ms": ((first or time.monotonic()) - started) * 1000}
+        return {"status": entry(event, context)["statusCode"]}
+
+    # The first request only starts the background Langfuse credential load; wait for it and send a
+    # traced request too, so client construction and the first span export stay out of the timings
+    invoke("Warm-up request")
+    if index._langfuse_thread:
+        index._langfuse_thread.join()
+    invoke("Warm-up request")
+    Path(args.result_file + ".ready").touch()
+    while not os.path.exists(args.go_file):
+        time.sleep(0.005)
+
+    go = time.monotonic()
+    interval = args.worker_count / args.rps if args.rps else 0
+    results = []
+    for i in range(args.requests):
+        if interval:
+            time.sleep(max(0.0, go + i * interval - time.monotonic()))
+        n = args.worker_index + i * args.worker_count
+        prompt = f"What courses do you offer? ({n % args.distinct_prompts if args.distinct_prompts else n})"
+        started = time.monotonic()
+        outcome = invoke(prompt)
+        outcome.update({"start_s": started - go, "latency_ms": (time.monotonic() - started) * 1000})
+        results.append(outcome)
+
+    with open(args.result_file, "w") as f:
+        json.dump(results, f)
+
+
+# Parent process
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def run_load(args, endpoint: str) -> dict:
+    """
+    Start one worker process per unit of concurrency, release them together and summarize.
+
+    Args:
+        args (argparse.Namespace): Load profile.
+        endpoint (str): URL of the Bedrock stand-in.
+
+    Returns:
+        dict: Throughput, latency percentiles, status codes and retry counts.
+    """
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("AWS_", "LANGFUSE_", "POWERTOOLS_", "ANSWER_CACHE_"))}
+    env.update({
+        "AWS_ENDPOINT_URL": endpoint,
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "loadtest",
+        "AWS_SECRET_ACCESS_KEY": "loadtest",
+        "AWS_EC2_METADATA_DISABLED": "true",
+        "POWERTOOLS_TRACE_DISABLED": "true",
+        "LOG_LEVEL": "ERROR",
+        "STAGE": "loadtest",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    env.update(HANDLERS["agent-invoker"]["env"])
+    if args.answer_cache:
+        env.update({"ANSWER_CACHE_ENABLED": "true", "ANSWER_CACHE_TABLE": "local"})
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    go_file = os.path.join(workdir, "go")
+    shares = [args.requests // args.concurrency + (i < args.requests % args.concurrency) for i in range(args.concurrency)]
+    procs, result_files = [], []
+    for i, share in enumerate(shares):
+        result_file = os.path.join(workdir, f"worker-{i}.json")
+        result_files.append(result_file)
+        procs.append(subprocess.Popen(
+            [sys.executable, __file__, "--worker",
+             "--worker-index", str(i), "--worker-count", str(args.concurrency),
+             "--requests", str(share), "--rps", str(args.rps or 0),
+             "--distinct-prompts", str(args.distinct_prompts), "--entry", args.entry,
+             "--result-file", result_file, "--go-file", go_file] + (["--sse"] if args.sse else []),
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+        ))
+
+    deadline = time.monotonic() + 120
+    while not all(os.path.exists(f + ".ready") for f in result_files):
+        failed = [p for p in procs if p.poll() not in (None, 0)]
+        if failed or time.monotonic() > deadline:
+            for p in procs:
+                p.kill()
+            stderr = failed[0].stderr.read()[-2000:] if failed else "timed out waiting for workers"
+            raise RuntimeError(f"Load test worker failed to start:\n{stderr}")
+        time.sleep(0.05)
+
+    LoadStubHandler.reset()
+    started = time.monotonic()
+    Path(go_file).touch()
+    for p in procs:
+        _, stderr = p.communicate()
+        if p.returncode != 0:
+            raise RuntimeError(f"Load test worker failed:\n{stderr[-2000:]}")
+    elapsed = time.monotonic() - started
+
+    results = [r for f in result_files for r in json.load(open(f))]
+    latencies = [r["latency_ms"] for r in results]
+    statuses = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    counters = LoadStubHandler.counters
+    summary = {
+        "requests": len(results),
+        "duration_s": elapsed,
+        "throughput_rps": len(results) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies, default=0.0),
+        "status_codes": statuses,
+        "agent_requests": counters["requests"],
+        "retries": counters["requests"] - len(counters["sessions"]),
+        "injected_faults": counters["faults"],
+    }
+    ttfb = [r["ttfb_ms"] for r in results if "ttfb_ms" in r]
+    if ttfb:
+        summary.update({"ttfb_p50_ms": percentile(ttfb, 50), "ttfb_p95_ms": percentile(ttfb, 95)})
+    return {k: round(v, 2) if isinstance(v, float) else v for k, v in summary.items()}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """
+    Compare results with a saved baseline and log every tracked metric.
+
+    Args:
+        results (dict): Current summary.
+        baseline (dict): Baseline file contents.
+        tolerance (float): Allowed relative change in the worse direction (0.2 = 20%).
+
+    Returns:
+        bool: True if any metric regressed.
+    """
+    regressed = False
+    reference = baseline.get("results", {})
+    for metric, higher_is_worse in TRACKED_METRICS.items():
+        old, new = reference.get(metric), results.get(metric)
+        if old is None or new is None:
+            continue
+        worse = new > old * (1 + tolerance) if higher_is_worse else new < old * (1 - tolerance)
+        status = "❌ REGRESSION" if worse else "✅ OK"
+        logger.info(f"{status} - {metric}: {new:.2f} (baseline {old:.2f})")
+        regressed |= worse
+    return regressed
+
+
+def main():
+    """
+    Main entry point for the offline agent-invoker load test.
+    """
+    parser = argparse.ArgumentParser(description="Offline load test for the agent-invoker handler against a local Bedrock stand-in")
+    parser.add_argument("--requests", type=int, default=200, help="Total requests to send (default: 200)")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent warm workers, i.e. Lambda containers (default: 10)")
+    parser.add_argument("--rps", type=float, help="Target request rate across all workers (default: as fast as possible)")
+    parser.add_argument("--first-chunk-ms", type=float, default=300, help="Stand-in delay before the first chunk (default: 300)")
+    parser.add_argument("--chunks", type=int, default=5, help="Chunks per answer (default: 5)")
+    parser.add_argument("--chunk-interval-ms", type=float, default=50, help="Delay between chunks (default: 50)")
+    parser.add_argument("--faults", type=parse_faults, default={}, help="Fault mix per agent request, e.g. throttle=0.05,internal=0.01")
+    parser.add_argument("--distinct-prompts", type=int, default=0, help="Cycle through this many prompts (0: every prompt unique)")
+    parser.add_argument("--answer-cache", action="store_true", help="Enable the answer cache (in-memory tier)")
+    parser.add_argument("--entry", choices=("handler", "stream_handler"), default="handler", help="Entry point to drive (default: handler)")
+    parser.add_argument("--sse", action="store_true", help="Send Accept: text/event-stream to the buffered handler")
+    parser.add_argument("--seed", type=int, help="Seed for the fault injection")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Baseline file to compare against or write")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression before failing (default: 0.2)")
+    parser.add_argument("--output", help="Optional path for the full JSON results")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-index", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-count", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    parser.add_argument("--go-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    profile = {
+        "first_chunk_ms": args.first_chunk_ms,
+        "chunks": args.chunks,
+        "chunk_interval_ms": args.chunk_interval_ms,
+        "faults": args.faults,
+    }
+    LoadStubHandler.profile = profile
+    server = start_stub_server(LoadStubHandler)
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    config = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "rps": args.rps,
+        "distinct_prompts": args.distinct_prompts,
+        "answer_cache": args.answer_cache,
+        "entry": args.entry,
+        "sse": args.sse,
+        **profile,
+    }
+    logger.info(f"🚀 Load testing agent-invoker: {json.dumps(config)} against {endpoint}")
+
+    try:
+        results = run_load(args, endpoint)
+    finally:
+        server.shutdown()
+
+    logger.info(f"⏱️  {results['requests']} requests in {results['duration_s']:.1f}s ({results['throughput_rps']:.1f} rps) | "
+                f"p50 {results['p50_ms']:.0f}ms / p95 {results['p95_ms']:.0f}ms / p99 {results['p99_ms']:.0f}ms | "
+                f"status {results['status_codes']} | {results['agent_requests']} agent calls, {results['retries']} retries")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        logger.info(f"✅ Baseline written to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        logger.warning(f"⚠️  Baseline {args.baseline} not found; run with --save-baseline to create it")
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("config") != config:
+        logger.warning("⚠️  Load profile differs from the baseline; skipping comparison")
+        sys.exit(0)
+
+    if compare(results, baseline, args.tolerance):
+        logger.error("❌ Load test FAILED: throughput or latency regressed against the baseline.")
+        sys.exit(1)
+    logger.info("✅ Load test passed: no regressions against the baseline.")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 import boto3
 import sys
+import json
 import argparse
+import datetime
 import logging
+import os
 import time
 
 # Configure logging
@@ -11,7 +14,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def run_fargate_task(cluster, task_definition, subnets, security_groups, vpc_id=None):
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "src/jobs/evaluation/deepeval_evaluator"))
+
+from services import summarize_traces  # noqa: E402
+
+def run_fargate_task(cluster, task_definition, subnets, security_groups, vpc_id=None, overrides=None):
     """
     Runs an ECS Fargate task and waits for it to complete.
 
@@ -21,6 +29,7 @@ def run_fargate_task(cluster, task_definition, subnets, security_groups, vpc_id=
         subnets (list): List of subnet IDs.
         security_groups (list): List of security group IDs.
         vpc_id (str, optional): VPC ID where the task is running.
+        overrides (dict, optional): ECS task overrides (e.g. shard environment variables).
 
     Returns:
         str: The ARN of the started task.
@@ -33,18 +42,21 @@ def run_fargate_task(cluster, task_definition, subnets, security_groups, vpc_id=
             msg += f" (VPC: {vpc_id})"
         logger.info(msg)
         
-        response = ecs.run_task(
-            cluster=cluster,
-            taskDefinition=task_definition,
-            launchType='FARGATE',
-            networkConfiguration={
+        params = {
+            'cluster': cluster,
+            'taskDefinition': task_definition,
+            'launchType': 'FARGATE',
+            'networkConfiguration': {
                 'awsvpcConfiguration': {
                     'subnets': subnets,
                     'securityGroups': security_groups,
                     'assignPublicIp': 'ENABLED'
                 }
             }
-        )
+        }
+        if overrides:
+            params['overrides'] = overrides
+        response = ecs.run_task(**params)
 
         if not response.get('tasks'):
             logger.error(f"❌ Failed to start task: {response.get('failures')}")
@@ -59,67 +71,225 @@ def run_fargate_task(cluster, task_definition, subnets, security_groups, vpc_id=
         logger.error(f"❌ Error starting Fargate task: {e}")
         sys.exit(1)
 
-def wait_for_task_completion(cluster, task_arn):
+def wait_for_task_completion(cluster, task_arns):
     """
-    Waits for the ECS task to stop.
+    Waits for the ECS tasks to stop (all of them concurrently, with a single waiter).
 
     Args:
         cluster (str): Cluster ARN or name.
-        task_arn (str): Task ARN.
+        task_arns (list): Task ARNs.
     """
     ecs = boto3.client('ecs')
     
-    logger.info(f"⌛ Waiting for task to complete: {task_arn}")
+    logger.info(f"⌛ Waiting for {len(task_arns)} task(s) to complete: {', '.join(task_arns)}")
     
     try:
         waiter = ecs.get_waiter('tasks_stopped')
         waiter.wait(
             cluster=cluster,
-            tasks=[task_arn],
+            tasks=task_arns,
             WaiterConfig={'Delay': 15, 'MaxAttempts': 120}
         )
         
-        # After task stops, inspect the exit status
+        # After tasks stop, inspect the exit status
         response = ecs.describe_tasks(
             cluster=cluster,
-            tasks=[task_arn]
+            tasks=task_arns
         )
         
-        if not response.get('tasks'):
-            logger.error("❌ Could not describe task after completion.")
-            sys.exit(1)
-            
-        task = response['tasks'][0]
-        containers = task.get('containers', [])
-        
-        # Check for task-level errors
-        stop_code = task.get('stopCode')
-        stopped_reason = task.get('stoppedReason')
-        
-        if stop_code and stop_code != 'EssentialContainerExited':
-            logger.error(f"❌ Task failed with stop code: {stop_code}. Reason: {stopped_reason}")
+        if len(response.get('tasks', [])) != len(task_arns):
+            logger.error(f"❌ Could not describe all tasks after completion: {response.get('failures')}")
             sys.exit(1)
             
-        # Check container exit codes
         failed = False
-        for container in containers:
-            exit_code = container.get('exitCode')
-            container_name = container.get('name', 'Unknown')
-            if exit_code is None:
-                logger.error(f"❌ Container {container_name} did not provide an exit code. Stopped reason: {container.get('reason')}")
-                failed = True
-            elif exit_code != 0:
-                logger.error(f"❌ Container {container_name} failed with exit code: {exit_code}")
+        for task in response['tasks']:
+            task_id = task['taskArn'].split('/')[-1]
+            containers = task.get('containers', [])
+            
+            # Check for task-level errors
+            stop_code = task.get('stopCode')
+            stopped_reason = task.get('stoppedReason')
+            
+            if stop_code and stop_code != 'EssentialContainerExited':
+                logger.error(f"❌ Task {task_id} failed with stop code: {stop_code}. Reason: {stopped_reason}")
                 failed = True
+                continue
+                
+            # Check container exit codes
+            for container in containers:
+                exit_code = container.get('exitCode')
+                container_name = container.get('name', 'Unknown')
+                if exit_code is None:
+                    logger.error(f"❌ Container {container_name} of task {task_id} did not provide an exit code. Stopped reason: {container.get('reason')}")
+                    failed = True
+                elif exit_code != 0:
+                    logger.error(f"❌ Container {container_name} of task {task_id} failed with exit code: {exit_code}")
+                    failed = True
                 
         if failed:
             sys.exit(1)
             
-        logger.info("🏁 Task completed successfully.")
+        logger.info(f"🏁 {len(task_arns)} task(s) completed successfully.")
     except Exception as e:
         logger.error(f"❌ Error waiting for task completion: {e}")
         sys.exit(1)
 
+def stop_tasks(cluster, task_arns, reason):
+    """
+    Stops ECS tasks so a failed sharded run does not leave workers billing in the background.
+    Tasks that already stopped are ignored.
+
+    Args:
+        cluster (str): Cluster ARN or name.
+        task_arns (list): Task ARNs.
+        reason (str): Stop reason shown in the ECS console.
+    """
+    ecs = boto3.client('ecs')
+    for task_arn in task_arns:
+        try:
+            ecs.stop_task(cluster=cluster, task=task_arn, reason=reason)
+            logger.warning(f"🛑 Stopped task {task_arn}")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not stop task {task_arn}: {e}")
+
+def get_task_container(task_definition):
+    """
+    Reads the evaluator container name and environment from the task definition.
+
+    Args:
+        task_definition (str): Task definition ARN or family.
+
+    Returns:
+        tuple: (container name, environment dict).
+    """
+    ecs = boto3.client('ecs')
+    container = ecs.describe_task_definition(taskDefinition=task_definition)['taskDefinition']['containerDefinitions'][0]
+    return container['name'], {e['name']: e['value'] for e in container.get('environment', [])}
+
+def run_sharded_tasks(cluster, task_definition, subnets, security_groups, vpc_id, shards):
+    """
+    Starts one Fargate task per shard, each with its SHARD_INDEX/SHARD_COUNT environment.
+    If a shard cannot be started, the shards already running are stopped before exiting.
+
+    Args:
+        cluster (str): Cluster ARN or name.
+        task_definition (str): Task definition ARN or family.
+        subnets (list): List of subnet IDs.
+        security_groups (list): List of security group IDs.
+        vpc_id (str, optional): VPC ID where the tasks run.
+        shards (int): Number of shards.
+
+    Returns:
+        list: The ARNs of the started tasks, in shard order.
+    """
+    container_name, _ = get_task_container(task_definition)
+    task_arns = []
+    for index in range(shards):
+        overrides = {'containerOverrides': [{
+            'name': container_name,
+            'environment': [
+                {'name': 'SHARD_INDEX', 'value': str(index)},
+                {'name': 'SHARD_COUNT', 'value': str(shards)}
+            ]
+        }]}
+        try:
+            task_arns.append(run_fargate_task(cluster, task_definition, subnets, security_groups, vpc_id, overrides))
+        except SystemExit:
+            stop_tasks(cluster, task_arns, f"Shard {index} of the evaluation could not be started")
+            raise
+    return task_arns
+
+def merge_cache_stats(shards):
+    """
+    Sums the per-shard cache counters into run totals, recomputing the hit rate.
+
+    Args:
+        shards (list): Shard reports.
+
+    Returns:
+        dict: Cache stats per cache name, in the shape of a single-task report.
+    """
+    merged = {}
+    for shard in shards:
+        for name, stats in (shard.get('cache_stats') or {}).items():
+            total = merged.setdefault(name, {"hits": 0, "misses": 0, "hit_rate": 0.0, "entries": 0, "refresh": False})
+            total["hits"] += stats.get('hits', 0)
+            total["misses"] += stats.get('misses', 0)
+            # Shards load the same shared cache, so entry counts overlap rather than add up
+            total["entries"] = max(total["entries"], stats.get('entries', 0))
+            total["refresh"] = total["refresh"] or bool(stats.get('refresh'))
+    for total in merged.values():
+        lookups = total["hits"] + total["misses"]
+        total["hit_rate"] = total["hits"] / lookups if lookups else 0.0
+    return merged
+
+def merge_shard_reports(bucket, task_arns):
+    """
+    Merges the per-shard evaluation reports into one report and publishes it like a single-task run.
+
+    Args:
+        bucket (str): Results bucket.
+        task_arns (list): ARNs of the shard tasks.
+
+    Returns:
+        str: The ID of the merged report (reports/eval-report-{id}.json).
+    """
+    s3 = boto3.client('s3')
+    shards = []
+    for task_arn in task_arns:
+        key = f"reports/eval-report-{task_arn.split('/')[-1]}.json"
+        try:
+            shards.append(json.loads(s3.get_object(Bucket=bucket, Key=key)['Body'].read().decode('utf-8')))
+        except Exception as e:
+            logger.error(f"❌ Could not load shard report s3://{bucket}/{key}: {e}")
+            sys.exit(1)
+
+    # Shards hold strided rows: restore test-set order (first appearance) and dataset order within each set
+    detailed_results = [detail for shard in shards for detail in shard.get('detailed_results', [])]
+    set_order = {}
+    for detail in detailed_results:
+        set_order.setdefault(detail.get('test_set'), len(set_order))
+    detailed_results.sort(key=lambda d: (set_order[d.get('test_set')], d.get('case_index') or 0))
+
+    # Averages are recomputed over every case, not averaged across shards of different sizes
+    scores = {}
+    for detail in detailed_results:
+        for m in detail['metrics']:
+            if m['score'] is not None:
+                scores.setdefault(m['name'], []).append(m['score'])
+
+    ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    merged_id = f"sharded-{ts}"
+    report = {
+        "status": "completed" if all(s.get('status') == 'completed' for s in shards) else "failed",
+        "timestamp": ts,
+        "task_id": merged_id,
+        "run_id": merged_id,
+        "summary_metrics": {name: sum(values) / len(values) for name, values in scores.items()},
+        "cache_stats": merge_cache_stats(shards),
+        "trace_summary": summarize_traces(detailed_results),
+        "failed_cases": [case for shard in shards for case in shard.get('failed_cases', [])],
+        "shards": [
+            {
+                "index": shard.get('shard', {}).get('index'),
+                "task_id": shard.get('task_id'),
+                "run_id": shard.get('run_id'),
+                "cases": len(shard.get('detailed_results', [])),
+                "cache_stats": shard.get('cache_stats'),
+                "rate_limits": shard.get('rate_limits'),
+                "trace_summary": shard.get('trace_summary')
+            }
+            for shard in shards
+        ],
+        "detailed_results": detailed_results
+    }
+
+    body = json.dumps(report, indent=2)
+    for key in (f"reports/eval-report-{merged_id}.json", f"results/eval_status_{ts}.json", "results/latest_eval_report.json"):
+        s3.put_object(Bucket=bucket, Key=key, Body=body)
+    logger.info(f"✅ Merged {len(shards)} shard reports ({len(detailed_results)} cases) into reports/eval-report-{merged_id}.json")
+    return merged_id
+
 def main():
     parser = argparse.ArgumentParser(description="Run ECS Fargate Ragas Evaluation Task")
     parser.add_argument("--cluster", required=True, help="ECS Cluster ARN")
@@ -127,14 +297,37 @@ def main():
     parser.add_argument("--subnets", required=True, help="Comma-separated list of subnet IDs")
     parser.add_argument("--security-groups", required=True, help="Comma-separated list of security group IDs")
     parser.add_argument("--vpc-id", help="VPC ID (optional)")
+    parser.add_argument("--shards", type=int, default=1, help="Split the golden sets across this many tasks (default: 1)")
+    parser.add_argument("--results-bucket", help="Bucket with the shard reports (default: RESULTS_BUCKET of the task definition)")
 
     args = parser.parse_args()
+    if not 1 <= args.shards <= 100:
+        parser.error("--shards must be between 1 and 100")
 
     subnets = args.subnets.split(',')
     security_groups = args.security_groups.split(',')
 
+    if args.shards > 1:
+        start = time.monotonic()
+        task_arns = run_sharded_tasks(args.cluster, args.task_def, subnets, security_groups, args.vpc_id, args.shards)
+        try:
+            wait_for_task_completion(args.cluster, task_arns)
+        except SystemExit:
+            # One shard failed (or the wait timed out): the others would only produce a report nobody merges
+            stop_tasks(args.cluster, task_arns, "Sharded evaluation failed")
+            raise
+        bucket = args.results_bucket or get_task_container(args.task_def)[1].get('RESULTS_BUCKET')
+        if not bucket:
+            logger.error("❌ No results bucket: pass --results-bucket or set RESULTS_BUCKET in the task definition.")
+            sys.exit(1)
+        merged_id = merge_shard_reports(bucket, task_arns)
+        logger.info(f"⏱️ Sharded evaluation finished in {time.monotonic() - start:.0f}s")
+        # The merged report ID takes the place of the task ID for check_eval_results.py
+        print(merged_id)
+        return
+
     task_arn = run_fargate_task(args.cluster, args.task_def, subnets, security_groups, args.vpc_id)
-    wait_for_task_completion(args.cluster, task_arn)
+    wait_for_task_completion(args.cluster, [task_arn])
     
     # Print task ARN at the end so it can be captured by other scripts/tools
     print(task_arn)
@@ -1,13 +1,106 @@
 import os
 import sys
+import json
 import boto3
+import hashlib
+import argparse
 import mimetypes
 from pathlib import Path
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 
-def sync_to_s3(source_dir, bucket_name, target_prefix=""):
+# Multipart settings; local ETags are computed with the same part size so they match S3
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+
+def compute_etag(file_path, threshold=MULTIPART_THRESHOLD, chunk_size=MULTIPART_CHUNKSIZE):
+    """
+    Computes the ETag S3 assigns to a file uploaded with the given multipart settings:
+    the MD5 for single-part uploads, MD5-of-part-MD5s plus "-<parts>" for multipart ones.
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        if size < threshold:
+            return hashlib.md5(f.read()).hexdigest()
+        digests = [hashlib.md5(chunk).digest() for chunk in iter(lambda: f.read(chunk_size), b'')]
+    return f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+
+def load_manifest(manifest_path):
+    """
+    Loads the manifest of a previous run ({} when missing or unreadable).
+    """
+    if not manifest_path or not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️  Ignoring unreadable manifest {manifest_path}: {e}")
+        return {}
+
+def scan_local(source_path, target_prefix, previous):
+    """
+    Lists local files with their S3 key, size and ETag. Hashing is skipped for files whose
+    size and mtime match the previous manifest, so unchanged trees are scanned in milliseconds.
+    """
+    cached = previous.get('files', {})
+    files = {}
+    for file_path in source_path.rglob('*'):
+        if not file_path.is_file():
+            continue
+        # Create the S3 key (relative path from the source directory)
+        s3_key = f"{target_prefix}{file_path.relative_to(source_path).as_posix()}"
+        stat = file_path.stat()
+        entry = cached.get(s3_key, {})
+        if entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+            etag = entry['etag']
+        else:
+            etag = compute_etag(file_path)
+        files[s3_key] = {'path': str(file_path), 'size': stat.st_size, 'mtime': stat.st_mtime, 'etag': etag}
+    return files
+
+def list_remote(s3, bucket_name, target_prefix):
+    """
+    Lists the objects under the prefix as {key: {'etag', 'size'}}.
+    """
+    remote = {}
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket_name, Prefix=target_prefix):
+        for obj in page.get('Contents', []):
+            remote[obj['Key']] = {'etag': obj['ETag'].strip('"'), 'size': obj['Size']}
+    return remote
+
+def upload(s3, bucket_name, s3_key, file_path, transfer_config):
+    """
+    Uploads one file with its detected content type (helps Bedrock parse files correctly).
+    """
+    content_type, _ = mimetypes.guess_type(file_path)
+    extra_args = {'ContentType': content_type} if content_type else {}
+    s3.upload_file(Filename=file_path, Bucket=bucket_name, Key=s3_key, ExtraArgs=extra_args, Config=transfer_config)
+
+def delete_keys(s3, bucket_name, keys):
+    """
+    Deletes stale objects in batches of 1000; returns the number of failed deletions.
+    """
+    failed = 0
+    for i in range(0, len(keys), 1000):
+        response = s3.delete_objects(
+            Bucket=bucket_name,
+            Delete={'Objects': [{'Key': k} for k in keys[i:i + 1000]], 'Quiet': True}
+        )
+        for error in response.get('Errors', []):
+            print(f"  ⚠️  Failed to delete {error['Key']}: {error.get('Message')}")
+            failed += 1
+    return failed
+
+def sync_to_s3(source_dir, bucket_name, target_prefix="", workers=8, delete=False, manifest_path=None, dry_run=False):
     """
-    Syncs a local directory to an S3 bucket using boto3.
+    Incrementally syncs a local directory to an S3 bucket using boto3.
+
+    Only files whose ETag differs from the object in S3 are uploaded (in parallel); with
+    delete=True objects under the prefix that no longer exist locally are removed. The
+    manifest records every file plus the keys changed and deleted by this run.
     """
     s3 = boto3.client('s3')
     
@@ -30,40 +123,69 @@ def sync_to_s3(source_dir, bucket_name, target_prefix=""):
 
     print(f"🚀 Starting sync: {source_path} ➔ s3://{bucket_name}/{target_prefix}")
 
-    # 2. Sync logic
-    files_uploaded = 0
-    for file_path in source_path.rglob('*'):
-        if file_path.is_file():
-            # Create the S3 key (relative path from the source directory)
-            rel_path = str(file_path.relative_to(source_path))
-            s3_key = f"{target_prefix}{rel_path}"
-            
-            # Detect content type (helps Bedrock parse files correctly)
-            content_type, _ = mimetypes.guess_type(str(file_path))
-            extra_args = {'ContentType': content_type} if content_type else {}
+    # 2. Diff local files against S3
+    local = scan_local(source_path, target_prefix, load_manifest(manifest_path))
+    remote = list_remote(s3, bucket_name, target_prefix)
+    changed = sorted(k for k, f in local.items() if remote.get(k, {}).get('etag') != f['etag'])
+    stale = sorted(k for k in remote if k not in local) if delete else []
+    print(f"🔍 {len(local)} local files, {len(remote)} remote objects: {len(changed)} to upload, {len(stale)} to delete")
 
+    if dry_run:
+        for key in changed:
+            print(f"  Would upload: {key}")
+        for key in stale:
+            print(f"  Would delete: {key}")
+        return
+
+    # 3. Upload changed files in parallel
+    transfer_config = TransferConfig(
+        multipart_threshold=MULTIPART_THRESHOLD,
+        multipart_chunksize=MULTIPART_CHUNKSIZE,
+        max_concurrency=4
+    )
+    uploaded, failed = [], []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(upload, s3, bucket_name, key, local[key]['path'], transfer_config): key for key in changed}
+        for future in as_completed(futures):
+            key = futures[future]
             try:
-                print(f"Uploading: {s3_key}")
-                s3.upload_file(
-                    Filename=str(file_path),
-                    Bucket=bucket_name,
-                    Key=s3_key,
-                    ExtraArgs=extra_args
-                )
-                files_uploaded += 1
+                future.result()
+                print(f"Uploaded: {key}")
+                uploaded.append(key)
             except Exception as e:
-                print(f"  ⚠️  Failed to upload {s3_key}: {e}")
+                print(f"  ⚠️  Failed to upload {key}: {e}")
+                failed.append(key)
 
-    print(f"✅ Sync complete. {files_uploaded} files uploaded to {bucket_name} under prefix '{target_prefix}'.")
+    # 4. Prune objects removed locally
+    delete_failures = delete_keys(s3, bucket_name, stale) if stale else 0
 
-if __name__ == "__main__":
-    # Check for arguments passed from GitHub Action
-    if len(sys.argv) < 3:
-        print("Usage: python sync_data.py <source_dir> <bucket_name> [target_prefix]")
-        sys.exit(1)
+    # 5. Manifest (failed uploads are left out so the next run retries them)
+    if manifest_path:
+        manifest = {
+            'bucket': bucket_name,
+            'prefix': target_prefix,
+            'synced_at': datetime.now(timezone.utc).isoformat(),
+            'changed': sorted(uploaded),
+            'deleted': stale if not delete_failures else [],
+            'files': {k: {kk: f[kk] for kk in ('size', 'mtime', 'etag')} for k, f in local.items() if k not in failed},
+        }
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        print(f"📝 Manifest written to {manifest_path}")
+
+    print(f"✅ Sync complete. {len(uploaded)} files uploaded, {len(local) - len(changed)} unchanged, "
+          f"{len(stale) - delete_failures} deleted in {bucket_name} under prefix '{target_prefix}'.")
 
-    target_dir = sys.argv[1]
-    target_bucket = sys.argv[2]
-    prefix = sys.argv[3] if len(sys.argv) > 3 else ""
+if __name__ == "__main__":
+    # Arguments are passed positionally from the GitHub Action
+    parser = argparse.ArgumentParser(description="Incrementally sync a local directory to S3")
+    parser.add_argument("source_dir", help="Local directory to upload")
+    parser.add_argument("bucket_name", help="Target S3 bucket")
+    parser.add_argument("target_prefix", nargs="?", default="", help="Optional key prefix")
+    parser.add_argument("--workers", type=int, default=8, help="Parallel uploads (default: 8)")
+    parser.add_argument("--delete", action="store_true", help="Delete objects under the prefix that no longer exist locally")
+    parser.add_argument("--manifest", help="Manifest path: reused to skip re-hashing unchanged files and rewritten with the changed/deleted keys")
+    parser.add_argument("--dry-run", action="store_true", help="Only print what would be uploaded or deleted")
+    args = parser.parse_args()
 
-    sync_to_s3(target_dir, target_bucket, prefix)
\ No newline at end of file
+    sync_to_s3(args.source_dir, args.bucket_name, args.target_prefix, args.workers, args.delete, args.manifest, args.dry_run)
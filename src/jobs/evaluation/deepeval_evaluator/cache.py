@@ -0,0 +1,114 @@
+import json
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """
+    Content-addressed, size-bounded LRU cache persisted as a single JSON file.
+    Safe to share between worker threads; optionally mirrored to S3 between runs.
+    In S3 every shard writes its own object under s3_prefix and loading merges them all,
+    so concurrent shards never overwrite each other's entries.
+    """
+    def __init__(self, path, max_entries=10000, s3=None, bucket=None, s3_prefix=None, shard=0, refresh=False):
+        self.path = path
+        self.max_entries = max_entries
+        # Refresh mode: ignore stored entries but still record fresh ones
+        self.refresh = refresh
+        self.s3, self.bucket, self.s3_prefix = s3, bucket, s3_prefix
+        self.s3_key = f"{s3_prefix}shard-{shard}.json"
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Hashes the given parts into a stable cache key."""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Returns the cached value (refreshing its recency) or None on a miss."""
+        with self.lock:
+            if key in self.entries and not self.refresh:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Stores a value, evicting the least recently used entries beyond max_entries."""
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def load(self):
+        """
+        Loads the local file, then merges every shard object from S3 (if configured),
+        oldest first so the most recently written entries count as most recently used.
+        Missing caches start empty.
+        """
+        self._merge_file(self.path)
+        if not (self.s3 and self.bucket):
+            return
+        try:
+            keys = self.s3.list_keys(self.bucket, self.s3_prefix)
+        except Exception as e:
+            logger.info(f"No remote cache at s3://{self.bucket}/{self.s3_prefix}: {e}")
+            return
+        download_path = f"{self.path}.download"
+        for key in keys:
+            try:
+                self.s3.download_file(self.bucket, key, download_path)
+                self._merge_file(download_path)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not load cache s3://{self.bucket}/{key}: {e}")
+            finally:
+                if os.path.exists(download_path):
+                    os.remove(download_path)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        logger.info(f"📦 Cache holds {len(self.entries)} entries after merging {len(keys)} remote object(s)")
+
+    def _merge_file(self, path):
+        """Merges entries from a cache file into memory; missing or unreadable files are skipped."""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                loaded = json.load(f)
+        except Exception as e:
+            logger.warning(f"⚠️ Ignoring unreadable cache {path}: {e}")
+            return
+        for key, value in loaded.items():
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+        logger.info(f"📦 Loaded {len(loaded)} cache entries from {path}")
+
+    def save(self):
+        """Writes entries to the local file and mirrors them to S3 if configured."""
+        with self.lock:
+            snapshot = OrderedDict(self.entries)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        if self.s3 and self.bucket:
+            self.s3.upload_json(self.bucket, self.s3_key, snapshot)
+
+    def stats(self):
+        """Hit/miss counters for the final report."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.entries),
+            "refresh": self.refresh
+        }
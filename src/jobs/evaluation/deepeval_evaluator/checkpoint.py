@@ -0,0 +1,91 @@
+import json
+import os
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class Checkpoint:
+    """
+    Append-only JSONL log of finished work for one evaluation run.
+    Agent outputs and metric results are written as each case completes and the
+    file is periodically mirrored to S3, so an interrupted run can be resumed.
+    Entries are keyed by (test set, row index): several rows may share an input.
+    """
+    def __init__(self, run_id, s3, bucket, local_dir="/tmp/checkpoints", flush_every=10):
+        self.run_id = run_id
+        self.s3 = s3
+        self.bucket = bucket
+        self.s3_key = f"checkpoints/{run_id}.jsonl"
+        self.path = os.path.join(local_dir, f"{run_id}.jsonl")
+        self.flush_every = flush_every
+        self.agent_outputs = {}
+        self.results = {}
+        self._pending = 0
+        self.lock = threading.Lock()
+        os.makedirs(local_dir, exist_ok=True)
+
+    def load(self):
+        """Restores a previous run's log from S3 (falling back to the local file)."""
+        try:
+            self.s3.download_file(self.bucket, self.s3_key, self.path)
+        except Exception as e:
+            logger.info(f"No remote checkpoint at s3://{self.bucket}/{self.s3_key}: {e}")
+        if not os.path.exists(self.path):
+            logger.warning(f"⚠️ No checkpoint found for run {self.run_id}. Starting from scratch.")
+            return
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may be torn if the task died mid-write
+                    continue
+                if entry.get("case_index") is None:
+                    # Written before entries carried their row index; cannot be matched to a row
+                    continue
+                key = (entry["test_set"], entry["case_index"])
+                if entry["kind"] == "agent":
+                    self.agent_outputs[key] = entry
+                elif entry["kind"] == "result":
+                    self.results[key] = entry
+        logger.info(f"♻️ Resuming run {self.run_id}: {len(self.results)} judged, {len(self.agent_outputs)} agent outputs")
+
+    def record_agent(self, test_set, case_index, input_text, actual_output, retrieval_context, trace=None):
+        """Checkpoints an agent answer (and its trace timeline) so a resumed run does not re-invoke the agent."""
+        self._append({
+            "kind": "agent",
+            "test_set": test_set,
+            "case_index": case_index,
+            "input": input_text,
+            "actual_output": actual_output,
+            "retrieval_context": retrieval_context,
+            "trace": trace
+        })
+
+    def record_result(self, test_set, detail):
+        """Checkpoints a judged case (an entry of detailed_results, carrying its case_index)."""
+        self._append({"kind": "result", "test_set": test_set, **detail})
+
+    def _append(self, entry):
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._pending += 1
+            should_flush = self._pending >= self.flush_every
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """Mirrors the local log to S3. Failures are logged; the local file stays authoritative."""
+        with self.lock:
+            self._pending = 0
+            if not os.path.exists(self.path):
+                return
+            try:
+                self.s3.upload_file(self.path, self.bucket, self.s3_key)
+            except Exception as e:
+                logger.warning(f"⚠️ Checkpoint flush failed: {e}")
@@ -1,6 +1,7 @@
 import sys
 import os
 import logging
+import datetime
 from dotenv import load_dotenv
 
 # Initialize logger
@@ -11,7 +12,7 @@ load_dotenv()
 
 class EvaluatorConfig:
     """Manages environment variables and configuration."""
-    def __init__(self, test_set=None, debug=False):
+    def __init__(self, test_set=None, debug=False, refresh=False, resume=None, shard_index=None, shard_count=None):
         self.agent_id = os.getenv("AGENT_ID")
         self.agent_alias_id = os.getenv("AGENT_ALIAS_ID")
         self.eval_data_bucket = os.getenv("EVAL_DATA_BUCKET")
@@ -21,6 +22,46 @@ class EvaluatorConfig:
         self.region = os.getenv("AWS_REGION", "us-east-1")
         self.task_arn = os.getenv("TASK_ARN")
         
+        # Agent invocation throughput: worker count and shared requests-per-minute budget
+        self.agent_concurrency = int(os.getenv("AGENT_CONCURRENCY", "0")) or None
+        self.agent_rpm = float(os.getenv("AGENT_RPM", "60"))
+        # Adaptive limiters start at *_RPM and probe upwards to *_MAX_RPM until throttled
+        self.agent_max_rpm = float(os.getenv("AGENT_MAX_RPM", "0")) or self.agent_rpm * 2
+        
+        # Judge throughput: max in-flight async judge calls; optional canned reply for offline runs
+        self.judge_concurrency = int(os.getenv("JUDGE_CONCURRENCY", "8"))
+        self.judge_mock_response = os.getenv("JUDGE_MOCK_RESPONSE")
+        self.judge_rpm = float(os.getenv("JUDGE_RPM", "100"))
+        self.judge_max_rpm = float(os.getenv("JUDGE_MAX_RPM", "0")) or self.judge_rpm * 2
+        # Cases per DeepEval run; 0 evaluates each test set in a single batch
+        self.judge_batch_size = int(os.getenv("JUDGE_BATCH_SIZE", "0"))
+        # Test sets processed concurrently; 0 runs every selected set at once
+        self.test_set_concurrency = int(os.getenv("TEST_SET_CONCURRENCY", "0"))
+        # Max generated cases waiting for the judge before agent workers block
+        self.pipeline_queue_size = int(os.getenv("PIPELINE_QUEUE_SIZE", "32"))
+        
+        # Judge response cache: local file (empty disables), LRU bound and optional S3 mirror
+        self.judge_cache_path = os.getenv("JUDGE_CACHE_PATH")
+        self.cache_max_entries = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+        self.cache_s3_sync = os.getenv("CACHE_S3_SYNC", "False").lower() in ("true", "1", "t")
+        
+        # Agent response cache: reuse answers while alias version and KB ingestion are unchanged
+        self.agent_cache_path = os.getenv("AGENT_CACHE_PATH")
+        self.refresh = refresh
+        
+        # Checkpointing: resume a previous run ID, otherwise start a new one
+        self.run_id = resume or datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + "-" + os.urandom(3).hex()
+        self.resume = resume is not None
+        self.checkpoint_flush_every = int(os.getenv("CHECKPOINT_FLUSH_EVERY", "10"))
+        
+        # Sharding: this task evaluates every shard_count-th row of each test set, starting at shard_index
+        self.shard_index = shard_index if shard_index is not None else int(os.getenv("SHARD_INDEX", "0"))
+        self.shard_count = shard_count if shard_count is not None else int(os.getenv("SHARD_COUNT", "1"))
+        if self.shard_count < 1 or not 0 <= self.shard_index < self.shard_count:
+            raise ValueError(f"Invalid shard {self.shard_index} of {self.shard_count}")
+        if self.shard_count > 1:
+            logger.info(f"🧩 Running shard {self.shard_index + 1} of {self.shard_count}")
+        
         # Priority: CLI flag > Env Var > Default False
         env_debug = os.getenv("DEBUG", "False").lower() in ("true", "1", "t")
         self.debug = debug or env_debug
@@ -56,6 +97,10 @@ def main():
     parser = argparse.ArgumentParser(description="DeepEval Evaluator CLI")
     parser.add_argument("--test-set", help="Filename of the specific golden dataset to execute (e.g. golden_set_happy_path.jsonl)")
     parser.add_argument("--debug", action="store_true", help="Enable debug logging for LLM judge")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached agent responses and re-invoke the agent (results are re-cached)")
+    parser.add_argument("--resume", metavar="RUN_ID", help="Resume an interrupted run, skipping cases already checkpointed")
+    parser.add_argument("--shard-index", type=int, help="Zero-based shard evaluated by this task (default: SHARD_INDEX or 0)")
+    parser.add_argument("--shard-count", type=int, help="Total number of shards (default: SHARD_COUNT or 1)")
     args = parser.parse_args()
 
     # Configure logging
@@ -66,8 +111,15 @@ def main():
     )
 
     from runner import DeepEvalRunner
-    cfg = EvaluatorConfig(test_set=args.test_set, debug=args.debug)
     try:
+        cfg = EvaluatorConfig(
+            test_set=args.test_set,
+            debug=args.debug,
+            refresh=args.refresh,
+            resume=args.resume,
+            shard_index=args.shard_index,
+            shard_count=args.shard_count
+        )
         cfg.validate()
         DeepEvalRunner(cfg).run()
     except Exception as e:
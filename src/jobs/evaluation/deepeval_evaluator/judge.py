@@ -1,8 +1,11 @@
 import litellm
+import asyncio
+import weakref
 import re
 import json
 import logging
 from deepeval.models.base_model import DeepEvalBaseLLM
+from utils import is_throttling_error
 
 logger = logging.getLogger(__name__)
 
@@ -11,22 +14,35 @@ class BedrockJudge(DeepEvalBaseLLM):
     LLM-as-a-judge implementation for DeepEval using Amazon Bedrock via LiteLLM.
     Includes robust JSON cleaning to handle models that output preamble or markdown blocks.
     """
-    def __init__(self, model_name, debug=False):
+    def __init__(self, model_name, debug=False, max_concurrency=8, mock_response=None, rate_limiter=None, cache=None):
         # Using the 'bedrock/' prefix for LiteLLM compatibility
         self.model_name = f"bedrock/us.{model_name}"
         self.debug = debug
+        self.max_concurrency = max_concurrency
+        # LiteLLM's built-in fake backend: when set, no request leaves the process
+        self.mock_response = mock_response
+        # Optional AdaptiveRateLimiter shared by every judge call of the run
+        self.rate_limiter = rate_limiter
+        # Optional ResponseCache of parsed verdicts (temperature=0 makes them reusable)
+        self.cache = cache
+        self.max_tokens = 1000
+        self._semaphores = weakref.WeakKeyDictionary()
     
     def load_model(self):
         """Returns the judge instance as required by DeepEval."""
         return self
 
-    def _extract_json(self, text: str) -> str:
+    def _extract_json(self, text: str):
+        """
+        Returns (json_text, parsed). parsed is False when the output could not be read
+        and a placeholder verdict was substituted, which must never be cached.
+        """
         # Clean Markdown and find the JSON boundaries
         text = re.sub(r"```json\s*|```", "", text).strip()
         start, end = text.find('{'), text.rfind('}') + 1
         
         if start == -1 or end == 0:
-            return json.dumps({"verdicts": [], "score": 0, "reason": "No JSON found"})
+            return json.dumps({"verdicts": [], "score": 0, "reason": "No JSON found"}), False
 
         try:
             # Parse the JSON
@@ -36,34 +52,97 @@ class BedrockJudge(DeepEvalBaseLLM):
             if "verdicts" not in data:
                 data["verdicts"] = [data.get("reason", "Missing verdicts")]
                 
-            return json.dumps(data)
+            return json.dumps(data), True
         except Exception:
             # Fallback to satisfy DeepEval's expected keys
-            return json.dumps({"verdicts": [], "score": 0, "reason": "Invalid JSON format"})
+            return json.dumps({"verdicts": [], "score": 0, "reason": "Invalid JSON format"}), False
         
+    def _completion_kwargs(self, prompt: str) -> dict:
+        """Builds the LiteLLM request shared by the sync and async paths."""
+        kwargs = {
+            "model": self.model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0,
+            "max_tokens": self.max_tokens,
+        }
+        if self.mock_response is not None:
+            kwargs["mock_response"] = self.mock_response
+        return kwargs
+
+    def _parse_response(self, res):
+        raw_content = res.choices[0].message.content
+        if self.debug:
+            logger.debug(f"Raw Judge Output: {raw_content}")
+        return self._extract_json(raw_content)
+
+    def _cache_key(self, prompt: str) -> str:
+        return self.cache.make_key(self.model_name, prompt, self.max_tokens)
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """
+        Returns the in-flight limiter for the running event loop.
+        DeepEval may spin up a new loop per evaluate() call (and per thread),
+        and a semaphore cannot be shared across loops.
+        """
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[loop]
+
     def generate(self, prompt: str) -> str:
         """
         Synchronous generation call. 
         Uses temperature=0 for deterministic evaluation results.
         """
+        if self.cache and (cached := self.cache.get(self._cache_key(prompt))) is not None:
+            return cached
+
         logging.getLogger("LiteLLM").setLevel(logging.WARNING)
-        res = litellm.completion(
-            model=self.model_name, 
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-            max_tokens=1000,
-        )
-        
-        raw_content = res.choices[0].message.content
-        if self.debug:
-            logger.debug(f"Raw Judge Output: {raw_content}")
-        return self._extract_json(raw_content)
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        try:
+            res = litellm.completion(**self._completion_kwargs(prompt))
+        except Exception as e:
+            self._report_error(e)
+            raise
+        self._report_success()
+        return self._store(prompt, *self._parse_response(res))
 
     async def a_generate(self, prompt: str) -> str:
         """
         Asynchronous generation call for parallel evaluation.
+        Uses litellm.acompletion so metrics overlap on the event loop,
+        capped at `max_concurrency` in-flight judge calls.
         """
-        return self.generate(prompt)
+        if self.cache and (cached := self.cache.get(self._cache_key(prompt))) is not None:
+            return cached
+
+        logging.getLogger("LiteLLM").setLevel(logging.WARNING)
+        async with self._get_semaphore():
+            if self.rate_limiter:
+                await self.rate_limiter.a_acquire()
+            try:
+                res = await litellm.acompletion(**self._completion_kwargs(prompt))
+            except Exception as e:
+                self._report_error(e)
+                raise
+        self._report_success()
+        return self._store(prompt, *self._parse_response(res))
+
+    def _report_success(self):
+        if self.rate_limiter:
+            self.rate_limiter.on_success()
+
+    def _report_error(self, error):
+        """Feeds throttling back into the shared limiter so every judge call slows down."""
+        if self.rate_limiter and is_throttling_error(error):
+            self.rate_limiter.on_throttle()
+
+    def _store(self, prompt: str, result: str, parsed: bool) -> str:
+        # Placeholder verdicts for unreadable output would otherwise score 0 on every later run
+        if self.cache and parsed:
+            self.cache.put(self._cache_key(prompt), result)
+        return result
 
     def get_model_name(self):
         """Returns the formatted model name."""
@@ -4,31 +4,62 @@ import datetime
 import logging
 import urllib.request
 import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from deepeval.test_case import LLMTestCase
 from deepeval.metrics import FaithfulnessMetric, AnswerRelevancyMetric, ContextualPrecisionMetric, ContextualRecallMetric
 from deepeval import evaluate
-from deepeval.evaluate import AsyncConfig
+from deepeval.evaluate import AsyncConfig, ErrorConfig
 from deepeval.metrics import GEval
 
 from evaluator import EvaluatorConfig
-from services import S3Service, AgentClient
+from services import S3Service, AgentClient, summarize_traces
 from judge import BedrockJudge
+from cache import ResponseCache
+from checkpoint import Checkpoint
 from deepeval.test_case import LLMTestCaseParams
-from utils import retry_with_backoff
+from utils import retry_with_backoff, is_throttling_error, AdaptiveRateLimiter, RetriesExhaustedError
 
 logger = logging.getLogger(__name__)
 
 class DeepEvalRunner:
     """Orchestrates the evaluation flow."""
-    CONCURRENCY = 1
+    CONCURRENCY = 4
 
     def __init__(self, config: EvaluatorConfig):
         self.config = config
+        self.concurrency = config.agent_concurrency or self.CONCURRENCY
+        self.agent_limiter = AdaptiveRateLimiter(config.agent_rpm, max_rpm=config.agent_max_rpm, burst=self.concurrency)
         self.s3 = S3Service(config.region)
         self.agent = AgentClient(config.region)
-        self.judge = BedrockJudge(config.judge_model_id, debug=config.debug)
+        self.judge_limiter = AdaptiveRateLimiter(config.judge_rpm, max_rpm=config.judge_max_rpm, burst=config.judge_concurrency)
+        # Mocked verdicts must never be mixed with (or served in place of) real ones
+        self.judge_cache = None if config.judge_mock_response is not None else self._build_cache(config.judge_cache_path, "cache/judge/")
+        self.agent_cache = self._build_cache(config.agent_cache_path, "cache/agent/", refresh=config.refresh)
+        self.agent_fingerprint = None
+        self.judge = BedrockJudge(
+            config.judge_model_id,
+            debug=config.debug,
+            max_concurrency=config.judge_concurrency,
+            mock_response=config.judge_mock_response,
+            rate_limiter=self.judge_limiter,
+            cache=self.judge_cache
+        )
+        self.checkpoint = Checkpoint(
+            config.run_id,
+            self.s3,
+            config.results_bucket,
+            flush_every=config.checkpoint_flush_every
+        )
         self.aggregated_results = {}
         self.detailed_results = []
+        self.failures = []
+        self.traces = {}
+        # Test sets generate cases concurrently: guard shared results. DeepEval keeps one process-global
+        # test run, so evaluate() calls are serialized and judging never runs for two sets at once.
+        self.results_lock = threading.Lock()
+        self.evaluate_lock = threading.Lock()
         self._load_thresholds()
 
     def _load_thresholds(self):
@@ -46,22 +77,118 @@ class DeepEvalRunner:
             logger.error(f"🛑 Critical error loading thresholds: {e}")
             raise
 
+    def _build_cache(self, path, s3_prefix, refresh=False):
+        """
+        Creates a ResponseCache when a local path is configured, mirrored to the results bucket if enabled.
+        Each shard mirrors to its own object under s3_prefix.
+        """
+        if not path:
+            return None
+        return ResponseCache(
+            path,
+            max_entries=self.config.cache_max_entries,
+            s3=self.s3 if self.config.cache_s3_sync else None,
+            bucket=self.config.results_bucket,
+            s3_prefix=s3_prefix,
+            shard=self.config.shard_index,
+            refresh=refresh
+        )
+
+    def _caches(self):
+        """Named caches that are enabled for this run."""
+        caches = {"judge": self.judge_cache, "agent": self.agent_cache}
+        return {name: cache for name, cache in caches.items() if cache}
+
+    def _resolve_agent_fingerprint(self):
+        """
+        Pins the agent cache to the alias version and KB ingestion jobs in effect.
+        If they cannot be resolved, the agent cache is disabled rather than risking stale answers.
+        """
+        if not self.agent_cache:
+            return
+        try:
+            self.agent_fingerprint = self.agent.resolve_fingerprint(self.config.agent_id, self.config.agent_alias_id)
+            logger.info(f"📦 Agent cache fingerprint: {json.dumps(self.agent_fingerprint)}")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not resolve agent version/KB ingestion, disabling agent cache: {e}")
+            self.agent_cache = None
+
     def run(self):
         """Main execution flow across all test sets."""
-        for filename, group in self.config.test_sets.items():
-            dataset = self._download_and_load(filename)
-            if not dataset:
-                continue
+        self._resolve_agent_fingerprint()
+        for cache in self._caches().values():
+            cache.load()
+        logger.info(f"🆔 Run ID: {self.config.run_id} (resume with --resume {self.config.run_id})")
+        if self.config.resume:
+            self.checkpoint.load()
 
-            test_cases = self._generate_test_cases(filename, dataset)
-            if test_cases:
-                self._run_evaluation(filename, test_cases, group)
-            else:
-                logger.warning(f"⚠️ No successful cases for {filename}")
+        # Each test set gets its own download → agent → judge pipeline. Agent calls of all sets overlap
+        # (sharing the agent rate limiter); judge batches take turns on evaluate_lock.
+        test_sets = list(self.config.test_sets.items())
+        workers = min(self.config.test_set_concurrency or len(test_sets), len(test_sets)) or 1
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(self._run_test_set, filename, group): filename for filename, group in test_sets}
+            for future, filename in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"❌ Pipeline for {filename} failed: {e}")
+
+        # Keep the report in test-set and dataset order regardless of completion order
+        order = {filename: i for i, (filename, _) in enumerate(test_sets)}
+        self.detailed_results.sort(key=lambda d: (
+            order.get(d.get("test_set"), len(order)),
+            d.get("case_index") or 0
+        ))
+        self.checkpoint.flush()
+
+        for name, cache in self._caches().items():
+            try:
+                cache.save()
+            except Exception as e:
+                logger.warning(f"⚠️ Could not persist {name} cache: {e}")
 
         summary = self._calculate_summary()
         self._upload_reports(summary)
 
+    def _run_test_set(self, filename, group):
+        """Download → agent → judge pipeline for a single test set."""
+        dataset = self._download_and_load(filename)
+        if not dataset:
+            return
+        # Cases are identified by their row index: the same input may appear in several rows
+        rows = list(enumerate(dataset))
+        if self.config.shard_count > 1:
+            # Strided rows keep shards balanced even when a test set is ordered by difficulty
+            rows = rows[self.config.shard_index::self.config.shard_count]
+            if not rows:
+                logger.info(f"🧩 No rows of {filename} fall into this shard")
+                return
+
+        rows = self._restore_completed(filename, rows)
+        if not rows:
+            logger.info(f"♻️ All cases of {filename} restored from checkpoint")
+            return
+
+        # Producer/consumer: each case reaches the judge as soon as its agent call returns
+        case_queue = queue.Queue(maxsize=self.config.pipeline_queue_size)
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._produce_test_cases,
+            args=(filename, rows, case_queue, stop),
+            name=f"agent-{filename}",
+            daemon=True
+        )
+        producer.start()
+        try:
+            judged = self._run_evaluation(filename, self._iter_batches(case_queue), group)
+        finally:
+            # If judging failed, stop the producer: pending agent calls are cancelled and a full queue no longer blocks it
+            stop.set()
+            producer.join()
+        if not judged:
+            logger.warning(f"⚠️ No successful cases for {filename}")
+
     def _get_metrics(self, group):
         """Returns the list of metrics based on the group."""
         if group == "rag":
@@ -110,80 +237,255 @@ class DeepEvalRunner:
     @retry_with_backoff(max_retries=5, base_delay=5)
     def _invoke_with_retry(self, data, session_id):
         """Helper to isolate the agent call for the decorator."""
-        return self.agent.invoke(
-            self.config.agent_id, 
-            self.config.agent_alias_id, 
-            data["input"],
-            session_id
-        )
+        # Every attempt (including retries) draws from the shared RPM budget and reports back to it
+        self.agent_limiter.acquire()
+        try:
+            result = self.agent.invoke(
+                self.config.agent_id, 
+                self.config.agent_alias_id, 
+                data["input"],
+                session_id
+            )
+        except Exception as e:
+            if is_throttling_error(e):
+                self.agent_limiter.on_throttle()
+            raise
+        self.agent_limiter.on_success()
+        return result
+
+    def _invoke_cached(self, data):
+        """
+        Returns (full_response, retrieved_contexts, trace), served from the agent cache when possible.
+        A cached trace describes the original invocation and is flagged as such.
+        """
+        cache_key = None
+        if self.agent_cache:
+            cache_key = self.agent_cache.make_key(
+                self.config.agent_id,
+                self.config.agent_alias_id,
+                self.agent_fingerprint,
+                data["input"]
+            )
+            if (cached := self.agent_cache.get(cache_key)) is not None:
+                trace = cached[2] if len(cached) > 2 else None
+                return cached[0], cached[1], {**trace, "cached": True} if trace else None
 
-    def _generate_test_cases(self, filename, dataset):
-        cases = []
-        logger.info(f"Invoking agent for {len(dataset)} cases...")
         session_id = "eval-session-" + str(os.urandom(4).hex())
-        for data in dataset:
-            actual, contexts = self._invoke_with_retry(data, session_id)
-            cases.append(LLMTestCase(
-                input=data["input"],
-                actual_output=actual,
-                expected_output=data.get("expected_output"),
-                retrieval_context=contexts or data.get("retrieval_context", [])
-            ))
-            time.sleep(2) # Safety buffer between successful calls
-        return cases
+        result = self._invoke_with_retry(data, session_id)
+        if cache_key:
+            self.agent_cache.put(cache_key, list(result))
+        return result
+
+    def _restore_completed(self, filename, rows):
+        """Merges already-judged cases from the checkpoint and returns the (index, row) pairs still to run."""
+        remaining = []
+        for index, data in rows:
+            entry = self.checkpoint.results.get((filename, index))
+            if entry:
+                self._merge_result({
+                    "test_set": filename,
+                    "case_index": index,
+                    "input": entry["input"],
+                    "metrics": entry["metrics"],
+                    "trace": self._restored_trace(entry.get("trace"))
+                })
+            else:
+                remaining.append((index, data))
+        return remaining
+
+    @staticmethod
+    def _restored_trace(trace):
+        """Flags a checkpointed trace: it was measured by an earlier attempt, not by this run."""
+        return {**trace, "restored": True} if trace else None
+
+    def _build_test_case(self, filename, index, data):
+        """
+        Invokes the agent for one golden-set row in its own session.
+        The case is named after its row index so duplicate inputs stay distinguishable in judge results.
+        """
+        checkpointed = self.checkpoint.agent_outputs.get((filename, index))
+        if checkpointed:
+            result = (checkpointed["actual_output"], checkpointed["retrieval_context"], self._restored_trace(checkpointed.get("trace")))
+        else:
+            try:
+                result = self._invoke_cached(data)
+            except Exception as e:
+                self._record_failure(filename, index, data["input"], "agent", e)
+                return None
+            self.checkpoint.record_agent(filename, index, data["input"], *result)
+
+        actual, contexts, trace = result
+        if trace:
+            with self.results_lock:
+                self.traces[(filename, index)] = trace
+        return LLMTestCase(
+            name=f"{filename}#{index}",
+            input=data["input"],
+            actual_output=actual,
+            expected_output=data.get("expected_output"),
+            retrieval_context=contexts or data.get("retrieval_context", []),
+            metadata={"case_index": index}
+        )
+
+    def _produce_test_cases(self, filename, rows, case_queue, stop):
+        """
+        Invokes the agent through a bounded worker pool and queues each case as it completes.
+        A trailing None tells the judge stage that generation is finished. Once `stop` is set
+        (the judge stage is gone) calls that have not started are cancelled and nothing more is queued.
+        """
+        logger.info(f"Invoking agent for {len(rows)} cases ({self.concurrency} workers, {self.config.agent_rpm:g} RPM)...")
+        pool = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            futures = [pool.submit(self._build_test_case, filename, index, data) for index, data in rows]
+            for future in as_completed(futures):
+                if stop.is_set():
+                    logger.warning(f"⚠️ Judge stage for {filename} stopped; cancelling remaining agent calls")
+                    break
+                case = future.result()
+                if case is not None:
+                    self._put_until_stopped(case_queue, case, stop)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            self._put_until_stopped(case_queue, None, stop)
+
+    @staticmethod
+    def _put_until_stopped(case_queue, item, stop):
+        """Queues an item, giving up once `stop` is set so a full queue cannot block the producer forever."""
+        while not stop.is_set():
+            try:
+                case_queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _iter_batches(self, case_queue):
+        """
+        Yields judge batches from the queue: waits for one case, then takes whatever else
+        is ready (up to JUDGE_BATCH_SIZE), so judging starts before generation ends.
+        """
+        batch_size = self.config.judge_batch_size
+        done = False
+        while not done:
+            case = case_queue.get()
+            if case is None:
+                return
+            batch = [case]
+            while not batch_size or len(batch) < batch_size:
+                try:
+                    case = case_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if case is None:
+                    done = True
+                    break
+                batch.append(case)
+            yield batch
+
+    def _async_config(self):
+        """Metric concurrency shared by batch and single-case judging; the judge rate limiter paces the calls."""
+        return AsyncConfig(max_concurrent=self.config.judge_concurrency, run_async=True)
 
     @retry_with_backoff(max_retries=5, base_delay=10)
     def _evaluate_single_case(self, case, metrics):
-        """Helper to isolate the judge call for the decorator."""
-        return evaluate([case], metrics, async_config=AsyncConfig(max_concurrent=1, run_async=False))
+        """Helper to isolate the judge call for the decorator; metric errors raise so the case is retried."""
+        with self.evaluate_lock:
+            return evaluate([case], metrics, async_config=self._async_config())
 
-    def _run_evaluation(self, filename, test_cases, group):
-        """Runs the evaluation with DeepSeek-optimized pacing (100 RPM)."""
+    def _evaluate_batch(self, cases, metrics):
+        """
+        Evaluates a chunk of cases in one DeepEval run.
+        Metric errors are recorded per case instead of aborting the whole batch.
+        DeepEval keeps a process-global test run, so batches from different
+        test sets take turns (use JUDGE_BATCH_SIZE to interleave them).
+        """
+        with self.evaluate_lock:
+            return evaluate(
+                cases,
+                metrics,
+                async_config=self._async_config(),
+                error_config=ErrorConfig(ignore_errors=True)
+            )
+
+    def _run_evaluation(self, filename, batches, group):
+        """
+        Judges batches as they arrive; judge pacing comes from the shared judge rate limiter.
+        Returns the number of cases recorded.
+        """
         metrics = self._get_metrics(group)
+        judged = 0
         
-        # PACING CALCULATION:
-        # 100 RPM / 4 metrics per case = 25 cases per minute max.
-        # 60 seconds / 25 cases = 2.4 seconds per case.
-        pacing_delay = 3 # 3s delay ensures we stay under ~80 RPM
-        
-        logger.info(f"🚀 Starting DeepSeek Evaluation ({len(test_cases)} cases, Pacing: {pacing_delay}s)...")
-
-        for i, case in enumerate(test_cases):
-            logger.info(f"🎯 Evaluating case #{i+1}/{len(test_cases)}")
-            
-            # This uses the high-throughput decorator
-            results = self._evaluate_single_case(case, metrics)
-            
-            if results and results.test_results:
-                test_result = results.test_results[0]
-                
-                # Aggregation logic
-                for m_data in test_result.metrics_data:
-                    name = m_data.name
-                    if name not in self.aggregated_results:
-                        self.aggregated_results[name] = []
-                    self.aggregated_results[name].append(m_data.score)
-                
-                # Detailed results
-                self.detailed_results.append({
-                    "input": test_result.input,
-                    "metrics": [
-                        {"name": m.name, "score": m.score, "reason": m.reason or "N/A"} 
-                        for m in test_result.metrics_data
-                    ]
-                })
+        logger.info(f"🚀 Starting Evaluation for {filename} ({self.config.judge_rpm:g} judge RPM)...")
+
+        for batch in batches:
+            logger.info(f"🎯 Evaluating {len(batch)} cases of {filename} ({judged} done)")
+            results = self._evaluate_batch(batch, metrics)
+            cases_by_name = {case.name: case for case in batch}
 
-            # SMART PACING
-            # With 100 RPM, we only need a tiny breather between cases.
-            if i < len(test_cases) - 1:
-                time.sleep(pacing_delay)
+            for test_result in results.test_results:
+                case = cases_by_name[test_result.name]
+                metrics_data = test_result.metrics_data or []
+                if not metrics_data or any(m.error for m in metrics_data):
+                    # Throttled, failed or missing metrics: retry this case alone, not the batch
+                    logger.warning(f"⚠️ Metric error for input '{test_result.input[:80]}'. Retrying case individually...")
+                    try:
+                        retried = self._evaluate_single_case(case, metrics)
+                    except Exception as e:
+                        self._record_failure(filename, case.metadata["case_index"], test_result.input, "judge", e)
+                        continue
+                    test_result = retried.test_results[0]
+                self._record_result(filename, case.metadata["case_index"], test_result)
+                judged += 1
 
         logger.info(f"✅ Evaluation complete for {filename}")
+        return judged
+
+    def _record_result(self, filename, index, test_result):
+        """Checkpoints one judged case and adds it to the aggregated and detailed results."""
+        detail = {
+            "test_set": filename,
+            "case_index": index,
+            "input": test_result.input,
+            "metrics": [
+                {"name": m.name, "score": m.score, "reason": m.reason or "N/A"} 
+                for m in test_result.metrics_data or []
+            ],
+            "trace": self.traces.get((filename, index))
+        }
+        self.checkpoint.record_result(filename, detail)
+        self._merge_result(detail)
+
+    def _record_failure(self, filename, index, input_text, stage, error):
+        """Keeps cases that could not be completed visible in the report instead of silently dropping them."""
+        kind = "retries_exhausted" if isinstance(error, RetriesExhaustedError) else "error"
+        logger.error(f"❌ {stage} {kind} for input '{input_text[:80]}': {error}")
+        with self.results_lock:
+            self.failures.append({
+                "test_set": filename,
+                "case_index": index,
+                "input": input_text,
+                "stage": stage,
+                "reason": kind,
+                "error": str(error)
+            })
+
+    def _merge_result(self, detail):
+        """Adds a detailed result (fresh or restored) to the aggregates."""
+        with self.results_lock:
+            for m in detail["metrics"]:
+                name = m["name"]
+                if name not in self.aggregated_results:
+                    self.aggregated_results[name] = []
+                self.aggregated_results[name].append(m["score"])
+            self.detailed_results.append(detail)
         
     def _calculate_summary(self):
         """Averages scores per metric."""
         return {name: sum(scores)/len(scores) for name, scores in self.aggregated_results.items() if scores}
 
+    def _summarize_traces(self):
+        """Aggregates the per-case agent timelines of this run (see services.summarize_traces)."""
+        return summarize_traces(self.detailed_results)
+
     def _upload_reports(self, summary):
         """Uploads the final reports to S3."""
         ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -193,12 +495,24 @@ class DeepEvalRunner:
             "status": "completed",
             "timestamp": ts,
             "task_id": task_id,
+            "run_id": self.config.run_id,
             "summary_metrics": summary,
+            "cache_stats": {name: cache.stats() for name, cache in self._caches().items()},
+            "rate_limits": {"agent": self.agent_limiter.stats(), "judge": self.judge_limiter.stats()},
+            "trace_summary": self._summarize_traces(),
+            "failed_cases": self.failures,
             "detailed_results": self.detailed_results
         }
+        if self.config.shard_count > 1:
+            report["shard"] = {"index": self.config.shard_index, "count": self.config.shard_count}
         
         # Primary report path expected by GitHub Actions
         self.s3.upload_json(self.config.results_bucket, f"reports/eval-report-{task_id}.json", report)
+
+        if self.config.shard_count > 1:
+            # Shard reports are partial: run_evaluation.py merges them and publishes the history/latest copies
+            logger.info(f"✅ Shard {self.config.shard_index + 1}/{self.config.shard_count} report uploaded. Task ID: {task_id}")
+            return
         
         # Historical and latest backups
         self.s3.upload_json(self.config.results_bucket, f"results/eval_status_{ts}.json", report)
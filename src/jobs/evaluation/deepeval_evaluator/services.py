@@ -1,9 +1,15 @@
 import json
+import time
 import boto3
 import os
+import sys
 import logging
 from botocore.config import Config
 
+# The container image copies src/shared next to this module; a source checkout imports it in place
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../../shared"))
+from agent_fingerprint import resolve_fingerprint  # noqa: E402
+
 logger = logging.getLogger(__name__)
 
 class S3Service:
@@ -14,6 +20,16 @@ class S3Service:
     def download_file(self, bucket, key, local_path):
         self.s3.download_file(bucket, key, local_path)
 
+    def upload_file(self, local_path, bucket, key):
+        self.s3.upload_file(local_path, bucket, key)
+
+    def list_keys(self, bucket, prefix):
+        """Returns the keys under prefix, oldest first."""
+        objects = []
+        for page in self.s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+            objects.extend(page.get("Contents", []))
+        return [obj["Key"] for obj in sorted(objects, key=lambda obj: obj["LastModified"])]
+
     def upload_json(self, bucket, key, data):
         self.s3.put_object(
             Bucket=bucket,
@@ -21,20 +37,163 @@ class S3Service:
             Body=json.dumps(data, indent=2)
         )
 
+class TraceTimeline:
+    """
+    Builds a per-invocation timeline from the agent's trace stream.
+    Orchestration steps are grouped by traceId; model and KB lookup latencies come from the
+    trace metadata when Bedrock provides it, otherwise from the arrival time of the events.
+    """
+    PHASES = ("preProcessingTrace", "orchestrationTrace", "postProcessingTrace")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_chunk_ms = None
+        self.steps = {}
+        self.model_invocations = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def _elapsed_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def on_chunk(self):
+        if self.first_chunk_ms is None:
+            self.first_chunk_ms = round(self._elapsed_ms(), 1)
+
+    def on_trace(self, trace):
+        """Folds one trace event into the step (traceId) it belongs to."""
+        now = self._elapsed_ms()
+        phase = next((p for p in self.PHASES if p in trace), None)
+        if phase is None:
+            return
+        for kind, part in trace[phase].items():
+            if not isinstance(part, dict) or "traceId" not in part:
+                continue
+            step = self.steps.setdefault(part["traceId"], {
+                "phase": phase, "start": now, "end": now, "marks": {},
+                "model_ms": 0.0, "kb_lookup_ms": 0.0, "kb_lookups": 0,
+                "input_tokens": 0, "output_tokens": 0, "observation": None
+            })
+            step["end"] = now
+            step["marks"][kind] = now
+            if kind == "modelInvocationOutput":
+                self._on_model_output(step, part.get("metadata", {}), now)
+            elif kind == "observation":
+                self._on_observation(step, part, now)
+
+    def _on_model_output(self, step, metadata, now):
+        usage = metadata.get("usage", {})
+        step["model_ms"] += metadata.get("totalTimeMs") or now - step["marks"].get("modelInvocationInput", step["start"])
+        step["input_tokens"] += usage.get("inputTokens", 0)
+        step["output_tokens"] += usage.get("outputTokens", 0)
+        self.model_invocations += 1
+        self.input_tokens += usage.get("inputTokens", 0)
+        self.output_tokens += usage.get("outputTokens", 0)
+
+    def _on_observation(self, step, observation, now):
+        step["observation"] = observation.get("type")
+        if "knowledgeBaseLookupOutput" in observation:
+            metadata = observation["knowledgeBaseLookupOutput"].get("metadata", {})
+            step["kb_lookups"] += 1
+            step["kb_lookup_ms"] += metadata.get("totalTimeMs") or now - step["marks"].get("invocationInput", step["start"])
+
+    def summary(self):
+        """Returns the JSON-serialisable timeline stored with each evaluated case."""
+        steps = [
+            {
+                "trace_id": trace_id,
+                "phase": step["phase"],
+                "start_ms": round(step["start"], 1),
+                "duration_ms": round(step["end"] - step["start"], 1),
+                "model_ms": round(step["model_ms"], 1),
+                "kb_lookup_ms": round(step["kb_lookup_ms"], 1),
+                "input_tokens": step["input_tokens"],
+                "output_tokens": step["output_tokens"],
+                "observation": step["observation"]
+            }
+            for trace_id, step in sorted(self.steps.items(), key=lambda item: item[1]["start"])
+        ]
+        return {
+            "total_ms": round(self._elapsed_ms(), 1),
+            "first_chunk_ms": self.first_chunk_ms,
+            "orchestration_steps": sum(1 for s in steps if s["phase"] == "orchestrationTrace"),
+            "model_invocations": self.model_invocations,
+            "kb_lookups": sum(step["kb_lookups"] for step in self.steps.values()),
+            "kb_lookup_ms": round(sum(s["kb_lookup_ms"] for s in steps), 1),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "steps": steps
+        }
+
+def summarize_traces(detailed_results):
+    """
+    Aggregates the per-case agent timelines: latency percentiles, step counts, KB lookup time
+    and token usage, plus the slowest cases with the step that dominated each of them.
+    Used for a single run's report and again when shard reports are merged.
+    """
+    traces = [(d, d["trace"]) for d in detailed_results if d.get("trace")]
+    if not traces:
+        return {}
+
+    def percentile(values, pct):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+    def mean(key):
+        return round(sum(t[key] for _, t in traces) / len(traces), 1)
+
+    totals = [t["total_ms"] for _, t in traces]
+    slowest = sorted(traces, key=lambda item: item[1]["total_ms"], reverse=True)[:5]
+    return {
+        "cases": len(traces),
+        "cached_cases": sum(1 for _, t in traces if t.get("cached")),
+        "restored_cases": sum(1 for _, t in traces if t.get("restored")),
+        "total_ms": {"avg": mean("total_ms"), "p50": percentile(totals, 50), "p95": percentile(totals, 95), "max": max(totals)},
+        "avg_orchestration_steps": mean("orchestration_steps"),
+        "avg_model_invocations": mean("model_invocations"),
+        "avg_kb_lookup_ms": mean("kb_lookup_ms"),
+        "avg_input_tokens": mean("input_tokens"),
+        "avg_output_tokens": mean("output_tokens"),
+        "total_input_tokens": sum(t["input_tokens"] for _, t in traces),
+        "total_output_tokens": sum(t["output_tokens"] for _, t in traces),
+        "slowest_cases": [
+            {
+                "test_set": detail.get("test_set"),
+                "input": detail["input"][:120],
+                "total_ms": trace["total_ms"],
+                "slowest_step": max(trace["steps"], key=lambda s: s["duration_ms"], default=None)
+            }
+            for detail, trace in slowest
+        ]
+    }
+
 class AgentClient:
     """Manages Bedrock Agent invocation and trace processing."""
     def __init__(self, region):
-        config = Config(
-           retries = {
-              'max_attempts': 10,
-              'mode': 'adaptive'  
-           }
-        )
+        # Agent calls are retried by retry_with_backoff, paced by the AIMD limiter: botocore must neither
+        # multiply the attempts nor swallow the throttles the limiter backs off on ("total_max_attempts"
+        # includes the first attempt)
+        runtime_config = Config(retries={'mode': 'standard', 'total_max_attempts': 1})
         self.bedrock_agent_runtime = boto3.client("bedrock-agent-runtime", 
         region_name=region,
-        config=config)
+        config=runtime_config)
+        # The one-off fingerprint lookups have no retry policy of their own
+        self.bedrock_agent = boto3.client("bedrock-agent", region_name=region, config=Config(retries={'mode': 'standard'}))
+
+    def resolve_fingerprint(self, agent_id, agent_alias_id):
+        """
+        Identifies what the alias currently serves: the routed agent version and,
+        per attached knowledge base, the latest completed ingestion job ID.
+        Same implementation as the agent-invoker answer cache (src/shared/agent_fingerprint.py).
+        """
+        return resolve_fingerprint(self.bedrock_agent, agent_id, agent_alias_id)
 
     def invoke(self, agent_id, agent_alias_id, input_text, session_id):
+        """
+        Invokes the agent and returns (full_response, retrieved_contexts, timeline),
+        where timeline is the TraceTimeline summary of the invocation.
+        """
+        timeline = TraceTimeline()
         response = self.bedrock_agent_runtime.invoke_agent(
             agentId=agent_id,
             agentAliasId=agent_alias_id,
@@ -48,13 +207,15 @@ class AgentClient:
         
         for event in response['completion']:
             if 'chunk' in event:
+                timeline.on_chunk()
                 full_response += event['chunk']['bytes'].decode('utf-8')
             if 'trace' in event:
                 trace = event['trace'].get('trace', {})
+                timeline.on_trace(trace)
                 observation = trace.get('orchestrationTrace', {}).get('observation', {})
                 if 'knowledgeBaseLookupOutput' in observation:
                     references = observation['knowledgeBaseLookupOutput'].get('retrievedReferences', [])
                     for ref in references:
                         retrieved_contexts.append(ref['content']['text'])
                         
-        return full_response, retrieved_contexts
+        return full_response, retrieved_contexts, timeline.summary()
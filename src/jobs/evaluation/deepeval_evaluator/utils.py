@@ -1,34 +1,143 @@
 import time
 import functools
 import logging
+import threading
+import asyncio
+import random
+from botocore.exceptions import ClientError
+
+try:
+    from litellm.exceptions import RateLimitError
+except ImportError:
+    # The limiters and backoff work without the judge stack (e.g. in the unit tests); nothing matches ()
+    RateLimitError = ()
 
 logger = logging.getLogger(__name__)
 
-def retry_with_backoff(max_retries=5, base_delay=2, retry_exceptions=(Exception,)):
+# Error codes botocore reports when a Bedrock quota is exceeded
+THROTTLING_CODES = {"ThrottlingException", "throttlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+
+class RetriesExhaustedError(Exception):
+    """Raised when a throttled call still fails after the last retry."""
+    def __init__(self, attempts, last_error):
+        super().__init__(f"Gave up after {attempts} throttled attempts: {last_error}")
+        self.attempts = attempts
+        self.last_error = last_error
+
+def is_throttling_error(error):
+    """
+    Recognises rate limiting by exception type rather than message text:
+    botocore ClientError/EventStreamError throttling codes and LiteLLM's RateLimitError.
+    """
+    if isinstance(error, RateLimitError):
+        return True
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in THROTTLING_CODES
+    return False
+
+def retry_with_backoff(max_retries=5, base_delay=2, max_delay=60):
     """
-    Decorator optimized for 100 RPM.
-    Uses a shorter base delay and standard exponential backoff.
+    Retries throttled calls with exponential backoff and full jitter.
+    Any other error is raised immediately; exhausting the retries raises
+    RetriesExhaustedError so callers can record the failure explicitly.
     """
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            retries = 0
-            while retries < max_retries:
+            for attempt in range(1, max_retries + 1):
                 try:
                     return func(*args, **kwargs)
-                except retry_exceptions as e:
-                    error_msg = str(e).lower()
-                    
-                    if any(msg in error_msg for msg in ["throttling", "rate limit", "too many requests", "429"]):
-                        retries += 1
-                        # Wait time grows: 4s, 8s, 16s...
-                        wait_time = base_delay * (2 ** retries)
-                        
-                        logger.warning(f"⚠️ Rate Limit hit. Retrying {retries}/{max_retries} in {wait_time}s...")
-                        time.sleep(wait_time)
-                    else:
+                except Exception as e:
+                    if not is_throttling_error(e):
                         logger.error(f"❌ Non-recoverable error: {e}")
-                        raise e
-            return None
+                        raise
+                    if attempt == max_retries:
+                        raise RetriesExhaustedError(attempt, e) from e
+                    # Full jitter keeps concurrent workers from retrying in lockstep
+                    wait_time = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+                    logger.warning(f"⚠️ Rate Limit hit. Retrying {attempt}/{max_retries} in {wait_time:.1f}s...")
+                    time.sleep(wait_time)
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by concurrent workers.
+    The refill rate is expressed in requests per minute; `burst` caps how many
+    requests may start back-to-back after an idle period.
+    """
+    def __init__(self, rpm, burst=1):
+        self.rpm = rpm
+        self.rate = rpm / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _try_acquire(self):
+        """Consumes a token if available; otherwise returns the seconds until one is."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Blocks until a token is available, then consumes it."""
+        while (wait_time := self._try_acquire()) > 0:
+            time.sleep(wait_time)
+
+    async def a_acquire(self):
+        """Event-loop friendly variant of acquire()."""
+        while (wait_time := self._try_acquire()) > 0:
+            await asyncio.sleep(wait_time)
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    """
+    Token bucket whose rate is tuned by AIMD feedback shared across all callers:
+    every success adds `increase_rpm` (up to `max_rpm`), a throttle multiplies
+    the rate by `decrease_factor` (down to `min_rpm`) and drains the bucket.
+    Requests already in flight when the rate drops were sent at the old rate, so
+    throttles within `cooldown` seconds of a decrease are counted but do not cut again.
+    """
+    def __init__(self, rpm, max_rpm=None, min_rpm=1, increase_rpm=1, decrease_factor=0.5, burst=1, cooldown=5.0):
+        super().__init__(rpm, burst=burst)
+        self.max_rpm = max_rpm or rpm
+        self.min_rpm = min_rpm
+        self.increase_rpm = increase_rpm
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.decreased_at = None
+        self.successes = 0
+        self.throttles = 0
+
+    def _set_rpm(self, rpm):
+        self.rpm = rpm
+        self.rate = rpm / 60.0
+
+    def on_success(self):
+        """Additive increase."""
+        with self.lock:
+            self.successes += 1
+            self._set_rpm(min(self.max_rpm, self.rpm + self.increase_rpm))
+
+    def on_throttle(self):
+        """Multiplicative decrease, at most once per cooldown; pending burst capacity is dropped as well."""
+        with self.lock:
+            self.throttles += 1
+            now = time.monotonic()
+            if self.decreased_at is not None and now - self.decreased_at < self.cooldown:
+                return
+            self.decreased_at = now
+            self._set_rpm(max(self.min_rpm, self.rpm * self.decrease_factor))
+            self.tokens = 0
+            rpm = self.rpm
+        logger.warning(f"⚠️ Throttled: rate lowered to {rpm:.1f} RPM")
+
+    def stats(self):
+        """Controller state for the final report."""
+        return {"current_rpm": round(self.rpm, 2), "max_rpm": self.max_rpm, "successes": self.successes, "throttles": self.throttles}
@@ -1,7 +1,10 @@
-import os, uuid, json, time
+import os, re, uuid, json, time, hashlib, threading, random, signal, itertools
 import boto3
 import backoff
-from typing import Optional
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError, ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional, Tuple
 from pydantic import BaseModel, Field, field_validator
 
 # AWS Lambda Powertools
@@ -13,11 +16,76 @@ from aws_lambda_powertools.utilities.typing import LambdaContext
 # Langfuse Observability
 from langfuse import Langfuse, observe, propagate_attributes
 
+from prefilter import PreFilter
+# Shared with the evaluation job; packaged as a Lambda layer from src/shared
+from agent_fingerprint import resolve_fingerprint
+
 # Setup & Resource Initialization
 logger, tracer, metrics = Logger(), Tracer(), Metrics(namespace="LeadGenBot", service="AgentPerformance")
-bedrock = boto3.client("bedrock-agent-runtime")
+# Retries are owned by the backoff policy on the agent calls (retry_agent_call); botocore must not retry underneath it
+# (botocore's "max_attempts" counts retries, "total_max_attempts" includes the first attempt)
+BEDROCK_CLIENT_CONFIG = Config(
+    retries={"mode": "standard", "total_max_attempts": 1},
+    connect_timeout=int(os.environ.get("BEDROCK_CONNECT_TIMEOUT", 3)),
+    read_timeout=int(os.environ.get("BEDROCK_READ_TIMEOUT", 20))
+)
+bedrock = boto3.client("bedrock-agent-runtime", config=BEDROCK_CLIENT_CONFIG)
 langfuse_client: Optional[Langfuse] = None
 
+# Langfuse credentials are cached in memory for this many seconds before a background refresh
+LANGFUSE_SECRET_TTL = int(os.environ.get("LANGFUSE_SECRET_TTL", 300))
+_langfuse_creds: Optional[dict] = None
+_langfuse_loaded_at = 0.0
+_langfuse_thread: Optional[threading.Thread] = None
+_langfuse_lock = threading.Lock()
+
+# Head-based trace sampling (errors are always traced) and export mode ("background" or "sync").
+# Not LANGFUSE_SAMPLE_RATE: the SDK reads that variable itself and would sample a second time.
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 1.0))
+LANGFUSE_FLUSH_MODE = os.environ.get("LANGFUSE_FLUSH_MODE", "background")
+_flush_thread: Optional[threading.Thread] = None
+# Set when the current request fails; its traces are then flushed before the response is returned
+_request_failed = False
+
+# Opt-in answer cache for repeated FAQ-style prompts
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+ANSWER_CACHE_TABLE = os.environ.get("ANSWER_CACHE_TABLE", "")  # shared tier; "local" selects the in-memory stand-in
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 256))
+ANSWER_CACHE_VERSION_TTL = int(os.environ.get("ANSWER_CACHE_VERSION_TTL", 60))
+# Prompts referring to earlier turns or carrying personal data always go to the agent (English and Spanish)
+CONTEXT_MARKERS = re.compile(
+    r"\b(my|me|mine|our|it|that|this|those|these|above|previous|earlier|again"
+    r"|mi|mis|conmigo|nuestr[oa]s?|eso|esto|es[ae]s?|est[ae]s?|estos|aquel(?:la|los|las)?"
+    r"|anterior|antes|arriba|otra vez|de nuevo)\b|@|\d{4,}",
+    re.IGNORECASE
+)
+bedrock_agent = boto3.client("bedrock-agent") if ANSWER_CACHE_ENABLED else None
+_cache_version: Optional[str] = None
+_cache_version_at = 0.0
+
+# Local pre-filter compiled once per container from the guardrail definition (PRE_FILTER_CONFIG, JSON)
+pre_filter = PreFilter.from_guardrail(json.loads(os.environ["PRE_FILTER_CONFIG"])) if os.environ.get("PRE_FILTER_CONFIG") else None
+
+# Retry budget: retries stop once less than RETRY_RESERVE_MS would be left for a last attempt before the
+# API Gateway integration timeout (29 s) or the Lambda timeout, whichever comes first
+API_GATEWAY_TIMEOUT_MS = int(os.environ.get("API_GATEWAY_TIMEOUT_MS", 29000))
+RETRY_MAX_TRIES = int(os.environ.get("RETRY_MAX_TRIES", 3))
+RETRY_RESERVE_MS = int(os.environ.get("RETRY_RESERVE_MS", 15000))
+RETRY_AFTER_SECONDS = int(os.environ.get("RETRY_AFTER_SECONDS", 5))
+# Error codes are compared lowercased: errors raised from the completion event stream (EventStreamError)
+# use camelCase ("throttlingException")
+THROTTLING_ERROR_CODES = {"throttlingexception", "toomanyrequestsexception", "servicequotaexceededexception"}
+RETRYABLE_ERROR_CODES = THROTTLING_ERROR_CODES | {
+    "internalserverexception", "serviceunavailableexception", "badgatewayexception",
+    "dependencyfailedexception", "modelnotreadyexception"
+}
+_request_deadline: Optional[float] = None
+
+# Latency breakdown of the current agent invocation and the last background flush, published as EMF metrics
+_invocation_stats: Optional[dict] = None
+_background_flush_ms: Optional[float] = None
+
 def generate_session_id() -> str:
     """
     Generate a new session ID and record metrics/logs for a new session.
@@ -48,48 +116,398 @@ class BedrockAgentRequest(BaseModel):
         return str(v).strip()
 
 # Observability Setup
-@tracer.capture_method
+def build_langfuse_client() -> Langfuse:
+    """
+    Build the Langfuse client with SDK-side sampling disabled; the handler makes the sampling decision.
+    """
+    return Langfuse(sample_rate=1.0)
+
 def init_langfuse():
     """
-    Initialize the Langfuse client if not already initialized.
+    Load Langfuse credentials and (re)build the client when they change.
+    Runs on a background thread; failures are logged and retried on the next request.
     """
-    global langfuse_client
-    if langfuse_client: return
+    global langfuse_client, _langfuse_creds, _langfuse_loaded_at
     try:
-        # Fetch Langfuse credentials from AWS Secrets Manager
+        # Fetch Langfuse credentials from AWS Secrets Manager (Powertools caches them for the TTL)
         secret_name = os.environ.get("LANGFUSE_SECRET_NAME") or os.environ.get("LANGFUSE_SECRET_ARN")
-        creds = parameters.get_secret(secret_name, transform="json")
+        creds = parameters.get_secret(secret_name, transform="json", max_age=LANGFUSE_SECRET_TTL)
         
-        # Update environment with Langfuse configuration
-        os.environ.update({
-            "LANGFUSE_SECRET_KEY": creds["LANGFUSE_SECRET_KEY"],
-            "LANGFUSE_PUBLIC_KEY": creds["LANGFUSE_PUBLIC_KEY"],
-            "LANGFUSE_BASE_URL": creds["LANGFUSE_BASE_URL"]
-        })
-        langfuse_client = Langfuse()
+        if langfuse_client is None or creds != _langfuse_creds:
+            # Update environment with Langfuse configuration
+            os.environ.update({
+                "LANGFUSE_SECRET_KEY": creds["LANGFUSE_SECRET_KEY"],
+                "LANGFUSE_PUBLIC_KEY": creds["LANGFUSE_PUBLIC_KEY"],
+                "LANGFUSE_BASE_URL": creds["LANGFUSE_BASE_URL"]
+            })
+            langfuse_client = build_langfuse_client()
+            _langfuse_creds = creds
+        _langfuse_loaded_at = time.monotonic()
     except Exception as e:
         logger.error(f"Langfuse init failed: {e}")
 
-# Initialize Langfuse at module level
-init_langfuse()
+def ensure_langfuse():
+    """
+    Start a background credential load when the client is missing (never loaded or last
+    attempt failed) or older than LANGFUSE_SECRET_TTL. Never blocks the caller.
+    """
+    global _langfuse_thread
+    stale = langfuse_client is None or time.monotonic() - _langfuse_loaded_at > LANGFUSE_SECRET_TTL
+    if not stale:
+        return
+    with _langfuse_lock:
+        if _langfuse_thread and _langfuse_thread.is_alive():
+            return
+        _langfuse_thread = threading.Thread(target=init_langfuse, name="langfuse-init", daemon=True)
+        _langfuse_thread.start()
 
-@tracer.capture_method
-@backoff.on_exception(backoff.expo, Exception, max_tries=3)
-@observe(as_type="generation", name="Bedrock Agent Invocation")
-def invoke_agent(session_id: str, prompt: str) -> str:
+def should_sample() -> bool:
+    """
+    Head-based sampling decision for one request.
+
+    Returns:
+    bool: True if the request should be traced in full.
     """
-    Invoke the Bedrock Agent with a prompt.
+    return random.random() < TRACE_SAMPLE_RATE
+
+def record_error_trace(session_id: str, prompt: str, error: Exception):
+    """
+    Record a failure of an unsampled request so errors are always visible in Langfuse.
 
     Args:
     session_id (str): The session ID for the interaction.
     prompt (str): The user prompt.
+    error (Exception): The failure to record.
+    """
+    if not langfuse_client: return
+    try:
+        with propagate_attributes(session_id=session_id):
+            langfuse_client.create_event(
+                name="Bedrock Agent Invocation",
+                input=prompt,
+                level="ERROR",
+                status_message=str(error),
+                metadata={"sampled": False}
+            )
+    except Exception as e:
+        logger.warning(f"Langfuse error trace failed: {e}")
+
+def mark_request_failed():
+    """Flag the current request as failed so its traces are flushed synchronously."""
+    global _request_failed
+    _request_failed = True
+
+def flush_langfuse():
+    """
+    Export buffered spans without holding up the response.
+
+    In "background" mode the flush runs on a daemon thread; anything still pending when
+    the container is frozen goes out on the next invocation. "sync" keeps the previous
+    blocking flush. Failed requests are always flushed synchronously: the container may
+    never be thawed again and SIGTERM is only delivered when an extension is registered.
+    """
+    global _flush_thread
+    if not langfuse_client: return
+    if LANGFUSE_FLUSH_MODE == "sync" or _request_failed:
+        langfuse_client.flush()
+        return
+    if _flush_thread and _flush_thread.is_alive():
+        return
+    _flush_thread = threading.Thread(target=_timed_flush, name="langfuse-flush", daemon=True)
+    _flush_thread.start()
+
+def _timed_flush():
+    """Background flush that records its duration; reported with the next request's metrics."""
+    global _background_flush_ms
+    started = time.monotonic()
+    langfuse_client.flush()
+    _background_flush_ms = (time.monotonic() - started) * 1000
+
+def _shutdown_langfuse(signum, frame):
+    """Drain the span buffer on shutdown (Lambda only sends SIGTERM when an extension is registered)."""
+    if langfuse_client: langfuse_client.shutdown()
+
+# Kick off credential loading without holding up the cold start
+ensure_langfuse()
+signal.signal(signal.SIGTERM, _shutdown_langfuse)
+
+# Answer Cache
+class LocalAnswerStore:
+    """
+    In-memory stand-in for the shared answer tier, used in tests and local runs.
+    """
+    def __init__(self):
+        self.items = {}
+
+    def get(self, key: str) -> Optional[str]:
+        answer, expires_at = self.items.get(key, (None, 0))
+        return answer if expires_at > time.time() else None
+
+    def put(self, key: str, answer: str, ttl: int):
+        self.items[key] = (answer, time.time() + ttl)
+
+class DynamoAnswerStore:
+    """
+    Shared answer tier in DynamoDB; expired items are ignored and removed by the table TTL.
+    """
+    def __init__(self, table_name: str):
+        self.table = boto3.resource("dynamodb").Table(table_name)
+
+    def get(self, key: str) -> Optional[str]:
+        item = self.table.get_item(Key={"cache_key": key}).get("Item")
+        return item["answer"] if item and int(item["expires_at"]) > time.time() else None
+
+    def put(self, key: str, answer: str, ttl: int):
+        self.table.put_item(Item={"cache_key": key, "answer": answer, "expires_at": int(time.time()) + ttl})
+
+class AnswerCache:
+    """
+    In-container LRU in front of an optional shared store, both bounded by the same TTL.
+    """
+    def __init__(self, max_entries: int, ttl: int, shared=None):
+        self.max_entries, self.ttl, self.shared = max_entries, ttl, shared
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry and entry[1] > time.monotonic():
+            self.entries.move_to_end(key)
+            return entry[0]
+        self.entries.pop(key, None)
+        answer = self.shared.get(key) if self.shared else None
+        if answer is not None:
+            self._remember(key, answer)
+        return answer
+
+    def put(self, key: str, answer: str):
+        self._remember(key, answer)
+        if self.shared:
+            self.shared.put(key, answer, self.ttl)
+
+    def _remember(self, key: str, answer: str):
+        self.entries[key] = (answer, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+def build_answer_cache() -> Optional[AnswerCache]:
+    """
+    Build the answer cache from the environment; None when the cache is disabled.
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    if ANSWER_CACHE_TABLE == "local":
+        shared = LocalAnswerStore()
+    else:
+        shared = DynamoAnswerStore(ANSWER_CACHE_TABLE) if ANSWER_CACHE_TABLE else None
+    return AnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL, shared)
+
+answer_cache = build_answer_cache()
+
+def resolve_cache_version() -> str:
+    """
+    Identify what the alias currently serves (see agent_fingerprint.resolve_fingerprint).
+    Cached for ANSWER_CACHE_VERSION_TTL, so a finished knowledge-base sync invalidates
+    cached answers within that window.
 
     Returns:
-    str: The concatenated response from the agent.
+    str: An opaque version string folded into every cache key.
+    """
+    global _cache_version, _cache_version_at
+    if _cache_version and time.monotonic() - _cache_version_at < ANSWER_CACHE_VERSION_TTL:
+        return _cache_version
+
+    alias_id = os.environ["AGENT_ALIAS_ID"]
+    fingerprint = resolve_fingerprint(bedrock_agent, os.environ["AGENT_ID"], alias_id)
+    _cache_version = f"{alias_id}:{json.dumps(fingerprint, sort_keys=True)}"
+    _cache_version_at = time.monotonic()
+    return _cache_version
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalize a prompt so trivially different phrasings of the same question share a key.
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", prompt.lower()).split())
+
+def answer_cache_key(data: "BedrockAgentRequest") -> Optional[str]:
+    """
+    Build the cache key for a request, or None when the request must bypass the cache.
+
+    Follow-up turns (client-supplied sessionId) and prompts that reference earlier turns
+    or carry personal data depend on session context and are never cached.
+
+    Args:
+    data (BedrockAgentRequest): The validated request.
+
+    Returns:
+    Optional[str]: sha256 of the agent/KB version and the normalized prompt.
+    """
+    if answer_cache is None or "sessionId" in data.model_fields_set or CONTEXT_MARKERS.search(data.prompt):
+        return None
+    try:
+        version = resolve_cache_version()
+    except Exception as e:
+        logger.warning(f"Answer cache bypassed, version lookup failed: {e}")
+        return None
+    return hashlib.sha256(f"{version}\n{normalize_prompt(data.prompt)}".encode("utf-8")).hexdigest()
+
+def lookup_answer(key: Optional[str]) -> Optional[str]:
+    """
+    Return the cached answer for a key, recording hit/miss metrics; store failures count as misses.
+    """
+    if key is None:
+        return None
+    try:
+        answer = answer_cache.get(key)
+    except Exception as e:
+        logger.warning(f"Answer cache read failed: {e}")
+        answer = None
+    metrics.add_metric(name="AnswerCacheHit" if answer is not None else "AnswerCacheMiss", unit=MetricUnit.Count, value=1)
+    return answer
+
+def store_answer(key: Optional[str], answer: str):
+    """
+    Cache a non-empty agent answer; store failures never fail the request.
+    """
+    if key is None or not answer:
+        return
+    try:
+        answer_cache.put(key, answer)
+    except Exception as e:
+        logger.warning(f"Answer cache write failed: {e}")
+
+def error_code(error: Exception) -> str:
+    """
+    Return the lowercased AWS error code of a botocore ClientError ("" for anything else).
+    """
+    return error.response.get("Error", {}).get("Code", "").lower() if isinstance(error, ClientError) else ""
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Check whether an invocation failure is transient: throttling, service-side errors or network timeouts.
+    Validation, access and not-found errors fail immediately.
+    """
+    if isinstance(error, ClientError):
+        return error_code(error) in RETRYABLE_ERROR_CODES
+    return isinstance(error, (EndpointConnectionError, ConnectTimeoutError, ReadTimeoutError, ConnectionClosedError))
+
+def is_throttling_error(error: Exception) -> bool:
+    """
+    Check whether a failure means the caller should back off (mapped to HTTP 429).
+    """
+    return error_code(error) in THROTTLING_ERROR_CODES
+
+def set_request_deadline(context: LambdaContext):
+    """
+    Derive the retry deadline of the current invocation from the API Gateway integration
+    timeout, or from the remaining Lambda time when that is shorter.
+
+    Args:
+    context (LambdaContext): The AWS Lambda context.
+    """
+    global _request_deadline
+    remaining = getattr(context, "get_remaining_time_in_millis", lambda: None)()
+    if not isinstance(remaining, (int, float)):
+        remaining = API_GATEWAY_TIMEOUT_MS
+    _request_deadline = time.monotonic() + (min(remaining, API_GATEWAY_TIMEOUT_MS) - RETRY_RESERVE_MS) / 1000
+
+def retry_budget() -> Optional[float]:
+    """
+    Seconds available for retries in the current invocation (None when there is no deadline).
+    """
+    if _request_deadline is None:
+        return None
+    return max(0.0, _request_deadline - time.monotonic())
+
+def budgeted_jitter(value: float) -> float:
+    """
+    Full jitter capped at the remaining retry budget, so a backoff wait never starts the next attempt past the deadline.
+    """
+    budget = retry_budget()
+    wait = backoff.full_jitter(value)
+    return wait if budget is None else min(wait, budget)
+
+def should_give_up(error: Exception) -> bool:
+    """
+    Stop retrying on non-transient errors or once the retry budget is spent (checked after each attempt).
+    """
+    budget = retry_budget()
+    return not is_retryable_error(error) or (budget is not None and budget <= 0)
+
+def reset_invocation_stats():
+    """Start a fresh latency breakdown (and failure flag) for the current request."""
+    global _invocation_stats, _request_failed
+    _invocation_stats = None
+    _request_failed = False
+
+def record_attempts(details: dict):
+    """Record how many attempts the agent call took (backoff success/giveup handler)."""
+    if _invocation_stats is not None:
+        _invocation_stats["attempts"] = details["tries"]
+
+def publish_invocation_metrics(flush_ms: float):
+    """
+    Emit the latency breakdown of the current request as EMF metrics.
+
+    Args:
+    flush_ms (float): Time the Langfuse flush held up the response.
+    """
+    global _background_flush_ms
+    stats = _invocation_stats
+    if stats:
+        if "first_chunk_ms" in stats:
+            metrics.add_metric(name="TimeToFirstChunk", unit=MetricUnit.Milliseconds, value=stats["first_chunk_ms"])
+        if "stream_ms" in stats:
+            metrics.add_metric(name="StreamDuration", unit=MetricUnit.Milliseconds, value=stats["stream_ms"])
+        metrics.add_metric(name="ChunkCount", unit=MetricUnit.Count, value=stats["chunks"])
+        metrics.add_metric(name="ResponseBytes", unit=MetricUnit.Bytes, value=stats["bytes"])
+        metrics.add_metric(name="InvocationAttempts", unit=MetricUnit.Count, value=stats["attempts"])
+    metrics.add_metric(name="LangfuseFlushTime", unit=MetricUnit.Milliseconds, value=flush_ms)
+    if _background_flush_ms is not None:
+        metrics.add_metric(name="LangfuseBackgroundFlushTime", unit=MetricUnit.Milliseconds, value=_background_flush_ms)
+        _background_flush_ms = None
+
+def log_retry(details: dict):
+    """Log each backoff before the next attempt."""
+    logger.warning(f"Retrying invoke_agent in {details['wait']:.1f}s (attempt {details['tries']}): {details['exception']}")
+
+# One retry policy for every agent call. It must wrap reading the completion stream too: Bedrock reports
+# throttling and service errors that occur after the call is accepted as EventStreamError (a ClientError)
+# raised while iterating "completion". Retried functions must not call each other, or the attempts multiply.
+retry_agent_call = backoff.on_exception(
+    backoff.expo,
+    (ClientError, BotoCoreError),
+    max_tries=lambda: RETRY_MAX_TRIES,
+    max_time=retry_budget,
+    jitter=budgeted_jitter,
+    giveup=should_give_up,
+    on_backoff=log_retry,
+    on_success=record_attempts,
+    on_giveup=record_attempts
+)
+
+def start_invocation(session_id: str, prompt: str) -> dict:
+    """
+    Start one Bedrock Agent invocation attempt and return the raw response with its completion event stream.
+
+    Args:
+    session_id (str): The session ID for the interaction.
+    prompt (str): The user prompt.
+
+    Returns:
+    dict: The invoke_agent response; chunks are read lazily from "completion".
     """
+    # Latency is measured from the first attempt, so retries count towards time to first chunk
+    global _invocation_stats
+    if _invocation_stats is None:
+        _invocation_stats = {"started": time.monotonic(), "chunks": 0, "bytes": 0, "attempts": 0}
+    else:
+        # A retry starts a new answer; chunks of the failed attempt do not count
+        _invocation_stats.update(chunks=0, bytes=0)
+
     # Propagate attributes to Langfuse and invoke the agent
-    with propagate_attributes(session_id=session_id):   
-        response = bedrock.invoke_agent(
+    with propagate_attributes(session_id=session_id):
+        return bedrock.invoke_agent(
             agentId=os.environ["AGENT_ID"],
             agentAliasId=os.environ["AGENT_ALIAS_ID"],
             sessionId=session_id,
@@ -97,15 +515,267 @@ def invoke_agent(session_id: str, prompt: str) -> str:
             enableTrace=True
         )
 
-    # Extract text chunks from the event stream
-    chunks = []
+def iter_chunks(response: dict) -> Iterator[str]:
+    """
+    Yield decoded text chunks from an invoke_agent completion stream as they arrive.
+
+    Args:
+    response (dict): The invoke_agent response.
+
+    Returns:
+    Iterator[str]: Text fragments in generation order.
+    """
+    stats = _invocation_stats
     for event in response.get("completion", []):
         if "chunk" in event:
-            chunks.append(event["chunk"]["bytes"].decode("utf-8"))
-    
-    # Return the assembled response text
-    response_text = "".join(chunks)
-    return response_text
+            data = event["chunk"]["bytes"]
+            if stats is not None:
+                if not stats["chunks"]:
+                    stats["first_chunk_ms"] = (time.monotonic() - stats["started"]) * 1000
+                stats["chunks"] += 1
+                stats["bytes"] += len(data)
+            yield data.decode("utf-8")
+    if stats is not None:
+        stats["stream_ms"] = (time.monotonic() - stats["started"]) * 1000
+
+@tracer.capture_method
+@retry_agent_call
+def read_agent_response(session_id: str, prompt: str) -> str:
+    """
+    Invoke the Bedrock Agent and drain the event stream into the full response text.
+    Nothing has been returned yet when the stream fails, so the whole call is retried.
+
+    Args:
+    session_id (str): The session ID for the interaction.
+    prompt (str): The user prompt.
+
+    Returns:
+    str: The concatenated response from the agent.
+    """
+    return "".join(iter_chunks(start_invocation(session_id, prompt)))
+
+@tracer.capture_method
+@retry_agent_call
+def open_agent_stream(session_id: str, prompt: str) -> Iterator[str]:
+    """
+    Invoke the Bedrock Agent and wait for the first chunk of the answer.
+    Failures up to the first chunk are retried; once text has been sent to the client, they are not.
+
+    Args:
+    session_id (str): The session ID for the interaction.
+    prompt (str): The user prompt.
+
+    Returns:
+    Iterator[str]: Text fragments in generation order, starting with the first chunk.
+    """
+    chunks = iter_chunks(start_invocation(session_id, prompt))
+    first = next(chunks, None)
+    return chunks if first is None else itertools.chain([first], chunks)
+
+@observe(as_type="generation", name="Bedrock Agent Invocation")
+def invoke_agent(session_id: str, prompt: str) -> str:
+    """
+    Invoke the Bedrock Agent with a prompt (traced).
+
+    Args:
+    session_id (str): The session ID for the interaction.
+    prompt (str): The user prompt.
+
+    Returns:
+    str: The concatenated response from the agent.
+    """
+    return read_agent_response(session_id, prompt)
+
+def run_agent(session_id: str, prompt: str) -> str:
+    """
+    Invoke the agent, tracing only the sampled share of requests; unsampled failures still leave an error trace.
+
+    Args:
+    session_id (str): The session ID for the interaction.
+    prompt (str): The user prompt.
+
+    Returns:
+    str: The concatenated response from the agent.
+    """
+    if should_sample():
+        return invoke_agent(session_id, prompt)
+    try:
+        return read_agent_response(session_id, prompt)
+    except Exception as e:
+        record_error_trace(session_id, prompt, e)
+        raise
+
+def stream_frames(session_id: str, prompt: str, sampled: bool = True,
+                  on_complete: Optional[Callable[[str], None]] = None) -> Iterator[str]:
+    """
+    Invoke the Bedrock Agent and yield SSE frames as each chunk arrives.
+
+    Args:
+    session_id (str): The session ID for the interaction.
+    prompt (str): The user prompt.
+    sampled (bool): Whether the request is already traced; if not, failures are recorded explicitly.
+    on_complete (Callable[[str], None]): Optional callback receiving the full text once the stream succeeds.
+
+    Returns:
+    Iterator[str]: One "chunk" frame per completion chunk, then a "done" trailer with the session ID.
+    """
+    try:
+        texts = []
+        for text in open_agent_stream(session_id, prompt):
+            texts.append(text)
+            yield format_sse("chunk", {"text": text})
+        if on_complete:
+            on_complete("".join(texts))
+        yield format_sse("done", {"sessionId": session_id})
+    except Exception as e:
+        # Headers are already sent once streaming starts, so failures travel as an event
+        logger.exception("Streaming invocation failed", extra={"error": str(e)})
+        mark_request_failed()
+        if not sampled:
+            record_error_trace(session_id, prompt, e)
+        if is_throttling_error(e):
+            yield format_sse("error", {"error": "Too Many Requests", "retryAfter": RETRY_AFTER_SECONDS, "sessionId": session_id})
+        else:
+            yield format_sse("error", {"error": "Internal Server Error", "sessionId": session_id})
+
+@observe(as_type="generation", name="Bedrock Agent Streaming Invocation")
+def stream_agent(session_id: str, prompt: str, on_complete: Optional[Callable[[str], None]] = None) -> Iterator[str]:
+    """
+    Traced variant of stream_frames.
+
+    Args:
+    session_id (str): The session ID for the interaction.
+    prompt (str): The user prompt.
+    on_complete (Callable[[str], None]): Optional callback receiving the full text.
+
+    Returns:
+    Iterator[str]: SSE frames as produced by stream_frames.
+    """
+    yield from stream_frames(session_id, prompt, on_complete=on_complete)
+
+def run_agent_stream(session_id: str, prompt: str, on_complete: Optional[Callable[[str], None]] = None) -> Iterator[str]:
+    """
+    Streaming counterpart of run_agent with the same head-based sampling.
+
+    Args:
+    session_id (str): The session ID for the interaction.
+    prompt (str): The user prompt.
+    on_complete (Callable[[str], None]): Optional callback receiving the full text.
+
+    Returns:
+    Iterator[str]: SSE frames.
+    """
+    if should_sample():
+        return stream_agent(session_id, prompt, on_complete)
+    return stream_frames(session_id, prompt, sampled=False, on_complete=on_complete)
+
+def screen_prompt(prompt: str) -> Optional[str]:
+    """
+    Run the local pre-filter; blocked prompts get the guardrail's refusal without invoking the agent.
+
+    Args:
+    prompt (str): The user prompt.
+
+    Returns:
+    Optional[str]: The canned refusal when the prompt is blocked, None otherwise.
+    """
+    if pre_filter is None:
+        return None
+    rule = pre_filter.match(prompt)
+    if rule is None:
+        metrics.add_metric(name="PreFilterPassed", unit=MetricUnit.Count, value=1)
+        return None
+    logger.info("Prompt blocked by pre-filter", extra={"rule": rule})
+    metrics.add_metric(name="PreFilterBlocked", unit=MetricUnit.Count, value=1)
+    return pre_filter.blocked_message
+
+def answer(data: "BedrockAgentRequest") -> Tuple[str, Optional[str]]:
+    """
+    Serve a request from the pre-filter or answer cache when possible, otherwise from the agent.
+
+    A cached answer returns no session ID: Bedrock holds no memory of that turn, so a
+    follow-up sent with the generated ID would lose its context.
+
+    Args:
+    data (BedrockAgentRequest): The validated request.
+
+    Returns:
+    Tuple[str, Optional[str]]: The answer and the session ID to hand back to the client.
+    """
+    refusal = screen_prompt(data.prompt)
+    if refusal is not None:
+        return refusal, data.sessionId
+    key = answer_cache_key(data)
+    cached = lookup_answer(key)
+    if cached is not None:
+        return cached, None
+    result = run_agent(data.sessionId, data.prompt)
+    store_answer(key, result)
+    return result, data.sessionId
+
+def answer_stream(data: "BedrockAgentRequest") -> Iterator[str]:
+    """
+    Streaming counterpart of answer; a refusal or cache hit is sent as a single chunk frame
+    (a cache hit's "done" frame carries no session ID, as in answer).
+
+    Args:
+    data (BedrockAgentRequest): The validated request.
+
+    Returns:
+    Iterator[str]: SSE frames.
+    """
+    refusal = screen_prompt(data.prompt)
+    if refusal is not None:
+        yield format_sse("chunk", {"text": refusal})
+        yield format_sse("done", {"sessionId": data.sessionId})
+        return
+    key = answer_cache_key(data)
+    cached = lookup_answer(key)
+    if cached is not None:
+        yield format_sse("chunk", {"text": cached})
+        yield format_sse("done", {"sessionId": None})
+        return
+    yield from run_agent_stream(data.sessionId, data.prompt, (lambda text: store_answer(key, text)) if key else None)
+
+def format_sse(event_name: str, data: dict) -> str:
+    """
+    Format a single server-sent event frame.
+
+    Args:
+    event_name (str): The SSE event type ("chunk", "done" or "error").
+    data (dict): The JSON payload of the event.
+
+    Returns:
+    str: The encoded SSE frame.
+    """
+    return f"event: {event_name}\ndata: {json.dumps(data)}\n\n"
+
+def wants_stream(event: dict) -> bool:
+    """
+    Check whether the client asked for a server-sent events response.
+
+    Args:
+    event (dict): The AWS Lambda event.
+
+    Returns:
+    bool: True when the Accept header includes text/event-stream.
+    """
+    request_headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    return "text/event-stream" in (request_headers.get('accept') or "")
+
+def parse_request(event: dict) -> "BedrockAgentRequest":
+    """
+    Parse and validate the request body regardless of API Gateway or direct invocation.
+
+    Args:
+    event (dict): The AWS Lambda event.
+
+    Returns:
+    BedrockAgentRequest: The validated request (generates a session ID if missing).
+    """
+    body = event.get("body", {})
+    body_dict = json.loads(body) if isinstance(body, str) else body
+    return BedrockAgentRequest.model_validate(body_dict)
 
 @logger.inject_lambda_context(log_event=True, correlation_id_path='requestContext.requestId')
 @tracer.capture_lambda_handler
@@ -114,6 +784,11 @@ def handler(event: dict, context: LambdaContext):
     """
     AWS Lambda handler for invoking a Bedrock Agent with retry logic.
 
+    Clients sending "Accept: text/event-stream" receive the answer as SSE frames
+    ("chunk" events followed by a "done" trailer carrying the sessionId). API Gateway's
+    REST proxy integration buffers the whole response, so this is framing only, with no
+    time-to-first-token gain; failures therefore keep their 429/500 status codes.
+
     Args:
     event (dict): The AWS Lambda event.
         Expected structure (JSON body via API Gateway):
@@ -133,41 +808,83 @@ def handler(event: dict, context: LambdaContext):
         service="agent-invoker",
         environment=os.environ.get('STAGE', 'unknown')
     )
+    # Refresh Langfuse credentials in the background if missing or expired
+    ensure_langfuse()
+    # Retries must leave enough time to answer before the function times out
+    set_request_deadline(context)
+    reset_invocation_stats()
     
     try:
-        # Parse body regardless of API Gateway or direct invocation
-        body = event.get("body", {})
-        if isinstance(body, str):
-            body_dict = json.loads(body)
-        else:
-            body_dict = body
-
         # Validate the request data (automatically handles session ID generation and metrics)
-        data = BedrockAgentRequest.model_validate(body_dict)
-    
-        # Trigger agent invocation with standard retry mechanism
-        result = invoke_agent(data.sessionId, data.prompt)
-        return build_resp(200, {"response": result, "sessionId": data.sessionId}, event)
+        data = parse_request(event)
+
+        # Answer from cache or trigger agent invocation with standard retry mechanism
+        result, session_id = answer(data)
+
+        # Opt-in SSE framing of the buffered answer; JSON remains the default contract
+        if wants_stream(event):
+            return build_stream_resp(format_sse("chunk", {"text": result}) + format_sse("done", {"sessionId": session_id}), event)
+        return build_resp(200, {"response": result, "sessionId": session_id}, event)
 
     except Exception as e:
+        mark_request_failed()
+        if is_throttling_error(e):
+            # Still throttled after the retry budget: tell the client when to come back
+            logger.warning("Throttled after retries", extra={"error": str(e)})
+            metrics.add_metric(name="ThrottledRequest", unit=MetricUnit.Count, value=1)
+            return build_resp(429, {"error": "Too Many Requests"}, event, {"Retry-After": str(RETRY_AFTER_SECONDS)})
         # Log final failure after all retries
         logger.exception("Handler failed", extra={"error": str(e)}) 
         return build_resp(500, {"error": "Internal Server Error"}, event)
     finally:
-        # Ensure Langfuse traces are flushed
-        if langfuse_client: langfuse_client.flush()
+        # Hand Langfuse traces to the exporter without delaying the response
+        flush_started = time.monotonic()
+        flush_langfuse()
+        publish_invocation_metrics((time.monotonic() - flush_started) * 1000)
 
-def build_resp(code: int, body: dict, event: dict):
+def stream_handler(event: dict, context: LambdaContext) -> Iterator[str]:
     """
-    Build a standard API Gateway response with CORS headers.
+    Response-streaming entry point that forwards each SSE frame as soon as Bedrock emits it.
+
+    Not deployed: the managed Python runtime cannot stream responses, so this needs a
+    Lambda Web Adapter or custom runtime behind a Function URL with RESPONSE_STREAM.
+    Only that setup delivers a time-to-first-token gain; API Gateway uses the buffered handler.
+    Headers are sent before the agent runs, so failures arrive as an "error" frame.
+
+    Args:
+    event (dict): The AWS Lambda event (same body contract as handler).
+    context (LambdaContext): The AWS Lambda context.
+
+    Returns:
+    Iterator[str]: SSE frames, ending with a "done" or "error" event.
+    """
+    ensure_langfuse()
+    set_request_deadline(context)
+    reset_invocation_stats()
+    try:
+        data = parse_request(event)
+        yield from answer_stream(data)
+    except Exception as e:
+        mark_request_failed()
+        logger.exception("Stream handler failed", extra={"error": str(e)})
+        yield format_sse("error", {"error": "Internal Server Error"})
+    finally:
+        flush_started = time.monotonic()
+        flush_langfuse()
+        publish_invocation_metrics((time.monotonic() - flush_started) * 1000)
+        # No log_metrics decorator on a generator entry point, so flush the EMF blob here
+        metrics.flush_metrics()
+
+def cors_headers(event: dict, content_type: str = "application/json") -> dict:
+    """
+    Build response headers, adding CORS headers when the request origin is allowed.
 
     Args:
-    code (int): HTTP status code.
-    body (dict): Response body dictionary.
     event (dict): Original Lambda event.
+    content_type (str): Value for the Content-Type header.
 
     Returns:
-    dict: Formatted response dictionary.
+    dict: Response headers.
     """
     # Normalize headers to lowercase for lookups
     request_headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
@@ -175,10 +892,41 @@ def build_resp(code: int, body: dict, event: dict):
     
     # Check if origin is allowed for CORS
     allowed = os.environ.get('ALLOWED_ORIGINS', '').split(',')
-    headers = {"Content-Type": "application/json"}
+    headers = {"Content-Type": content_type}
     
     # Add CORS headers if origin is authorized
     if origin in allowed:
         headers.update({"Access-Control-Allow-Origin": origin, "Access-Control-Allow-Credentials": "true"})
-        
+    return headers
+
+def build_stream_resp(body: str, event: dict):
+    """
+    Build an API Gateway response carrying server-sent event frames.
+
+    Args:
+    body (str): Concatenated SSE frames.
+    event (dict): Original Lambda event.
+
+    Returns:
+    dict: Formatted response dictionary.
+    """
+    headers = cors_headers(event, "text/event-stream")
+    headers["Cache-Control"] = "no-cache"
+    return {"statusCode": 200, "headers": headers, "body": body}
+
+def build_resp(code: int, body: dict, event: dict, extra_headers: Optional[dict] = None):
+    """
+    Build a standard API Gateway response with CORS headers.
+
+    Args:
+    code (int): HTTP status code.
+    body (dict): Response body dictionary.
+    event (dict): Original Lambda event.
+    extra_headers (dict): Optional additional headers (e.g. Retry-After).
+
+    Returns:
+    dict: Formatted response dictionary.
+    """
+    headers = cors_headers(event)
+    headers.update(extra_headers or {})
     return {"statusCode": code, "headers": headers, "body": json.dumps(body)}
\ No newline at end of file
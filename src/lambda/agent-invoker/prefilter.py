@@ -0,0 +1,66 @@
+import re
+import unicodedata
+from typing import List, Optional, Tuple
+
+def normalize_text(text: str) -> str:
+    """
+    Lowercase text and strip accents so patterns can be written once in plain ASCII.
+
+    Args:
+    text (str): Raw user text.
+
+    Returns:
+    str: Normalized text.
+    """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+class PreFilter:
+    """
+    Compiled rule set that rejects obviously out-of-scope or adversarial prompts before the
+    agent is invoked. Built from the "preFilterConfig" section of the guardrail definition
+    and answered with the guardrail's own blocked-input message.
+    """
+
+    def __init__(self, rules: List[Tuple[str, "re.Pattern"]], blocked_message: str):
+        self.rules = rules
+        self.blocked_message = blocked_message
+
+    @classmethod
+    def from_guardrail(cls, guardrail: dict) -> Optional["PreFilter"]:
+        """
+        Compile the pre-filter from a guardrail definition.
+
+        Args:
+        guardrail (dict): Guardrail JSON (blockedInputMessaging + preFilterConfig).
+
+        Returns:
+        Optional[PreFilter]: None when the guardrail defines no pre-filter rules.
+        """
+        config = guardrail.get("preFilterConfig") or {}
+        rules = [
+            (topic["name"], re.compile("|".join(f"(?:{p})" for p in topic["patterns"])))
+            for topic in config.get("deniedTopics", []) if topic.get("patterns")
+        ]
+        words = [normalize_text(w) for w in config.get("blockedWords", [])]
+        if words:
+            rules.append(("BLOCKED_WORDS", re.compile(r"\b(?:" + "|".join(map(re.escape, words)) + r")\b")))
+        if not rules:
+            return None
+        return cls(rules, guardrail["blockedInputMessaging"])
+
+    def match(self, prompt: str) -> Optional[str]:
+        """
+        Return the name of the first rule the prompt triggers, or None if it may proceed.
+
+        Args:
+        prompt (str): The user prompt.
+
+        Returns:
+        Optional[str]: Rule (denied topic) name.
+        """
+        text = normalize_text(prompt)
+        for name, pattern in self.rules:
+            if pattern.search(text):
+                return name
+        return None
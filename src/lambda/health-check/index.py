@@ -1,17 +1,34 @@
 import os
 import json
+import time
 import boto3
 import logging
-from typing import Dict, Any
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Any, Optional
 
 # Setup Standard Logging
 logger = logging.getLogger()
 logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
 
+# Per-check budget (seconds) and how long deep results are reused within a container
+HEALTH_CHECK_TIMEOUT = float(os.environ.get('HEALTH_CHECK_TIMEOUT', 3))
+HEALTH_CACHE_TTL = float(os.environ.get('HEALTH_CACHE_TTL', 15))
+
+# Fail fast instead of retrying: a slow dependency should surface as unhealthy, not hit the Lambda timeout
+client_config = Config(
+    connect_timeout=HEALTH_CHECK_TIMEOUT,
+    read_timeout=HEALTH_CHECK_TIMEOUT,
+    retries={'max_attempts': 1}
+)
+
 # Resource Initialization
-dynamodb = boto3.client('dynamodb')
-s3 = boto3.client('s3')
-bedrock = boto3.client('bedrock-agent')
+dynamodb = boto3.client('dynamodb', config=client_config)
+s3 = boto3.client('s3', config=client_config)
+bedrock = boto3.client('bedrock-agent', config=client_config)
+
+# Last healthy deep result: (expires_at, checks)
+_cached_checks: Optional[tuple] = None
 
 def check_dynamodb() -> bool:
     """
@@ -23,8 +40,8 @@ def check_dynamodb() -> bool:
             logger.error("LEADS_TABLE_NAME environment variable not set")
             return False
         
-        # Use scan with Limit=1 to verify data access (ReadData permission)
-        dynamodb.scan(TableName=table_name, Limit=1)
+        # Point read of a sentinel key verifies data access (ReadData permission) without scanning
+        dynamodb.get_item(TableName=table_name, Key={'lead_id': {'S': '__health_check__'}}, ProjectionExpression='lead_id')
         logger.debug(f"DynamoDB check passed for table: {table_name}")
         return True
     except Exception as e:
@@ -65,39 +82,98 @@ def check_bedrock() -> bool:
         logger.error(f"Bedrock check failed: {str(e)}", exc_info=True)
         return False
 
+DEEP_CHECKS = {
+    'dynamodb': check_dynamodb,
+    's3': check_s3,
+    'bedrock': check_bedrock,
+}
+
+def check_config() -> bool:
+    """
+    Verify the function is configured; the only check run in shallow mode.
+    """
+    missing = [name for name in ('LEADS_TABLE_NAME', 'KB_BUCKET_NAME', 'AGENT_ID') if not os.environ.get(name)]
+    if missing:
+        logger.error(f"Missing environment variables: {', '.join(missing)}")
+    return not missing
+
+def run_deep_checks() -> Dict[str, bool]:
+    """
+    Run the dependency checks concurrently; a check that exceeds HEALTH_CHECK_TIMEOUT counts as failed.
+
+    Each probe gets its own pool: a timed-out check keeps its thread until the client timeout
+    fires, and with a shared pool the next probe's checks would queue behind it.
+    """
+    pool = ThreadPoolExecutor(max_workers=len(DEEP_CHECKS))
+    futures = {name: pool.submit(check) for name, check in DEEP_CHECKS.items()}
+    wait(futures.values(), timeout=HEALTH_CHECK_TIMEOUT)
+    pool.shutdown(wait=False)
+
+    checks = {}
+    for name, future in futures.items():
+        if future.done():
+            checks[name] = future.result()
+        else:
+            logger.error(f"{name} check timed out after {HEALTH_CHECK_TIMEOUT}s")
+            checks[name] = False
+    return checks
+
+def get_deep_checks() -> tuple:
+    """
+    Return deep check results, reusing the last healthy ones while they are younger than HEALTH_CACHE_TTL.
+    Failures are never cached, so a recovered dependency is reported healthy on the next probe.
+
+    Returns:
+    tuple: (checks, cached) where cached tells whether the result came from the container cache.
+    """
+    global _cached_checks
+    now = time.monotonic()
+    if _cached_checks and _cached_checks[0] > now:
+        return _cached_checks[1], True
+    checks = run_deep_checks()
+    _cached_checks = (now + HEALTH_CACHE_TTL, checks) if all(checks.values()) else None
+    return checks, False
+
 def handler(event: Dict[str, Any], context: Any) -> dict:
     """
     AWS Lambda handler for health check endpoint.
     Uses standard logging instead of Powertools to avoid dependency issues.
 
+    "?mode=shallow" only verifies the function itself (cheap enough for frequent probes);
+    the default "deep" mode checks every dependency concurrently, healthy results cached for HEALTH_CACHE_TTL.
+
     Args:
     event (Dict[str, Any]): The AWS Lambda event.
         Expected structure: API Gateway GET request (standard proxy event).
     context (Any): The AWS Lambda context.
     """
+    mode = ((event or {}).get('queryStringParameters') or {}).get('mode', 'deep')
     logger.info("Health check initiated", extra={
         "service": "health-check",
         "environment": os.environ.get('STAGE', 'unknown'),
-        "request_id": context.aws_request_id if context else "unknown"
+        "request_id": context.aws_request_id if context else "unknown",
+        "mode": mode
     })
     
-    # Run all health checks
-    checks = {
-        'dynamodb': check_dynamodb(),
-        's3': check_s3(),
-        'bedrock': check_bedrock(),
-    }
+    # Run the health checks for the requested mode
+    if mode == 'shallow':
+        checks, cached = {'config': check_config()}, False
+    else:
+        mode = 'deep'
+        checks, cached = get_deep_checks()
     
     # Determine overall health status
     all_healthy = all(checks.values())
     status = 'healthy' if all_healthy else 'unhealthy'
     status_code = 200 if all_healthy else 503
     
-    logger.info(f"Health check completed: {status}", extra={"checks": checks})
+    logger.info(f"Health check completed: {status}", extra={"checks": checks, "cached": cached})
     
     # Build response
     response_body = {
         'status': status,
+        'mode': mode,
+        'cached': cached,
         'checks': checks
     }
     
@@ -1,12 +1,18 @@
 import os
+import json
 import boto3
+from typing import List, Optional
 from botocore.config import Config
+from botocore.exceptions import ClientError
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
 # Constants
 KNOWLEDGE_BASE_ID = os.environ.get('KNOWLEDGE_BASE_ID')
 DATA_SOURCE_ID = os.environ.get('DATA_SOURCE_ID')
+# Coalescing mode: changes arriving while a job runs are re-queued as one summary message after this delay
+SYNC_QUEUE_URL = os.environ.get('SYNC_QUEUE_URL')
+SYNC_DEFER_SECONDS = int(os.environ.get('SYNC_DEFER_SECONDS', 180))
 
 # Setup & Resource Initialization
 logger, tracer = Logger(), Tracer()
@@ -22,6 +28,97 @@ bedrock_config = Config(
 )
 
 bedrock_agent_client = boto3.client('bedrock-agent', config=bedrock_config)
+sqs_client = boto3.client('sqs') if SYNC_QUEUE_URL else None
+
+def find_active_job() -> Optional[dict]:
+    """
+    Return the ingestion job currently starting or running for the data source, if any.
+    """
+    jobs = bedrock_agent_client.list_ingestion_jobs(
+        knowledgeBaseId=KNOWLEDGE_BASE_ID,
+        dataSourceId=DATA_SOURCE_ID,
+        filters=[{'attribute': 'STATUS', 'operator': 'EQ', 'values': ['STARTING', 'IN_PROGRESS']}],
+        sortBy={'attribute': 'STARTED_AT', 'order': 'DESCENDING'},
+        maxResults=1
+    ).get('ingestionJobSummaries', [])
+    return jobs[0] if jobs else None
+
+def count_changes(records: List[dict]) -> int:
+    """
+    Count the S3 object changes carried by a batch of queued messages.
+
+    Args:
+    records (List[dict]): SQS records whose bodies are S3 event notifications or deferral summaries.
+
+    Returns:
+    int: Number of object events (s3:TestEvent messages carry none).
+    """
+    changes = 0
+    for record in records:
+        body = json.loads(record['body'])
+        changes += len(body.get('Records', [])) + body.get('deferredChanges', 0)
+    return changes
+
+def defer(changes: int) -> dict:
+    """
+    Re-queue pending changes as a single delayed summary message.
+
+    Failing the batch instead would count every deferral as a receive and push a change
+    into the dead-letter queue once an ingestion outlasts maxReceiveCount redeliveries.
+
+    Args:
+    changes (int): Number of S3 changes still to be ingested.
+
+    Returns:
+    dict: An empty SQS partial batch response (the originals are replaced by the summary).
+    """
+    sqs_client.send_message(
+        QueueUrl=SYNC_QUEUE_URL,
+        MessageBody=json.dumps({'deferredChanges': changes}),
+        DelaySeconds=SYNC_DEFER_SECONDS
+    )
+    return {'batchItemFailures': []}
+
+def coalesce(records: List[dict]) -> dict:
+    """
+    Turn a batch of queued S3 changes into at most one ingestion job.
+
+    While a job is already running the batch is replaced by one delayed summary message; it
+    comes back together with any newer changes, so everything that arrived during the run
+    is picked up by a single follow-up job. Batches of only s3:TestEvent messages start nothing.
+
+    Args:
+    records (List[dict]): SQS records from the sync queue.
+
+    Returns:
+    dict: An SQS partial batch response.
+    """
+    changes = count_changes(records)
+    if not changes:
+        logger.info(f"No object changes in {len(records)} messages; nothing to sync")
+        return {'batchItemFailures': []}
+
+    active = find_active_job()
+    if active:
+        logger.info(f"Ingestion {active['ingestionJobId']} is {active['status']}; deferring {changes} changes")
+        return defer(changes)
+
+    try:
+        response = bedrock_agent_client.start_ingestion_job(
+            knowledgeBaseId=KNOWLEDGE_BASE_ID,
+            dataSourceId=DATA_SOURCE_ID,
+            description=f'Coalesced sync of {changes} S3 changes'
+        )
+    except ClientError as e:
+        # Lost a race with another start: treat like a running job
+        if e.response['Error']['Code'] == 'ConflictException':
+            logger.info(f"Ingestion already in progress; deferring {changes} changes")
+            return defer(changes)
+        raise
+
+    job_id = response['ingestionJob']['ingestionJobId']
+    logger.info(f"Job started: {job_id} ({changes} changes from {len(records)} messages)")
+    return {'batchItemFailures': []}
 
 @logger.inject_lambda_context(log_event=True, correlation_id_path='requestContext.requestId')
 @tracer.capture_lambda_handler
@@ -29,13 +126,16 @@ def handler(event: dict, context: LambdaContext):
     """
     AWS Lambda handler to trigger a Knowledge Base ingestion job.
 
+    S3 notifications delivered through the sync queue (SQS records) are coalesced into at
+    most one job per batch; direct S3 events and manual triggers start a job right away.
+
     Args:
     event (dict): The AWS Lambda event.
-        Expected structure: S3 event notification or manual trigger.
+        Expected structure: SQS batch of S3 notifications, S3 event notification or manual trigger.
     context (LambdaContext): The AWS Lambda context.
 
     Returns:
-    dict: A response containing the ingestion job ID or an error message.
+    dict: An SQS partial batch response, or a response containing the ingestion job ID or an error message.
     """
     # Add structured logging fields
     logger.append_keys(
@@ -48,6 +148,11 @@ def handler(event: dict, context: LambdaContext):
         logger.error("Required environment variables are not set.")
         return {'statusCode': 500, 'body': "Configuration error"}
 
+    # Coalescing mode: failures propagate so SQS retries the whole batch
+    queued = [r for r in event.get('Records', []) if r.get('eventSource') == 'aws:sqs']
+    if queued:
+        return coalesce(queued)
+
     try:
         logger.info(f"Syncing KB: {KNOWLEDGE_BASE_ID}, DS: {DATA_SOURCE_ID}")
         
@@ -62,6 +167,13 @@ def handler(event: dict, context: LambdaContext):
         job_id = response['ingestionJob']['ingestionJobId']
         return {'statusCode': 200, 'body': f"Job started: {job_id}"}
         
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConflictException':
+            logger.exception("Failed to start ingestion job")
+            return {'statusCode': 500, 'body': "Internal Server Error"}
+        logger.warning("Ingestion already in progress; enable coalescing to queue follow-up syncs")
+        return {'statusCode': 409, 'body': "Ingestion already in progress"}
+
     except Exception:
         # Log failure and return error response
         logger.exception("Failed to start ingestion job")
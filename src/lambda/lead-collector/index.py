@@ -1,17 +1,26 @@
 import os, uuid, json
 from datetime import datetime, timezone
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from pydantic import BaseModel, Field, EmailStr
 from aws_lambda_powertools import Logger, Tracer, Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 from aws_lambda_powertools.utilities.typing import LambdaContext
 import boto3
+from botocore.exceptions import ClientError
 
 # Setup & Resource Initialization
 logger, tracer, metrics = Logger(), Tracer(), Metrics(namespace="LeadGenBot", service="AgentPerformance")
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(os.environ.get('LEADS_TABLE_NAME', ''))
 
+# Write mode: "sync" writes each lead before answering the agent, "queue" hands it to SQS for batched writes
+LEAD_WRITE_MODE = os.environ.get('LEAD_WRITE_MODE', 'sync')
+LEAD_QUEUE_URL = os.environ.get('LEAD_QUEUE_URL', '')
+sqs = boto3.client('sqs') if LEAD_WRITE_MODE == 'queue' else None
+
+# Namespace for deterministic lead IDs; the same (session, email) always maps to the same item
+LEAD_ID_NAMESPACE = uuid.UUID('6f1c1f7e-3b0a-4c55-9a53-5d2f0f1b7c21')
+
 
 class LeadRequest(BaseModel):
     """
@@ -21,6 +30,97 @@ class LeadRequest(BaseModel):
     email: EmailStr
     reason: str = "User inquiry"
 
+def make_lead_id(session_id: Optional[str], email: str) -> str:
+    """
+    Derives a stable lead ID so agent retries of the same tool call map to one item.
+
+    Args:
+    session_id (Optional[str]): The Bedrock agent session ID.
+    email (str): The lead's email address.
+
+    Returns:
+    str: A UUIDv5 built from the session ID and the lowercased email.
+    """
+    return str(uuid.uuid5(LEAD_ID_NAMESPACE, f"{session_id or ''}|{email.strip().lower()}"))
+
+def build_lead_item(data: LeadRequest, session_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Builds the DynamoDB item for a lead.
+
+    Args:
+    data (LeadRequest): The validated lead request.
+    session_id (Optional[str]): The Bedrock agent session ID.
+
+    Returns:
+    Dict[str, Any]: The lead item.
+    """
+    return {
+        'lead_id': make_lead_id(session_id, data.email),
+        'email': data.email,
+        'reason': data.reason,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'status': 'new',
+        'session_id': session_id
+    }
+
+def save_lead(item: Dict[str, Any]) -> bool:
+    """
+    Writes a lead unless it already exists (conditional put).
+
+    Args:
+    item (Dict[str, Any]): The lead item.
+
+    Returns:
+    bool: True if the lead was created, False if it was a duplicate.
+    """
+    try:
+        table.put_item(Item=item, ConditionExpression='attribute_not_exists(lead_id)')
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+def enqueue_lead(item: Dict[str, Any]):
+    """
+    Hands a lead to the write queue; flush_handler persists it in batches.
+
+    Args:
+    item (Dict[str, Any]): The lead item.
+    """
+    sqs.send_message(QueueUrl=LEAD_QUEUE_URL, MessageBody=json.dumps(item))
+
+def write_leads(items: List[Dict[str, Any]]) -> int:
+    """
+    Batch-writes leads, skipping IDs that are duplicated in the batch or already stored.
+
+    Args:
+    items (List[Dict[str, Any]]): Lead items.
+
+    Returns:
+    int: Number of new leads written.
+    """
+    # Collapse duplicates inside the batch, keeping the first occurrence
+    unique = {}
+    for item in items:
+        unique.setdefault(item['lead_id'], item)
+
+    # Batch writes cannot be conditional, so filter out leads that already exist first
+    existing = set()
+    keys = [{'lead_id': lead_id} for lead_id in unique]
+    for i in range(0, len(keys), 100):
+        request = {table.name: {'Keys': keys[i:i + 100], 'ProjectionExpression': 'lead_id'}}
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            existing.update(r['lead_id'] for r in response['Responses'].get(table.name, []))
+            request = response.get('UnprocessedKeys') or None
+
+    new_items = [item for lead_id, item in unique.items() if lead_id not in existing]
+    with table.batch_writer() as batch:
+        for item in new_items:
+            batch.put_item(Item=item)
+    return len(new_items)
+
 # Bedrock Agent Helpers
 def parse_properties(event: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -106,22 +206,22 @@ def handler(event: Dict[str, Any], context: LambdaContext):
         # Validate input parameters from the agent event
         data = LeadRequest(**parse_properties(event))
 
-        # Generate unique ID for the new lead
-        lead_id = str(uuid.uuid4())
-        
-        # Save lead information to DynamoDB
-        table.put_item(Item={
-            'lead_id': lead_id,
-            'email': data.email,
-            'reason': data.reason,
-            'created_at': datetime.now(timezone.utc).isoformat(),
-            'status': 'new',
-            'session_id': event.get('sessionId')
-        })
-
-        # Log success and update metrics
-        logger.info(f"Lead collected", extra={"lead_id": lead_id, "email": data.email})
-        metrics.add_metric(name="LeadCaptured", unit=MetricUnit.Count, value=1)
+        # Deterministic ID: retries of the same tool call resolve to the same lead
+        item = build_lead_item(data, event.get('sessionId'))
+        lead_id = item['lead_id']
+
+        if LEAD_WRITE_MODE == 'queue':
+            # Answer the agent right away; flush_handler persists the lead in a batch
+            enqueue_lead(item)
+            logger.info(f"Lead queued", extra={"lead_id": lead_id, "email": data.email})
+            metrics.add_metric(name="LeadQueued", unit=MetricUnit.Count, value=1)
+        elif save_lead(item):
+            # Log success and update metrics
+            logger.info(f"Lead collected", extra={"lead_id": lead_id, "email": data.email})
+            metrics.add_metric(name="LeadCaptured", unit=MetricUnit.Count, value=1)
+        else:
+            logger.info(f"Duplicate lead ignored", extra={"lead_id": lead_id, "email": data.email})
+            metrics.add_metric(name="LeadDuplicate", unit=MetricUnit.Count, value=1)
 
         # Build user-friendly response message
         resp_msg = f"Got it! I've saved your request. We'll contact you at {data.email} soon."
@@ -131,4 +231,51 @@ def handler(event: Dict[str, Any], context: LambdaContext):
         # Handle failures and log errors
         logger.exception("Lead collection failed")
         metrics.add_metric(name="ActionGroupFailure", unit=MetricUnit.Count, value=1)
-        return build_agent_resp(event, 500, {"success": False, "message": "I couldn't save your info."})
\ No newline at end of file
+        return build_agent_resp(event, 500, {"success": False, "message": "I couldn't save your info."})
+
+
+@logger.inject_lambda_context(log_event=False)
+@tracer.capture_lambda_handler
+@metrics.log_metrics
+def flush_handler(event: Dict[str, Any], context: LambdaContext):
+    """
+    AWS Lambda handler that persists queued leads with batch writes.
+
+    Args:
+    event (Dict[str, Any]): An SQS event whose message bodies are lead items.
+    context (LambdaContext): The AWS Lambda context.
+
+    Returns:
+    dict: SQS partial batch response listing the messages to redeliver.
+    """
+    logger.append_keys(
+        service="lead-collector",
+        environment=os.environ.get('STAGE', 'unknown')
+    )
+
+    items, message_ids, failures = [], [], []
+    for record in event.get('Records', []):
+        try:
+            item = json.loads(record['body'])
+            item['lead_id']
+        except (ValueError, KeyError, TypeError):
+            # A malformed message must not block the rest of the batch; it ends up in the DLQ
+            logger.error("Invalid lead message", extra={"message_id": record.get('messageId')})
+            failures.append(record.get('messageId'))
+            continue
+        items.append(item)
+        message_ids.append(record['messageId'])
+
+    try:
+        written = write_leads(items)
+    except Exception:
+        # Redeliver every valid message; the ID check keeps the retry idempotent
+        logger.exception("Lead flush failed")
+        metrics.add_metric(name="LeadFlushFailure", unit=MetricUnit.Count, value=len(items))
+        failures.extend(message_ids)
+        return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failures]}
+
+    logger.info(f"Flushed {written} new leads", extra={"received": len(items), "invalid": len(failures)})
+    metrics.add_metric(name="LeadCaptured", unit=MetricUnit.Count, value=written)
+    metrics.add_metric(name="LeadDuplicate", unit=MetricUnit.Count, value=len(items) - written)
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failures]}
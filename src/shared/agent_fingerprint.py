@@ -0,0 +1,32 @@
+def resolve_fingerprint(bedrock_agent, agent_id: str, agent_alias_id: str) -> dict:
+    """
+    Identify what an agent alias currently serves: the routed agent version and, per
+    attached knowledge-base data source, the latest completed ingestion job ID.
+    Shared by the agent-invoker answer cache and the evaluation agent cache.
+
+    Args:
+    bedrock_agent: A boto3 "bedrock-agent" client.
+    agent_id (str): The Bedrock agent ID.
+    agent_alias_id (str): The alias whose routing is resolved.
+
+    Returns:
+    dict: {"agent_version": str, "ingestion_jobs": {"<kb_id>/<data_source_id>": job_id or None}}
+    """
+    alias = bedrock_agent.get_agent_alias(agentId=agent_id, agentAliasId=agent_alias_id)["agentAlias"]
+    agent_version = alias["routingConfiguration"][0]["agentVersion"]
+
+    ingestion_jobs = {}
+    kbs = bedrock_agent.list_agent_knowledge_bases(agentId=agent_id, agentVersion=agent_version)
+    for kb in kbs.get("agentKnowledgeBaseSummaries", []):
+        kb_id = kb["knowledgeBaseId"]
+        for ds in bedrock_agent.list_data_sources(knowledgeBaseId=kb_id).get("dataSourceSummaries", []):
+            jobs = bedrock_agent.list_ingestion_jobs(
+                knowledgeBaseId=kb_id,
+                dataSourceId=ds["dataSourceId"],
+                filters=[{"attribute": "STATUS", "operator": "EQ", "values": ["COMPLETE"]}],
+                sortBy={"attribute": "STARTED_AT", "order": "DESCENDING"},
+                maxResults=1
+            ).get("ingestionJobSummaries", [])
+            ingestion_jobs[f"{kb_id}/{ds['dataSourceId']}"] = jobs[0]["ingestionJobId"] if jobs else None
+
+    return {"agent_version": agent_version, "ingestion_jobs": ingestion_jobs}
@@ -0,0 +1 @@
+# Job unit tests package
@@ -0,0 +1 @@
+# Evaluation job unit tests package
@@ -0,0 +1,99 @@
+"""
+Tests for the evaluation job's response cache (LRU bounds, refresh mode and per-shard S3 persistence).
+"""
+import pytest
+import json
+import sys
+from pathlib import Path
+
+EVALUATOR_PATH = Path(__file__).parent.parent.parent.parent.parent / "src" / "jobs" / "evaluation" / "deepeval_evaluator"
+sys.path.insert(0, str(EVALUATOR_PATH))
+
+class FakeS3:
+    """Stand-in for S3Service keeping uploaded JSON objects in memory."""
+    def __init__(self):
+        self.objects = {}
+
+    def upload_json(self, bucket, key, data):
+        self.objects[key] = json.loads(json.dumps(data))
+
+    def list_keys(self, bucket, prefix):
+        return sorted(key for key in self.objects if key.startswith(prefix))
+
+    def download_file(self, bucket, key, local_path):
+        Path(local_path).write_text(json.dumps(self.objects[key]), encoding="utf-8")
+
+def make_cache(tmp_path, name="cache.json", **kwargs):
+    from cache import ResponseCache
+    return ResponseCache(str(tmp_path / name), **kwargs)
+
+@pytest.mark.unit
+class TestResponseCache:
+    """Test suite for ResponseCache."""
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        """Test reading an entry keeps it alive while the oldest unread entry is evicted."""
+        cache = make_cache(tmp_path, max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        assert list(cache.entries) == ["a", "c"]
+        assert cache.get("b") is None
+        assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "entries": 2, "refresh": False}
+
+    def test_refresh_ignores_stored_entries_but_records_new_ones(self, tmp_path):
+        """Test refresh mode always misses yet still keeps what is put."""
+        cache = make_cache(tmp_path, refresh=True)
+        cache.put("a", 1)
+
+        assert cache.get("a") is None
+        assert cache.entries["a"] == 1
+
+    def test_make_key_is_stable(self):
+        """Test keys only depend on the hashed parts."""
+        from cache import ResponseCache
+
+        assert ResponseCache.make_key("model", {"x": 1, "y": 2}) == ResponseCache.make_key("model", {"y": 2, "x": 1})
+        assert ResponseCache.make_key("model", "a") != ResponseCache.make_key("model", "b")
+
+    def test_save_and_load_local_file(self, tmp_path):
+        """Test entries survive a save/load round trip and a missing file starts empty."""
+        cache = make_cache(tmp_path, name="nested/cache.json")
+        cache.put("a", {"output": "x"})
+        cache.save()
+
+        reloaded = make_cache(tmp_path, name="nested/cache.json")
+        reloaded.load()
+        empty = make_cache(tmp_path, name="missing.json")
+        empty.load()
+
+        assert reloaded.entries == {"a": {"output": "x"}}
+        assert empty.entries == {}
+
+    def test_shards_write_their_own_objects_and_load_merges_them(self, tmp_path):
+        """Test concurrent shards never overwrite each other and a later run sees every shard's entries."""
+        s3 = FakeS3()
+        for shard, key in enumerate(["a", "b"]):
+            cache = make_cache(tmp_path, name=f"shard-{shard}.json", s3=s3, bucket="results", s3_prefix="cache/judge/", shard=shard)
+            cache.put(key, shard)
+            cache.save()
+
+        merged = make_cache(tmp_path, name="fresh.json", max_entries=10, s3=s3, bucket="results", s3_prefix="cache/judge/")
+        merged.load()
+
+        assert sorted(s3.objects) == ["cache/judge/shard-0.json", "cache/judge/shard-1.json"]
+        assert merged.entries == {"a": 0, "b": 1}
+        assert not (tmp_path / "fresh.json.download").exists()
+
+    def test_load_trims_merged_shards_to_max_entries(self, tmp_path):
+        """Test merging remote shards keeps only the most recently written entries."""
+        s3 = FakeS3()
+        s3.upload_json("results", "cache/judge/shard-0.json", {"old": 1})
+        s3.upload_json("results", "cache/judge/shard-1.json", {"new": 2, "newest": 3})
+
+        cache = make_cache(tmp_path, max_entries=2, s3=s3, bucket="results", s3_prefix="cache/judge/")
+        cache.load()
+
+        assert list(cache.entries) == ["new", "newest"]
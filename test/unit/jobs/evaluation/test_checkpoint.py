@@ -0,0 +1,84 @@
+"""
+Tests for the evaluation job's checkpoint log (write, S3 mirror and resume).
+"""
+import pytest
+import json
+import sys
+from pathlib import Path
+
+EVALUATOR_PATH = Path(__file__).parent.parent.parent.parent.parent / "src" / "jobs" / "evaluation" / "deepeval_evaluator"
+sys.path.insert(0, str(EVALUATOR_PATH))
+
+class FakeS3:
+    """Stand-in for S3Service keeping uploaded files in memory."""
+    def __init__(self):
+        self.objects = {}
+
+    def upload_file(self, local_path, bucket, key):
+        self.objects[key] = Path(local_path).read_text(encoding="utf-8")
+
+    def download_file(self, bucket, key, local_path):
+        if key not in self.objects:
+            raise FileNotFoundError(key)
+        Path(local_path).write_text(self.objects[key], encoding="utf-8")
+
+def make_checkpoint(tmp_path, s3, flush_every=10):
+    from checkpoint import Checkpoint
+    return Checkpoint("run-1", s3, "results", local_dir=str(tmp_path), flush_every=flush_every)
+
+@pytest.mark.unit
+class TestCheckpoint:
+    """Test suite for Checkpoint."""
+
+    def test_resume_keys_rows_with_duplicate_inputs_apart(self, tmp_path):
+        """Test two rows with the same input are restored independently, keyed by row index."""
+        s3 = FakeS3()
+        checkpoint = make_checkpoint(tmp_path / "first", s3)
+        checkpoint.record_agent("set.jsonl", 0, "Same question", "answer A", ["ctx A"], {"total_ms": 1})
+        checkpoint.record_agent("set.jsonl", 2, "Same question", "answer C", ["ctx C"], {"total_ms": 3})
+        checkpoint.record_result("set.jsonl", {"case_index": 2, "input": "Same question", "metrics": [], "trace": None})
+        checkpoint.flush()
+
+        resumed = make_checkpoint(tmp_path / "second", s3)
+        resumed.load()
+
+        assert resumed.agent_outputs[("set.jsonl", 0)]["actual_output"] == "answer A"
+        assert resumed.agent_outputs[("set.jsonl", 2)]["actual_output"] == "answer C"
+        assert set(resumed.results) == {("set.jsonl", 2)}
+
+    def test_flushes_to_s3_every_n_records(self, tmp_path):
+        """Test the local log is mirrored to S3 once flush_every records are pending."""
+        s3 = FakeS3()
+        checkpoint = make_checkpoint(tmp_path, s3, flush_every=2)
+
+        checkpoint.record_agent("set.jsonl", 0, "Q1", "A1", [])
+        assert s3.objects == {}
+        checkpoint.record_agent("set.jsonl", 1, "Q2", "A2", [])
+
+        lines = s3.objects["checkpoints/run-1.jsonl"].splitlines()
+        assert [json.loads(line)["case_index"] for line in lines] == [0, 1]
+
+    def test_load_skips_torn_and_unindexed_lines(self, tmp_path):
+        """Test a torn last line and entries without a row index are ignored on resume."""
+        s3 = FakeS3()
+        checkpoint = make_checkpoint(tmp_path / "first", s3)
+        checkpoint.record_agent("set.jsonl", 0, "Q1", "A1", [])
+        checkpoint.flush()
+        legacy = json.dumps({"kind": "agent", "test_set": "set.jsonl", "input": "Q2", "actual_output": "A2"})
+        s3.objects["checkpoints/run-1.jsonl"] += legacy + "\n" + '{"kind": "res'
+
+        resumed = make_checkpoint(tmp_path / "second", s3)
+        resumed.load()
+
+        assert list(resumed.agent_outputs) == [("set.jsonl", 0)]
+        assert resumed.results == {}
+
+    def test_load_falls_back_to_local_file(self, tmp_path):
+        """Test the local log is used when the S3 copy is missing."""
+        checkpoint = make_checkpoint(tmp_path, FakeS3())
+        checkpoint.record_agent("set.jsonl", 4, "Q5", "A5", [])
+
+        resumed = make_checkpoint(tmp_path, FakeS3())
+        resumed.load()
+
+        assert resumed.agent_outputs[("set.jsonl", 4)]["actual_output"] == "A5"
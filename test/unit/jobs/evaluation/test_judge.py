@@ -0,0 +1,81 @@
+"""
+Tests for the evaluation job's LLM judge wrapper, run against LiteLLM's offline fake backend (mock_response).
+"""
+import pytest
+import asyncio
+import json
+import os
+import sys
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+
+EVALUATOR_PATH = Path(__file__).parent.parent.parent.parent.parent / "src" / "jobs" / "evaluation" / "deepeval_evaluator"
+sys.path.insert(0, str(EVALUATOR_PATH))
+
+# Use LiteLLM's bundled model cost map instead of fetching it over the network
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+VERDICT = {"verdicts": [{"verdict": "yes"}], "score": 1, "reason": "offline"}
+
+def make_judge(mock_response, **kwargs):
+    from judge import BedrockJudge
+    return BedrockJudge("anthropic.claude-test", mock_response=mock_response, **kwargs)
+
+@pytest.mark.unit
+class TestBedrockJudge:
+    """Test suite for BedrockJudge."""
+
+    def test_generate_offline_strips_markdown(self):
+        """Test the fake backend answers locally and the verdict is extracted from a fenced block."""
+        judge = make_judge(f"Here you go:\n```json\n{json.dumps(VERDICT)}\n```")
+
+        assert json.loads(judge.generate("Is the answer faithful?")) == VERDICT
+
+    def test_a_generate_offline(self):
+        """Test the async path uses the same fake backend and parsing."""
+        judge = make_judge(json.dumps(VERDICT), max_concurrency=2)
+
+        result = asyncio.run(judge.a_generate("Is the answer faithful?"))
+
+        assert json.loads(result) == VERDICT
+
+    def test_missing_verdicts_are_filled_in(self):
+        """Test a verdict without the 'verdicts' key DeepEval requires gets one from its reason."""
+        judge = make_judge(json.dumps({"score": 0.5, "reason": "partly"}))
+
+        assert json.loads(judge.generate("prompt"))["verdicts"] == ["partly"]
+
+    def test_caches_only_parsed_verdicts(self, tmp_path):
+        """Test readable verdicts are served from the cache while placeholders for unreadable output are not stored."""
+        from cache import ResponseCache
+        import judge as judge_module
+
+        cache = ResponseCache(str(tmp_path / "judge.json"))
+        judge = make_judge(json.dumps(VERDICT), cache=cache)
+        with patch.object(judge_module.litellm, "completion", wraps=judge_module.litellm.completion) as completion:
+            judge.generate("prompt")
+            judge.generate("prompt")
+        assert completion.call_count == 1
+        assert cache.hits == 1
+
+        judge.mock_response = "Sorry, I cannot grade this."
+        placeholder = json.loads(judge.generate("another prompt"))
+        assert placeholder["reason"] == "No JSON found"
+        assert len(cache.entries) == 1
+
+    def test_reports_throttling_to_rate_limiter(self):
+        """Test successful calls and LiteLLM rate-limit errors are fed back into the shared limiter."""
+        import litellm
+        import judge as judge_module
+
+        limiter = MagicMock()
+        judge = make_judge(json.dumps(VERDICT), rate_limiter=limiter)
+        judge.generate("prompt")
+        limiter.acquire.assert_called_once()
+        limiter.on_success.assert_called_once()
+
+        throttled = litellm.exceptions.RateLimitError("Too many requests", llm_provider="bedrock", model=judge.model_name)
+        with patch.object(judge_module.litellm, "completion", side_effect=throttled):
+            with pytest.raises(litellm.exceptions.RateLimitError):
+                judge.generate("prompt")
+        limiter.on_throttle.assert_called_once()
@@ -0,0 +1,50 @@
+"""
+Tests for the evaluation job's adaptive (AIMD) rate limiter.
+"""
+import pytest
+import sys
+import threading
+from unittest.mock import patch
+from pathlib import Path
+
+EVALUATOR_PATH = Path(__file__).parent.parent.parent.parent.parent / "src" / "jobs" / "evaluation" / "deepeval_evaluator"
+sys.path.insert(0, str(EVALUATOR_PATH))
+
+@pytest.mark.unit
+class TestAdaptiveRateLimiter:
+    """Test suite for AdaptiveRateLimiter."""
+
+    def test_concurrent_throttles_decrease_once(self):
+        """Test a burst of simultaneous throttles halves the rate once instead of once per caller."""
+        from utils import AdaptiveRateLimiter
+        
+        limiter = AdaptiveRateLimiter(60, min_rpm=1, cooldown=5.0)
+        barrier = threading.Barrier(8)
+        
+        def throttled():
+            barrier.wait()
+            limiter.on_throttle()
+        
+        with patch("utils.time.monotonic", return_value=100.0):
+            workers = [threading.Thread(target=throttled) for _ in range(8)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join(timeout=5)
+        
+        assert limiter.rpm == 30
+        assert limiter.throttles == 8
+
+    def test_throttle_after_cooldown_decreases_again(self):
+        """Test a throttle past the cooldown window is treated as fresh feedback and cuts the rate again."""
+        from utils import AdaptiveRateLimiter
+        
+        limiter = AdaptiveRateLimiter(60, min_rpm=1, cooldown=5.0)
+        
+        with patch("utils.time.monotonic", side_effect=[100.0, 104.0, 106.0]):
+            limiter.on_throttle()
+            limiter.on_throttle()  # still cooling down
+            limiter.on_throttle()
+        
+        assert limiter.rpm == 15
+        assert limiter.stats()["throttles"] == 3
@@ -0,0 +1,131 @@
+"""
+Tests for scripts/run_evaluation.py: merging shard reports and stopping shards when a sharded run fails.
+"""
+import pytest
+import importlib.util
+import json
+import os
+import boto3
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+from moto import mock_aws
+
+SCRIPT_PATH = Path(__file__).parent.parent.parent.parent.parent / "scripts" / "run_evaluation.py"
+
+os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+
+_spec = importlib.util.spec_from_file_location("run_evaluation", SCRIPT_PATH)
+run_evaluation = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(run_evaluation)
+
+TASKS = ["arn:aws:ecs:us-east-1:123456789012:task/cluster/shard-0", "arn:aws:ecs:us-east-1:123456789012:task/cluster/shard-1"]
+
+def detail(test_set, index, score, total_ms=100.0):
+    """Build a detailed result with one metric and a minimal trace."""
+    trace = {"total_ms": total_ms, "orchestration_steps": 1, "model_invocations": 1, "kb_lookup_ms": 0,
+             "input_tokens": 10, "output_tokens": 5, "steps": []}
+    return {"test_set": test_set, "case_index": index, "input": f"{test_set} #{index}",
+            "metrics": [{"name": "Faithfulness", "score": score, "reason": "ok"}], "trace": trace}
+
+def shard_report(index, details, status="completed", cache_stats=None, failed_cases=None):
+    """Build the partial report one shard uploads."""
+    return {"status": status, "task_id": f"shard-{index}", "run_id": f"run-{index}", "shard": {"index": index, "count": 2},
+            "cache_stats": cache_stats or {}, "failed_cases": failed_cases or [], "detailed_results": details}
+
+@pytest.fixture
+def results_bucket():
+    """Moto-backed results bucket."""
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="results")
+        yield s3
+
+def put_report(s3, task_id, report):
+    s3.put_object(Bucket="results", Key=f"reports/eval-report-{task_id}.json", Body=json.dumps(report))
+
+def get_report(s3, key):
+    return json.loads(s3.get_object(Bucket="results", Key=key)["Body"].read())
+
+@pytest.mark.unit
+class TestMergeShardReports:
+    """Test suite for merge_shard_reports."""
+
+    def test_restores_dataset_order_and_recomputes_averages(self, results_bucket):
+        """Test strided shard rows are put back in test-set and row order, and averages count every case."""
+        put_report(results_bucket, "shard-0", shard_report(0, [detail("rag.jsonl", 0, 1.0), detail("rag.jsonl", 2, 1.0),
+                                                             detail("edge.jsonl", 0, 0.0)]))
+        put_report(results_bucket, "shard-1", shard_report(1, [detail("rag.jsonl", 1, 0.5, total_ms=900.0)]))
+
+        merged_id = run_evaluation.merge_shard_reports("results", TASKS)
+
+        report = get_report(results_bucket, f"reports/eval-report-{merged_id}.json")
+        assert [(d["test_set"], d["case_index"]) for d in report["detailed_results"]] == [
+            ("rag.jsonl", 0), ("rag.jsonl", 1), ("rag.jsonl", 2), ("edge.jsonl", 0)]
+        assert report["summary_metrics"] == {"Faithfulness": 2.5 / 4}
+        assert report["status"] == "completed"
+        assert [s["cases"] for s in report["shards"]] == [3, 1]
+        assert report["trace_summary"]["slowest_cases"][0]["input"] == "rag.jsonl #1"
+        assert get_report(results_bucket, "results/latest_eval_report.json") == report
+
+    def test_merges_failures_and_cache_stats(self, results_bucket):
+        """Test failed cases are concatenated, cache counters summed and a failed shard fails the run."""
+        failure = {"test_set": "rag.jsonl", "case_index": 1, "stage": "agent", "reason": "error"}
+        put_report(results_bucket, "shard-0", shard_report(0, [detail("rag.jsonl", 0, 1.0)],
+                                                           cache_stats={"judge": {"hits": 3, "misses": 1, "entries": 10}}))
+        put_report(results_bucket, "shard-1", shard_report(1, [], status="failed", failed_cases=[failure],
+                                                           cache_stats={"judge": {"hits": 1, "misses": 3, "entries": 12, "refresh": True}}))
+
+        report = get_report(results_bucket, f"reports/eval-report-{run_evaluation.merge_shard_reports('results', TASKS)}.json")
+
+        assert report["status"] == "failed"
+        assert report["failed_cases"] == [failure]
+        assert report["cache_stats"] == {"judge": {"hits": 4, "misses": 4, "hit_rate": 0.5, "entries": 12, "refresh": True}}
+
+    def test_missing_shard_report_exits(self, results_bucket):
+        """Test a shard that uploaded no report fails the merge instead of publishing a partial report."""
+        put_report(results_bucket, "shard-0", shard_report(0, [detail("rag.jsonl", 0, 1.0)]))
+
+        with pytest.raises(SystemExit):
+            run_evaluation.merge_shard_reports("results", TASKS)
+
+        assert "Contents" not in results_bucket.list_objects_v2(Bucket="results", Prefix="results/")
+
+@pytest.mark.unit
+class TestStopTasks:
+    """Test suite for stopping shards of a failed sharded run."""
+
+    def test_stop_tasks_ignores_already_stopped_tasks(self):
+        """Test every task gets a stop request even if one of them fails."""
+        ecs = MagicMock()
+        ecs.stop_task.side_effect = [Exception("Task already stopped"), {}]
+
+        with patch.object(run_evaluation.boto3, "client", return_value=ecs):
+            run_evaluation.stop_tasks("cluster", TASKS, "Sharded evaluation failed")
+
+        assert [c.kwargs["task"] for c in ecs.stop_task.call_args_list] == TASKS
+
+    def test_shard_start_failure_stops_started_shards(self):
+        """Test shards already running are stopped when a later shard cannot be started."""
+        with patch.object(run_evaluation, "get_task_container", return_value=("evaluator", {})), \
+             patch.object(run_evaluation, "run_fargate_task", side_effect=[TASKS[0], SystemExit(1)]), \
+             patch.object(run_evaluation, "stop_tasks") as stop_tasks:
+            with pytest.raises(SystemExit):
+                run_evaluation.run_sharded_tasks("cluster", "task-def", ["subnet"], ["sg"], None, 3)
+
+        stop_tasks.assert_called_once()
+        assert stop_tasks.call_args.args[:2] == ("cluster", [TASKS[0]])
+
+    def test_failed_shard_stops_the_others(self):
+        """Test a failing shard stops every shard task and skips the merge."""
+        argv = ["run_evaluation.py", "--cluster", "cluster", "--task-def", "task-def", "--subnets", "subnet",
+                "--security-groups", "sg", "--shards", "2", "--results-bucket", "results"]
+        with patch.object(run_evaluation.sys, "argv", argv), \
+             patch.object(run_evaluation, "run_sharded_tasks", return_value=TASKS), \
+             patch.object(run_evaluation, "wait_for_task_completion", side_effect=SystemExit(1)), \
+             patch.object(run_evaluation, "stop_tasks") as stop_tasks, \
+             patch.object(run_evaluation, "merge_shard_reports") as merge:
+            with pytest.raises(SystemExit):
+                run_evaluation.main()
+
+        stop_tasks.assert_called_once_with("cluster", TASKS, "Sharded evaluation failed")
+        merge.assert_not_called()
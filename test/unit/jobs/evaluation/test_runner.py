@@ -0,0 +1,236 @@
+"""
+Tests for the evaluation runner, run fully offline: golden sets come from an in-memory S3 stand-in,
+the agent is faked and the judge answers through LiteLLM's fake backend (JUDGE_MOCK_RESPONSE).
+"""
+import pytest
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+from pathlib import Path
+
+EVALUATOR_PATH = Path(__file__).parent.parent.parent.parent.parent / "src" / "jobs" / "evaluation" / "deepeval_evaluator"
+sys.path.insert(0, str(EVALUATOR_PATH))
+
+# Keep DeepEval and LiteLLM offline: no telemetry, bundled model cost map
+os.environ.setdefault("DEEPEVAL_TELEMETRY_OPT_OUT", "YES")
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+TEST_SET = "golden_set_adversarial.jsonl"
+VERDICT = json.dumps({"verdicts": [], "score": 10, "reason": "offline", "steps": []})
+
+class FakeS3:
+    """Stand-in for S3Service serving golden sets and collecting uploads in memory."""
+    def __init__(self, objects=None):
+        self.objects = dict(objects or {})
+
+    def download_file(self, bucket, key, local_path):
+        if key not in self.objects:
+            raise FileNotFoundError(key)
+        Path(local_path).write_text(self.objects[key], encoding="utf-8")
+
+    def upload_file(self, local_path, bucket, key):
+        self.objects[key] = Path(local_path).read_text(encoding="utf-8")
+
+    def upload_json(self, bucket, key, data):
+        self.objects[key] = data
+
+    def list_keys(self, bucket, prefix):
+        return sorted(key for key in self.objects if key.startswith(prefix))
+
+def timeline(total_ms):
+    """Minimal agent timeline as produced by services.TraceTimeline."""
+    return {"total_ms": total_ms, "steps": [], "orchestration_steps": 1, "model_invocations": 1,
+            "kb_lookup_ms": 0, "input_tokens": 10, "output_tokens": 5}
+
+class FakeAgent:
+    """Stand-in for AgentClient answering every input with a fixed timeline, optionally after a delay."""
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = []
+
+    def invoke(self, agent_id, agent_alias_id, input_text, session_id):
+        time.sleep(self.delay)
+        self.calls.append(input_text)
+        return f"I cannot help with '{input_text}'.", ["context"], timeline(100 * len(self.calls))
+
+    def resolve_fingerprint(self, agent_id, agent_alias_id):
+        return {"version": "1"}
+
+def golden_set(*inputs):
+    return "\n".join(json.dumps({"input": text, "expected_output": "refusal"}) for text in inputs)
+
+def make_config(**overrides):
+    config = dict(
+        agent_id="AGENT", agent_alias_id="ALIAS", eval_data_bucket="eval-data", eval_data_key="sets/",
+        results_bucket="results", judge_model_id="anthropic.claude-test", region="us-east-1", task_arn="arn:aws:ecs:task/test-task",
+        agent_concurrency=2, agent_rpm=60000, agent_max_rpm=60000, judge_concurrency=4, judge_mock_response=VERDICT,
+        judge_rpm=60000, judge_max_rpm=60000, judge_batch_size=2, test_set_concurrency=0, pipeline_queue_size=4,
+        judge_cache_path=None, cache_max_entries=100, cache_s3_sync=False, agent_cache_path=None, refresh=False,
+        run_id="run-1", resume=False, checkpoint_flush_every=1, shard_index=0, shard_count=1, debug=False,
+        test_sets={TEST_SET: "adversarial"}
+    )
+    config.update(overrides)
+    return SimpleNamespace(**config)
+
+def make_runner(tmp_path, s3, **overrides):
+    """Builds a runner whose S3, agent and checkpoint directory are local."""
+    from runner import DeepEvalRunner
+    from checkpoint import Checkpoint
+
+    config = make_config(**overrides)
+    runner = DeepEvalRunner(config)
+    runner.s3 = s3
+    runner.agent = FakeAgent()
+    runner.checkpoint = Checkpoint(config.run_id, s3, config.results_bucket, local_dir=str(tmp_path / "checkpoints"),
+                                   flush_every=config.checkpoint_flush_every)
+    return runner
+
+@pytest.fixture(autouse=True)
+def isolated_cwd(tmp_path, monkeypatch):
+    """DeepEval writes its run cache to the working directory."""
+    monkeypatch.chdir(tmp_path)
+
+@pytest.mark.unit
+class TestDeepEvalRunner:
+    """Test suite for DeepEvalRunner."""
+
+    def test_offline_run_judges_every_case(self, tmp_path):
+        """Test a full run against the fake judge backend scores every row and uploads the report."""
+        s3 = FakeS3({f"sets/{TEST_SET}": golden_set("Q1", "Q2", "Q3")})
+        runner = make_runner(tmp_path, s3)
+
+        runner.run()
+
+        report = s3.objects["reports/eval-report-test-task.json"]
+        assert report["failed_cases"] == []
+        assert [d["case_index"] for d in report["detailed_results"]] == [0, 1, 2]
+        assert all(d["metrics"][0]["reason"] == "offline" for d in report["detailed_results"])
+        assert report["summary_metrics"] == {"Safety Refusal [GEval]": 1.0}
+        assert report["trace_summary"]["cases"] == 3
+        assert s3.objects["results/latest_eval_report.json"] == report
+
+    def test_mock_judge_never_uses_the_judge_cache(self, tmp_path):
+        """Test canned verdicts are not cached, so they can never be served to a real run."""
+        runner = make_runner(tmp_path, FakeS3(), judge_cache_path=str(tmp_path / "judge.json"))
+
+        assert runner.judge_cache is None
+        assert runner.judge.cache is None
+
+    def test_resume_skips_judged_rows_and_reuses_agent_outputs(self, tmp_path):
+        """Test a resumed run keys rows by index: duplicate inputs are restored or re-run independently."""
+        s3 = FakeS3({f"sets/{TEST_SET}": golden_set("Same", "Other", "Same")})
+        first = make_runner(tmp_path / "first", s3)
+        first.checkpoint.record_agent(TEST_SET, 0, "Same", "answer A", [], timeline(5))
+        first.checkpoint.record_result(TEST_SET, {"case_index": 0, "input": "Same", "trace": None,
+                                                  "metrics": [{"name": "Safety Refusal [GEval]", "score": 0.0, "reason": "checkpointed"}]})
+        first.checkpoint.record_agent(TEST_SET, 2, "Same", "answer C", [], timeline(7))
+
+        resumed = make_runner(tmp_path / "second", s3, resume=True)
+        resumed.run()
+
+        report = s3.objects["reports/eval-report-test-task.json"]
+        details = report["detailed_results"]
+        assert resumed.agent.calls == ["Other"]
+        assert [d["case_index"] for d in details] == [0, 1, 2]
+        assert [d["metrics"][0]["reason"] for d in details] == ["checkpointed", "offline", "offline"]
+        assert details[2]["trace"] == {**timeline(7), "restored": True}
+        assert report["trace_summary"]["restored_cases"] == 1
+        assert report["summary_metrics"] == {"Safety Refusal [GEval]": 2 / 3}
+
+    def test_resume_with_every_row_judged_skips_agent_and_judge(self, tmp_path):
+        """Test a fully checkpointed test set is restored without invoking the agent or the judge."""
+        s3 = FakeS3({f"sets/{TEST_SET}": golden_set("Q1")})
+        first = make_runner(tmp_path / "first", s3)
+        first.checkpoint.record_result(TEST_SET, {"case_index": 0, "input": "Q1", "trace": None,
+                                                  "metrics": [{"name": "Safety Refusal [GEval]", "score": 1.0, "reason": "checkpointed"}]})
+
+        resumed = make_runner(tmp_path / "second", s3, resume=True)
+        with patch.object(resumed, "_evaluate_batch") as evaluate_batch:
+            resumed.run()
+
+        evaluate_batch.assert_not_called()
+        assert resumed.agent.calls == []
+        assert s3.objects["reports/eval-report-test-task.json"]["detailed_results"][0]["metrics"][0]["reason"] == "checkpointed"
+
+    def test_batches_take_whatever_cases_are_ready(self, tmp_path):
+        """Test the judge stage groups queued cases up to JUDGE_BATCH_SIZE and stops at the end marker."""
+        runner = make_runner(tmp_path, FakeS3(), judge_batch_size=2)
+        case_queue = queue.Queue()
+        for item in ["c1", "c2", "c3", None]:
+            case_queue.put(item)
+
+        assert list(runner._iter_batches(case_queue)) == [["c1", "c2"], ["c3"]]
+
+    def test_judge_failure_stops_the_producer(self, tmp_path):
+        """Test a failing judge stage cancels pending agent calls instead of leaving the producer blocked on a full queue."""
+        s3 = FakeS3({f"sets/{TEST_SET}": golden_set(*[f"Q{i}" for i in range(20)])})
+        runner = make_runner(tmp_path, s3, agent_concurrency=1, pipeline_queue_size=1)
+        runner.agent = FakeAgent(delay=0.02)
+
+        with patch.object(runner, "_evaluate_batch", side_effect=RuntimeError("judge down")):
+            with pytest.raises(RuntimeError):
+                runner._run_test_set(TEST_SET, "adversarial")
+
+        assert len(runner.agent.calls) < 20
+        assert not [t for t in threading.enumerate() if t.name == f"agent-{TEST_SET}"]
+
+    def test_put_until_stopped_gives_up_on_a_full_queue(self):
+        """Test queueing returns once the stop event is set, even though the queue never drains."""
+        from runner import DeepEvalRunner
+
+        case_queue = queue.Queue(maxsize=1)
+        case_queue.put("c1")
+        stop = threading.Event()
+        threading.Timer(0.1, stop.set).start()
+
+        DeepEvalRunner._put_until_stopped(case_queue, "c2", stop)
+
+        assert case_queue.get_nowait() == "c1"
+        assert case_queue.empty()
+
+    def test_failed_metrics_are_retried_per_case(self, tmp_path):
+        """Test a case whose batch metrics failed is judged again on its own while the rest of the batch is kept."""
+        from deepeval.test_case import LLMTestCase
+
+        runner = make_runner(tmp_path, FakeS3())
+        cases = [LLMTestCase(name=f"{TEST_SET}#{i}", input=f"Q{i}", actual_output="No.", metadata={"case_index": i}) for i in range(2)]
+        scored = SimpleNamespace(name="Safety Refusal [GEval]", score=1.0, reason="batch", error=None)
+        batch_results = SimpleNamespace(test_results=[
+            SimpleNamespace(name=f"{TEST_SET}#1", input="Q1", metrics_data=[]),
+            SimpleNamespace(name=f"{TEST_SET}#0", input="Q0", metrics_data=[scored])
+        ])
+
+        with patch.object(runner, "_evaluate_batch", return_value=batch_results):
+            judged = runner._run_evaluation(TEST_SET, [cases], "adversarial")
+
+        assert judged == 2
+        reasons = {d["case_index"]: d["metrics"][0]["reason"] for d in runner.detailed_results}
+        assert reasons == {0: "batch", 1: "offline"}
+
+    def test_throttled_case_retry_is_recorded_as_failure(self, tmp_path):
+        """Test a case still throttled after its last individual retry is reported instead of dropped."""
+        from botocore.exceptions import ClientError
+        from deepeval.test_case import LLMTestCase
+        import runner as runner_module
+
+        runner = make_runner(tmp_path, FakeS3())
+        case = LLMTestCase(name=f"{TEST_SET}#3", input="Q3", actual_output="No.", metadata={"case_index": 3})
+        batch_results = SimpleNamespace(test_results=[SimpleNamespace(name=case.name, input="Q3", metrics_data=None)])
+        throttled = ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "Converse")
+
+        with patch.object(runner, "_evaluate_batch", return_value=batch_results), \
+             patch.object(runner_module, "evaluate", side_effect=throttled) as evaluate, \
+             patch("utils.time.sleep"):
+            judged = runner._run_evaluation(TEST_SET, [[case]], "adversarial")
+
+        assert judged == 0
+        assert evaluate.call_count == 5
+        assert runner.failures == [{"test_set": TEST_SET, "case_index": 3, "input": "Q3", "stage": "judge",
+                                    "reason": "retries_exhausted", "error": runner.failures[0]["error"]}]
+        assert runner.detailed_results == []
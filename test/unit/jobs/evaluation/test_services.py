@@ -0,0 +1,141 @@
+"""
+Tests for the evaluation job's agent trace timeline and the per-run trace summary.
+"""
+import pytest
+import sys
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+
+EVALUATOR_PATH = Path(__file__).parent.parent.parent.parent.parent / "src" / "jobs" / "evaluation" / "deepeval_evaluator"
+sys.path.insert(0, str(EVALUATOR_PATH))
+
+def orchestration(trace_id, **parts):
+    """Build an orchestration trace event whose parts all belong to one step."""
+    return {"orchestrationTrace": {kind: {"traceId": trace_id, **part} for kind, part in parts.items()}}
+
+def kb_observation(text, total_ms=None):
+    """Build a knowledge base lookup observation, with Bedrock's latency metadata when given."""
+    output = {"retrievedReferences": [{"content": {"text": text}}]}
+    if total_ms is not None:
+        output["metadata"] = {"totalTimeMs": total_ms}
+    return {"type": "KNOWLEDGE_BASE", "knowledgeBaseLookupOutput": output}
+
+def clock(*seconds):
+    """Patches the timeline clock to return the given perf_counter readings in order."""
+    return patch("services.time.perf_counter", side_effect=list(seconds))
+
+def detail(input_text, total_ms, **trace):
+    """Build a detailed result carrying a minimal timeline."""
+    timeline = {"total_ms": total_ms, "orchestration_steps": 2, "model_invocations": 2, "kb_lookup_ms": 10,
+                "input_tokens": 100, "output_tokens": 20, "steps": [], **trace}
+    return {"test_set": "set.jsonl", "input": input_text, "trace": timeline}
+
+@pytest.mark.unit
+class TestTraceTimeline:
+    """Test suite for TraceTimeline."""
+
+    def test_uses_bedrock_latency_metadata(self):
+        """Test model and KB lookup times come from the trace metadata and steps are grouped by traceId."""
+        from services import TraceTimeline
+
+        with clock(0.0, 0.010, 0.020, 0.200, 0.300, 0.400, 0.500):
+            timeline = TraceTimeline()
+            timeline.on_trace({"preProcessingTrace": {"modelInvocationInput": {"traceId": "pre"}}})
+            timeline.on_trace(orchestration("t1", modelInvocationInput={}))
+            timeline.on_trace(orchestration("t1", modelInvocationOutput={"metadata": {
+                "totalTimeMs": 150, "usage": {"inputTokens": 300, "outputTokens": 40}}}))
+            timeline.on_trace(orchestration("t1", observation=kb_observation("ctx", total_ms=80)))
+            timeline.on_chunk()
+            summary = timeline.summary()
+
+        assert summary["total_ms"] == 500.0
+        assert summary["first_chunk_ms"] == 400.0
+        assert summary["orchestration_steps"] == 1
+        assert summary["model_invocations"] == 1
+        assert (summary["kb_lookups"], summary["kb_lookup_ms"]) == (1, 80.0)
+        assert (summary["input_tokens"], summary["output_tokens"]) == (300, 40)
+        assert [s["trace_id"] for s in summary["steps"]] == ["pre", "t1"]
+        assert summary["steps"][1] == {"trace_id": "t1", "phase": "orchestrationTrace", "start_ms": 20.0, "duration_ms": 280.0,
+                                       "model_ms": 150, "kb_lookup_ms": 80, "input_tokens": 300, "output_tokens": 40,
+                                       "observation": "KNOWLEDGE_BASE"}
+
+    def test_falls_back_to_event_arrival_times(self):
+        """Test latencies are measured between events when Bedrock sends no timing metadata."""
+        from services import TraceTimeline
+
+        with clock(0.0, 0.100, 0.350, 0.400, 0.460, 0.500):
+            timeline = TraceTimeline()
+            timeline.on_trace(orchestration("t1", modelInvocationInput={}))
+            timeline.on_trace(orchestration("t1", modelInvocationOutput={}))
+            timeline.on_trace(orchestration("t1", invocationInput={}))
+            timeline.on_trace(orchestration("t1", observation=kb_observation("ctx")))
+            summary = timeline.summary()
+
+        step = summary["steps"][0]
+        assert step["model_ms"] == 250.0
+        assert step["kb_lookup_ms"] == 60.0
+        assert summary["first_chunk_ms"] is None
+
+    def test_ignores_events_without_a_step(self):
+        """Test trace events outside the known phases or without a traceId are skipped."""
+        from services import TraceTimeline
+
+        timeline = TraceTimeline()
+        timeline.on_trace({"guardrailTrace": {"traceId": "g1"}})
+        timeline.on_trace({"orchestrationTrace": {"rationale": {"text": "no trace id"}}})
+
+        assert timeline.summary()["steps"] == []
+
+    def test_agent_client_returns_answer_contexts_and_timeline(self):
+        """Test invoke concatenates chunks, collects retrieved contexts and attaches the timeline."""
+        from services import AgentClient
+
+        client = AgentClient("us-east-1")
+        client.bedrock_agent_runtime = MagicMock()
+        client.bedrock_agent_runtime.invoke_agent.return_value = {"completion": [
+            {"trace": {"trace": orchestration("t1", observation=kb_observation("Course starts in May", total_ms=30))}},
+            {"chunk": {"bytes": "It starts ".encode("utf-8")}},
+            {"chunk": {"bytes": "in May.".encode("utf-8")}}
+        ]}
+
+        answer, contexts, timeline = client.invoke("AGENT", "ALIAS", "When does it start?", "session-1")
+
+        assert answer == "It starts in May."
+        assert contexts == ["Course starts in May"]
+        assert timeline["kb_lookups"] == 1
+        assert timeline["first_chunk_ms"] is not None
+        assert client.bedrock_agent_runtime.invoke_agent.call_args.kwargs["enableTrace"] is True
+
+@pytest.mark.unit
+class TestSummarizeTraces:
+    """Test suite for summarize_traces."""
+
+    def test_no_traces(self):
+        """Test results without timelines produce an empty summary."""
+        from services import summarize_traces
+
+        assert summarize_traces([{"input": "Q1", "trace": None}]) == {}
+
+    def test_aggregates_latency_tokens_and_slowest_cases(self):
+        """Test percentiles, averages, token totals and the slowest step of the slowest cases."""
+        from services import summarize_traces
+
+        slow_step = {"trace_id": "t2", "duration_ms": 900.0}
+        results = [
+            detail("Q1", 100.0),
+            detail("Q2", 1000.0, steps=[{"trace_id": "t1", "duration_ms": 50.0}, slow_step]),
+            detail("Q3", 300.0, cached=True),
+            detail("Q4", 200.0, restored=True),
+            {"input": "Q5", "trace": None}
+        ]
+
+        summary = summarize_traces(results)
+
+        assert summary["cases"] == 4
+        assert (summary["cached_cases"], summary["restored_cases"]) == (1, 1)
+        assert summary["total_ms"] == {"avg": 400.0, "p50": 300.0, "p95": 1000.0, "max": 1000.0}
+        assert summary["total_input_tokens"] == 400
+        assert summary["avg_output_tokens"] == 20.0
+        assert [c["input"] for c in summary["slowest_cases"]] == ["Q2", "Q3", "Q4", "Q1"]
+        assert summary["slowest_cases"][0]["slowest_step"] == slow_step
+        assert summary["slowest_cases"][1]["slowest_step"] is None
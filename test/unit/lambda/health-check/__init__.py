@@ -0,0 +1 @@
+# Health check unit tests package
@@ -0,0 +1,94 @@
+"""
+Core tests for the health-check Lambda function.
+Covers shallow and deep modes, check timeouts and result caching.
+"""
+import pytest
+import importlib.util
+import json
+import os
+import threading
+import time
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+
+LAMBDA_PATH = Path(__file__).parent.parent.parent.parent.parent / "src" / "lambda" / "health-check"
+
+# Set environment variables before importing the handler
+os.environ["LEADS_TABLE_NAME"] = "test-leads"
+os.environ["KB_BUCKET_NAME"] = "test-kb-bucket"
+os.environ["AGENT_ID"] = "TESTAGENT1"
+os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+
+# Every Lambda ships an index.py, so load this one under its own module name
+_spec = importlib.util.spec_from_file_location("health_check_index", LAMBDA_PATH / "index.py")
+health = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(health)
+
+@pytest.fixture(autouse=True)
+def reset_cache():
+    """Start every test without a cached deep result."""
+    with patch.object(health, "_cached_checks", None):
+        yield
+
+def probe(mode=None):
+    """Invoke the handler and return (status code, parsed body)."""
+    event = {"queryStringParameters": {"mode": mode}} if mode else {}
+    response = health.handler(event, MagicMock())
+    return response["statusCode"], json.loads(response["body"])
+
+@pytest.mark.unit
+class TestHealthCheckLambda:
+
+    def test_shallow_mode_checks_config_only(self):
+        """Test shallow probes only verify configuration and never call a dependency."""
+        with patch.object(health, "DEEP_CHECKS", {"bedrock": MagicMock(side_effect=AssertionError)}):
+            status, body = probe("shallow")
+        
+        assert status == 200
+        assert body["checks"] == {"config": True}
+
+    def test_healthy_deep_result_is_cached(self):
+        """Test a healthy deep result is reused within HEALTH_CACHE_TTL."""
+        check = MagicMock(return_value=True)
+        
+        with patch.object(health, "DEEP_CHECKS", {"dynamodb": check}):
+            first = probe()
+            second = probe()
+        
+        assert first == (200, {"status": "healthy", "mode": "deep", "cached": False, "checks": {"dynamodb": True}})
+        assert second[1]["cached"] is True
+        check.assert_called_once()
+
+    def test_failures_are_not_cached(self):
+        """Test an unhealthy result is re-checked on the next probe so recovery shows up at once."""
+        check = MagicMock(side_effect=[False, True])
+        
+        with patch.object(health, "DEEP_CHECKS", {"s3": check}):
+            first = probe()
+            second = probe()
+        
+        assert first[0] == 503
+        assert second == (200, {"status": "healthy", "mode": "deep", "cached": False, "checks": {"s3": True}})
+
+    def test_timed_out_checks_do_not_delay_next_probe(self):
+        """Test checks still running after a timeout do not hold up the checks of the following probe."""
+        release = threading.Event()
+        stuck = {name: (lambda: release.wait(5)) for name in ("dynamodb", "s3", "bedrock")}
+        fast = {name: (lambda: True) for name in ("dynamodb", "s3", "bedrock")}
+        
+        try:
+            with patch.object(health, "HEALTH_CHECK_TIMEOUT", 0.2):
+                with patch.object(health, "DEEP_CHECKS", stuck):
+                    status, body = probe()
+                assert status == 503
+                assert not any(body["checks"].values())
+                
+                with patch.object(health, "DEEP_CHECKS", fast):
+                    started = time.monotonic()
+                    status, body = probe()
+                    assert time.monotonic() - started < 0.2
+        finally:
+            release.set()
+        
+        assert status == 200
+        assert all(body["checks"].values())
@@ -0,0 +1 @@
+# KB sync unit tests package
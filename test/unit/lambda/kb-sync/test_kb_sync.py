@@ -0,0 +1,128 @@
+"""
+Core tests for the kb-sync Lambda function.
+Covers coalescing of queued S3 changes, deferral while an ingestion runs, and direct triggers.
+"""
+import pytest
+import importlib.util
+import json
+import os
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+from botocore.exceptions import ClientError
+
+LAMBDA_PATH = Path(__file__).parent.parent.parent.parent.parent / "src" / "lambda" / "kb-sync"
+
+# Set environment variables before importing the handler
+os.environ["KNOWLEDGE_BASE_ID"] = "TESTKB1"
+os.environ["DATA_SOURCE_ID"] = "TESTDS1"
+os.environ["SYNC_QUEUE_URL"] = "https://sqs.us-east-1.amazonaws.com/000000000000/sync-queue"
+os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+
+# Every Lambda ships an index.py, so load this one under its own module name
+_spec = importlib.util.spec_from_file_location("kb_sync_index", LAMBDA_PATH / "index.py")
+kb_sync = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(kb_sync)
+
+def s3_message(message_id, *keys):
+    """Build an SQS record carrying an S3 notification for the given object keys."""
+    body = {"Records": [{"eventName": "ObjectCreated:Put", "s3": {"object": {"key": k}}} for k in keys]}
+    return {"messageId": message_id, "eventSource": "aws:sqs", "body": json.dumps(body)}
+
+def probe_event_message(message_id):
+    """Build the s3:TestEvent message S3 sends when the notification is configured."""
+    body = {"Service": "Amazon S3", "Event": "s3:TestEvent", "Bucket": "kb-bucket"}
+    return {"messageId": message_id, "eventSource": "aws:sqs", "body": json.dumps(body)}
+
+@pytest.fixture
+def bedrock():
+    """Bedrock agent client with no ingestion job running."""
+    client = MagicMock()
+    client.list_ingestion_jobs.return_value = {"ingestionJobSummaries": []}
+    client.start_ingestion_job.return_value = {"ingestionJob": {"ingestionJobId": "job-1"}}
+    with patch.object(kb_sync, "bedrock_agent_client", client):
+        yield client
+
+@pytest.fixture
+def sqs():
+    """SQS client used to re-queue deferred changes."""
+    client = MagicMock()
+    with patch.object(kb_sync, "sqs_client", client):
+        yield client
+
+@pytest.mark.unit
+class TestKbSyncLambda:
+
+    def test_batch_starts_one_job(self, bedrock, sqs):
+        """Test a batch of queued S3 changes is coalesced into a single ingestion job."""
+        event = {"Records": [s3_message("m1", "a.pdf", "b.pdf"), s3_message("m2", "c.pdf")]}
+        
+        response = kb_sync.handler(event, MagicMock())
+        
+        assert response == {"batchItemFailures": []}
+        bedrock.start_ingestion_job.assert_called_once()
+        assert "3 S3 changes" in bedrock.start_ingestion_job.call_args.kwargs["description"]
+        sqs.send_message.assert_not_called()
+
+    def test_test_events_start_nothing(self, bedrock, sqs):
+        """Test a batch holding only s3:TestEvent messages is consumed without starting a job."""
+        response = kb_sync.handler({"Records": [probe_event_message("m1")]}, MagicMock())
+        
+        assert response == {"batchItemFailures": []}
+        bedrock.list_ingestion_jobs.assert_not_called()
+        bedrock.start_ingestion_job.assert_not_called()
+
+    def test_running_job_defers_as_one_summary(self, bedrock, sqs):
+        """Test changes arriving during an ingestion are re-queued as one delayed summary, not failed back to SQS."""
+        bedrock.list_ingestion_jobs.return_value = {
+            "ingestionJobSummaries": [{"ingestionJobId": "job-0", "status": "IN_PROGRESS"}]
+        }
+        event = {"Records": [s3_message("m1", "a.pdf"), s3_message("m2", "b.pdf"), probe_event_message("m3")]}
+        
+        response = kb_sync.handler(event, MagicMock())
+        
+        assert response == {"batchItemFailures": []}
+        bedrock.start_ingestion_job.assert_not_called()
+        sqs.send_message.assert_called_once()
+        kwargs = sqs.send_message.call_args.kwargs
+        assert json.loads(kwargs["MessageBody"]) == {"deferredChanges": 2}
+        assert kwargs["DelaySeconds"] == kb_sync.SYNC_DEFER_SECONDS
+
+    def test_deferred_summary_counts_towards_next_job(self, bedrock, sqs):
+        """Test a returning summary message is counted together with newer changes."""
+        summary = {"messageId": "m1", "eventSource": "aws:sqs", "body": json.dumps({"deferredChanges": 4})}
+        
+        kb_sync.handler({"Records": [summary, s3_message("m2", "d.pdf")]}, MagicMock())
+        
+        assert "5 S3 changes" in bedrock.start_ingestion_job.call_args.kwargs["description"]
+
+    def test_conflict_on_start_defers(self, bedrock, sqs):
+        """Test losing a start race to another consumer defers the batch instead of failing it."""
+        bedrock.start_ingestion_job.side_effect = ClientError(
+            {"Error": {"Code": "ConflictException", "Message": "Job in progress"}}, "StartIngestionJob"
+        )
+        
+        response = kb_sync.handler({"Records": [s3_message("m1", "a.pdf")]}, MagicMock())
+        
+        assert response == {"batchItemFailures": []}
+        sqs.send_message.assert_called_once()
+
+    def test_unexpected_error_propagates(self, bedrock, sqs):
+        """Test other failures raise so SQS redelivers the batch (and eventually dead-letters it)."""
+        bedrock.start_ingestion_job.side_effect = ClientError(
+            {"Error": {"Code": "AccessDeniedException", "Message": "Denied"}}, "StartIngestionJob"
+        )
+        
+        with pytest.raises(ClientError):
+            kb_sync.handler({"Records": [s3_message("m1", "a.pdf")]}, MagicMock())
+        sqs.send_message.assert_not_called()
+
+    def test_direct_s3_event_starts_job(self, bedrock):
+        """Test a direct S3 notification (no queue) starts a job immediately and reports conflicts as 409."""
+        event = {"Records": [{"eventSource": "aws:s3", "s3": {"object": {"key": "a.pdf"}}}]}
+        
+        assert kb_sync.handler(event, MagicMock())["statusCode"] == 200
+        
+        bedrock.start_ingestion_job.side_effect = ClientError(
+            {"Error": {"Code": "ConflictException", "Message": "Job in progress"}}, "StartIngestionJob"
+        )
+        assert kb_sync.handler(event, MagicMock())["statusCode"] == 409
@@ -0,0 +1 @@
+# Lead collector unit tests package
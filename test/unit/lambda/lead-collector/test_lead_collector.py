@@ -0,0 +1,129 @@
+"""
+Core tests for the lead-collector Lambda function.
+Covers deterministic lead IDs, duplicate handling of the conditional put, and the queued flush path.
+"""
+import pytest
+import importlib.util
+import json
+import os
+import boto3
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+from moto import mock_aws
+
+LAMBDA_PATH = Path(__file__).parent.parent.parent.parent.parent / "src" / "lambda" / "lead-collector"
+
+# Set environment variables before importing the handler
+os.environ["LEADS_TABLE_NAME"] = "test-leads"
+os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+os.environ["STAGE"] = "test"
+
+# Every Lambda ships an index.py, so load this one under its own module name
+_spec = importlib.util.spec_from_file_location("lead_collector_index", LAMBDA_PATH / "index.py")
+lead_collector = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(lead_collector)
+
+def agent_event(email, session_id="session-1"):
+    """Build a Bedrock agent action group event carrying a lead."""
+    return {
+        "actionGroup": "LeadCollection",
+        "apiPath": "/leads",
+        "httpMethod": "POST",
+        "sessionId": session_id,
+        "requestBody": {"content": {"application/json": {"properties": [
+            {"name": "email", "value": email},
+            {"name": "reason", "value": "Course inquiry"}
+        ]}}}
+    }
+
+def lead_message(message_id, email, session_id="session-1"):
+    """Build an SQS record carrying a queued lead item."""
+    item = lead_collector.build_lead_item(lead_collector.LeadRequest(email=email), session_id)
+    return {"messageId": message_id, "eventSource": "aws:sqs", "body": json.dumps(item)}
+
+def response_body(response):
+    """Decode the JSON body of an action group response."""
+    return json.loads(response["response"]["responseBody"]["application/json"]["body"])
+
+@pytest.fixture
+def leads_table():
+    """Moto-backed leads table swapped in for the module-level DynamoDB handles."""
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        table = dynamodb.create_table(
+            TableName="test-leads",
+            KeySchema=[{"AttributeName": "lead_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "lead_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST"
+        )
+        with patch.object(lead_collector, "dynamodb", dynamodb), \
+             patch.object(lead_collector, "table", table):
+            yield table
+
+@pytest.mark.unit
+class TestLeadCollectorLambda:
+
+    def test_lead_id_is_deterministic(self):
+        """Test retries of the same tool call map to the same UUIDv5, regardless of email case."""
+        first = lead_collector.make_lead_id("session-1", "Ana@Example.com")
+
+        assert first == lead_collector.make_lead_id("session-1", " ana@example.com ")
+        assert first != lead_collector.make_lead_id("session-2", "ana@example.com")
+        assert first != lead_collector.make_lead_id("session-1", "otro@example.com")
+
+    def test_duplicate_lead_is_not_overwritten(self, leads_table):
+        """Test a retried tool call hits the conditional put and keeps the original item."""
+        first = lead_collector.handler(agent_event("ana@example.com"), MagicMock())
+        stored = leads_table.scan()["Items"]
+        retry = lead_collector.handler(agent_event("ANA@example.com"), MagicMock())
+
+        assert first["response"]["httpStatusCode"] == 200
+        assert retry["response"]["httpStatusCode"] == 200
+        assert response_body(retry)["success"] is True
+        assert leads_table.scan()["Items"] == stored
+
+    def test_save_lead_reports_duplicates(self, leads_table):
+        """Test save_lead returns False instead of raising when the lead already exists."""
+        item = lead_collector.build_lead_item(lead_collector.LeadRequest(email="ana@example.com"), "session-1")
+
+        assert lead_collector.save_lead(item) is True
+        assert lead_collector.save_lead({**item, "reason": "Retry"}) is False
+        assert leads_table.get_item(Key={"lead_id": item["lead_id"]})["Item"]["reason"] == "User inquiry"
+
+    def test_flush_writes_each_lead_once(self, leads_table):
+        """Test queued leads duplicated in the batch or already stored are written only once."""
+        lead_collector.save_lead(json.loads(lead_message("m0", "old@example.com")["body"]))
+        event = {"Records": [
+            lead_message("m1", "ana@example.com"),
+            lead_message("m2", "ana@example.com"),
+            lead_message("m3", "old@example.com"),
+            lead_message("m4", "luis@example.com")
+        ]}
+
+        response = lead_collector.flush_handler(event, MagicMock())
+
+        assert response == {"batchItemFailures": []}
+        emails = sorted(item["email"] for item in leads_table.scan()["Items"])
+        assert emails == ["ana@example.com", "luis@example.com", "old@example.com"]
+
+    def test_flush_reports_invalid_messages(self, leads_table):
+        """Test a malformed message is reported as a batch item failure while the rest are written."""
+        event = {"Records": [
+            lead_message("m1", "ana@example.com"),
+            {"messageId": "m2", "eventSource": "aws:sqs", "body": "not json"},
+            {"messageId": "m3", "eventSource": "aws:sqs", "body": json.dumps({"email": "x@example.com"})}
+        ]}
+
+        response = lead_collector.flush_handler(event, MagicMock())
+
+        assert response == {"batchItemFailures": [{"itemIdentifier": "m2"}, {"itemIdentifier": "m3"}]}
+        assert [item["email"] for item in leads_table.scan()["Items"]] == ["ana@example.com"]
+
+    def test_flush_write_failure_redelivers_batch(self, leads_table):
+        """Test a failed batch write reports every valid message for redelivery."""
+        event = {"Records": [lead_message("m1", "ana@example.com"), lead_message("m2", "luis@example.com")]}
+
+        with patch.object(lead_collector, "write_leads", side_effect=Exception("Throttled")):
+            response = lead_collector.flush_handler(event, MagicMock())
+
+        assert response == {"batchItemFailures": [{"itemIdentifier": "m1"}, {"itemIdentifier": "m2"}]}